@@ -1,2 +1,12 @@
 # flake8: noqa
 from .casperlabs_client import *
+from .aio import AsyncCasperLabsClient
+from .dag_store import DagStore
+from .deploy_tracker import DeployTracker, DeployInclusion
+from .multi_node import MultiNodeCasperLabsClient
+from .metrics import ClientMetrics, CallStats
+from .profiling import Profiler
+from .benchmark import Benchmark, RoundStats
+from .signing import SigningPool
+from .verify import Verifier, Mismatch
+from .contract_registry import ContractRegistry, contract_address
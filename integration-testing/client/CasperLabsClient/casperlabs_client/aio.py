@@ -0,0 +1,306 @@
+"""
+CasperLabs Client API library for asyncio, built on top of grpc.aio.
+"""
+import functools
+import importlib
+
+from .casperlabs_client import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_INTERNAL_PORT,
+    STATE_QUERY_KEY_VARIANT,
+    ChannelManager,
+    ChannelPool,
+    InternalError,
+    KeyRing,
+    _LazyModule,
+    _block_view,
+    _deploy_view,
+    _balances,
+    _make_deploy,
+    _state_query,
+    casper,
+    casper_grpc,
+    control,
+    control_grpc,
+)
+
+asyncio = _LazyModule("asyncio")
+aio = _LazyModule("grpc.aio")
+
+
+def async_api(function):
+    """
+    Decorator of coroutine API functions, the asyncio counterpart of api.
+    It will catch all exceptions and throw InternalError.
+
+    :param function: coroutine function to be decorated
+    :return:
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await function(*args, **kwargs)
+        except (SyntaxError, TypeError, InternalError):
+            raise
+        except aio.AioRpcError as e:
+            raise InternalError(str(e.code()), e.details())
+        except Exception as e:
+            raise InternalError(details=str(e)) from e
+
+    return wrapper
+
+
+def async_stream_api(function):
+    """
+    Decorator of async generator API functions, see async_api.
+
+    :param function: async generator function to be decorated
+    :return:
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        try:
+            async for item in function(*args, **kwargs):
+                yield item
+        except (SyntaxError, TypeError, InternalError):
+            raise
+        except aio.AioRpcError as e:
+            raise InternalError(str(e.code()), e.details())
+        except Exception as e:
+            raise InternalError(details=str(e)) from e
+
+    return wrapper
+
+
+class AsyncChannelPool(ChannelPool):
+    """
+    Pool of grpc.aio channels. Must be created while an event loop is running.
+    """
+
+    def _new_channel(self):
+        if self.credentials:
+            return aio.secure_channel(
+                self.address, self.credentials, options=self.options
+            )
+        return aio.insecure_channel(self.address, options=self.options)
+
+    def connect(self, timeout: float = None):
+        # Start connecting in the background, grpc.aio channels cannot be
+        # waited for synchronously.
+        for channel in self.channels:
+            channel.get_state(try_to_connect=True)
+
+    async def close(self):
+        for channel in self._channels or ():
+            await channel.close()
+        self._stubs.clear()
+
+
+class AsyncChannelManager(ChannelManager):
+    pool_class = AsyncChannelPool
+
+    async def close(self):
+        with self._lock:
+            pools, self.pools = list(self.pools.values()), {}
+        for pool in pools:
+            await pool.close()
+
+
+class AsyncCasperLabsClient:
+    """
+    gRPC CasperLabs client for asyncio.
+
+    It has the same API as CasperLabsClient, but methods are coroutines
+    and streaming methods (showBlocks, showDeploys) are async generators.
+    All calls of a client are multiplexed over the same channels,
+    so many of them can be in flight concurrently without using threads:
+
+        async with AsyncCasperLabsClient(host) as client:
+            blocks = await asyncio.gather(*(client.showBlock(h) for h in hashes))
+    """
+
+    STATE_QUERY_KEY_VARIANT = STATE_QUERY_KEY_VARIANT
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        internal_port: int = DEFAULT_INTERNAL_PORT,
+        node_id: str = None,
+        certificate_file: str = None,
+        pool_size: int = 1,
+    ):
+        """
+        AsyncCasperLabsClient's constructor, see CasperLabsClient.
+
+        Channels are opened on the first call, in the event loop running it.
+        """
+        try:
+            importlib.import_module("grpc.aio")
+        except ImportError:
+            raise ImportError(
+                "AsyncCasperLabsClient requires grpcio 1.32 or newer,"
+                " install casperlabs-client[aio]"
+            )
+        self.host = host
+        self.port = port
+        self.internal_port = internal_port
+        self.node_id = node_id
+        self.certificate_file = certificate_file
+        self.channel_manager = AsyncChannelManager(pool_size)
+        self.key_ring = KeyRing()
+
+    @property
+    def casperService(self):
+        return self.channel_manager.pool(
+            self.host, self.port, self.node_id, self.certificate_file
+        ).stub(casper_grpc.CasperServiceStub)
+
+    @property
+    def controlService(self):
+        return self.channel_manager.pool(
+            self.host, self.internal_port, self.node_id, self.certificate_file
+        ).stub(control_grpc.ControlServiceStub)
+
+    async def close(self):
+        """
+        Close all gRPC channels of the client.
+        """
+        await self.channel_manager.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @async_api
+    async def deploy(self, *args, **kwargs):
+        """
+        Deploy a smart contract, see CasperLabsClient.deploy for description
+        of the parameters.
+
+        Reading of contract and key files and signing happen in the default
+        executor of the event loop, so they don't block other coroutines.
+
+        :return:              Tuple: (deserialized DeployServiceResponse object, deploy_hash)
+        """
+        loop = asyncio.get_event_loop()
+        d = await loop.run_in_executor(
+            None,
+            functools.partial(_make_deploy, *args, key_ring=self.key_ring, **kwargs),
+        )
+        response = await self.casperService.Deploy(casper.DeployRequest(deploy=d))
+        return response, d.deploy_hash
+
+    @async_stream_api
+    async def showBlocks(self, depth: int = 1, max_rank=0, full_view=True):
+        """
+        Get slices of the DAG, going backwards, rank by rank.
+
+        :param depth:     How many of the top ranks of the DAG to show.
+        :param max_rank:  Maximum rank to go back from.
+                          0 means go from the current tip of the DAG.
+        :param full_view: Full view if True, otherwise basic.
+        :return:          Async generator of block info objects.
+        """
+        async for block_info in self.casperService.StreamBlockInfos(
+            casper.StreamBlockInfosRequest(
+                depth=depth, max_rank=max_rank, view=_block_view(full_view)
+            )
+        ):
+            yield block_info
+
+    @async_api
+    async def showBlock(self, block_hash_base16: str, full_view=True):
+        """
+        Returns object describing a block known by Casper on an existing running node.
+
+        :param block_hash_base16: hash of the block to be retrieved
+        :param full_view:         full view if True, otherwise basic
+        :return:                  object representing the retrieved block
+        """
+        return await self.casperService.GetBlockInfo(
+            casper.GetBlockInfoRequest(
+                block_hash_base16=block_hash_base16, view=_block_view(full_view)
+            )
+        )
+
+    @async_api
+    async def propose(self):
+        """
+        Propose a block using deploys in the pool.
+
+        :return:    response object with block_hash
+        """
+        return await self.controlService.Propose(control.ProposeRequest())
+
+    @async_api
+    async def queryState(self, blockHash: str, key: str, path: str, keyType: str):
+        """
+        Query a value in the global state, see CasperLabsClient.queryState.
+        """
+        return await self.casperService.GetBlockState(
+            casper.GetBlockStateRequest(
+                block_hash_base16=blockHash, query=_state_query(key, path, keyType)
+            )
+        )
+
+    @async_api
+    async def queryStates(self, block_hash: str, queries: list):
+        """
+        Query many values in the global state in one request,
+        see CasperLabsClient.queryStates.
+        """
+        if not queries:
+            return []
+        response = await self.casperService.BatchGetBlockState(
+            casper.BatchGetBlockStateRequest(
+                block_hash_base16=block_hash,
+                queries=[_state_query(*q) for q in queries],
+            )
+        )
+        return list(response.values)
+
+    @async_api
+    async def balance(self, address: str, block_hash: str):
+        return (await self.balances([address], block_hash))[address]
+
+    @async_api
+    async def balances(self, addresses: list, block_hash: str):
+        """
+        Get balances of many accounts, see CasperLabsClient.balances.
+        """
+        protocol = _balances(addresses)
+        try:
+            queries = next(protocol)
+            while True:
+                queries = protocol.send(await self.queryStates(block_hash, queries))
+        except StopIteration as e:
+            return e.value
+
+    @async_api
+    async def showDeploy(self, deploy_hash_base16: str, full_view=True):
+        """
+        Retrieve information about a single deploy by hash.
+        """
+        return await self.casperService.GetDeployInfo(
+            casper.GetDeployInfoRequest(
+                deploy_hash_base16=deploy_hash_base16, view=_deploy_view(full_view)
+            )
+        )
+
+    @async_stream_api
+    async def showDeploys(self, block_hash_base16: str, full_view=True):
+        """
+        Get the processed deploys within a block.
+        """
+        async for deploy_info in self.casperService.StreamBlockDeploys(
+            casper.StreamBlockDeploysRequest(
+                block_hash_base16=block_hash_base16, view=_deploy_view(full_view)
+            )
+        ):
+            yield deploy_info
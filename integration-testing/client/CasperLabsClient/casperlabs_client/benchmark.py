@@ -0,0 +1,314 @@
+"""
+Transfer throughput benchmark, a port of the Scala client's Benchmarks.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+from .casperlabs_client import (
+    ABI,
+    DeployTemplate,
+    InternalError,
+    Signer,
+    _LazyModule,
+    _rpc_error,
+    casper,
+    consensus,
+    ed25519,
+    grpc,
+)
+
+logging = _LazyModule("logging")
+multiprocessing = _LazyModule("multiprocessing")
+
+STATS_HEADER = (
+    "Deploy time, Propose time, Total time, Deploys/sec in propose,"
+    " Deploys/sec, Deploy latency p50, Deploy latency p90, Deploy latency p99\n"
+)
+
+
+def _percentile(values: list, p: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+class RoundStats(
+    namedtuple(
+        "RoundStats",
+        ["round", "block_hash", "deploy_time", "propose_time", "latencies"],
+    )
+):
+    """
+    Times of one round of the benchmark in seconds: sending of the transfers,
+    proposal of the block with them, and latencies of the Deploy requests (sorted).
+    """
+
+    __slots__ = ()
+
+    @property
+    def deploys(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def total_time(self) -> float:
+        return self.deploy_time + self.propose_time
+
+    @property
+    def deploys_per_second(self) -> float:
+        return self.deploys / self.deploy_time if self.deploy_time else 0.0
+
+    @property
+    def proposed_per_second(self) -> float:
+        return self.deploys / self.propose_time if self.propose_time else 0.0
+
+    def percentile(self, p: float) -> float:
+        return _percentile(self.latencies, p)
+
+    def csv(self) -> str:
+        """
+        Line of the stats file, see STATS_HEADER. Times are in milliseconds.
+        """
+        return (
+            f"{1000 * self.deploy_time:.0f}, {1000 * self.propose_time:.0f},"
+            f" {1000 * self.total_time:.0f}, {self.proposed_per_second:1.2f},"
+            f" {self.deploys_per_second:1.2f}, {1000 * self.percentile(50):1.2f},"
+            f" {1000 * self.percentile(90):1.2f}, {1000 * self.percentile(99):1.2f}\n"
+        )
+
+    def __str__(self):
+        return (
+            f"Round {self.round}: {self.deploys} deploys in {1000 * self.deploy_time:.0f} ms"
+            f" ({self.deploys_per_second:1.2f} deploys/sec),"
+            f" propose {1000 * self.propose_time:.0f} ms"
+            f" ({self.proposed_per_second:1.2f} deploys/sec),"
+            f" latency p50 {1000 * self.percentile(50):1.2f} ms"
+            f" p90 {1000 * self.percentile(90):1.2f} ms"
+            f" p99 {1000 * self.percentile(99):1.2f} ms"
+        )
+
+
+# Template, session args and signers of transfers made in a worker process.
+_worker = None
+
+
+def _init_worker(session, payment, payment_args, recipient: bytes, amount: int):
+    global _worker
+    template = DeployTemplate(
+        session=session, payment=payment, payment_args=payment_args
+    )
+    session_args = ABI.args([ABI.account(recipient), ABI.long_value(amount)])
+    _worker = template, session_args, {}
+
+
+def _make_transfers(seeds: list) -> list:
+    """
+    Make and sign transfers from the accounts with the given private keys.
+    Deploys are returned serialized, protobuf objects can't be pickled.
+    """
+    template, session_args, signers = _worker
+    deploys = []
+    for seed in seeds:
+        signer = signers.get(seed)
+        if signer is None:
+            signer = signers[seed] = Signer(seed)
+        d = template.make(session_args=session_args, signer=signer)
+        deploys.append(d.SerializeToString())
+    return deploys
+
+
+def _send(client, deploys, concurrency: int):
+    """
+    Send deploys with at most concurrency requests in flight.
+
+    :return:  Tuple: (latencies of the requests in seconds, errors)
+    """
+    latencies = []
+    errors = []
+    slots = threading.Semaphore(concurrency)
+
+    def done(start, future):
+        latencies.append(time.perf_counter() - start)
+        try:
+            future.result()
+        except grpc.RpcError as e:
+            errors.append(_rpc_error(e))
+        except Exception as e:
+            errors.append(InternalError(details=str(e)))
+        slots.release()
+
+    for d in deploys:
+        slots.acquire()
+        start = time.perf_counter()
+        future = client.casperService.Deploy_future(casper.DeployRequest(deploy=d))
+        future.add_done_callback(lambda f, start=start: done(start, f))
+    for _ in range(concurrency):
+        slots.acquire()
+    return sorted(latencies), errors
+
+
+class Benchmark:
+    """
+    Rounds of token transfers from many accounts to one, like the Scala client's
+    Benchmarks. Accounts are created and funded first, each round every account
+    sends 1 mote to the recipient, then a block is proposed and checked to
+    contain all the transfers without errors.
+
+        benchmark = Benchmark(client, Signer.from_files(private_key, public_key),
+                              session="transfer_to_account.wasm")
+        for stats in benchmark.run("benchmarking_stats.csv.txt"):
+            print(stats)
+
+    Transfers are made and signed in a pool of processes, those of the next round
+    while the current one is running, and sent concurrently.
+    """
+
+    def __init__(
+        self,
+        client,
+        initial_funds_signer: Signer,
+        session: str,
+        payment: str = None,
+        payment_args: bytes = None,
+        accounts_num: int = 250,
+        rounds_num: int = 100,
+        approximate_transfer_cost: int = 10000000,
+        processes: int = None,
+        concurrency: int = 16,
+    ):
+        """
+        :param client:                     CasperLabsClient.
+        :param initial_funds_signer:       Signer of the account that funds the others.
+        :param session:                    Path to the transfer_to_account.wasm contract.
+        :param payment:                    Path to the payment contract, the session
+                                           contract pays for itself if not given.
+        :param payment_args:               ABI encoded args of the payment contract.
+        :param accounts_num:               Number of accounts sending transfers.
+        :param rounds_num:                 Number of rounds.
+        :param approximate_transfer_cost:  Cost of a transfer; accounts are funded
+                                           with enough for rounds_num transfers.
+        :param processes:                  Number of processes making the transfers,
+                                           by default the number of CPUs.
+        :param concurrency:                Maximum number of Deploy requests in flight.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        self.client = client
+        self.initial_funds_signer = initial_funds_signer
+        self.session = session
+        self.payment = payment
+        self.payment_args = payment_args
+        self.accounts_num = accounts_num
+        self.rounds_num = rounds_num
+        self.initial_funds_per_account = rounds_num * (approximate_transfer_cost + 1)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.concurrency = concurrency
+        self.senders = [
+            ed25519.create_keypair()[0].to_seed() for _ in range(accounts_num)
+        ]
+        self.recipient = ed25519.create_keypair()[1].to_bytes()
+
+    def _check_success(self, block_hash: bytes, expected_deploys: int):
+        block_info = self.client.showBlock(block_hash.hex(), full_view=False)
+        deploy_count = block_info.summary.header.deploy_count
+        if deploy_count != expected_deploys:
+            raise InternalError(
+                "benchmark",
+                f"Proposed block {block_hash.hex()} contains {deploy_count}"
+                f" deploys instead of {expected_deploys}",
+            )
+        deploy_error_count = block_info.status.stats.deploy_error_count
+        if deploy_error_count:
+            raise InternalError(
+                "benchmark",
+                f"Proposed block {block_hash.hex()} contains {deploy_error_count}"
+                " failed deploys",
+            )
+
+    def initialize_accounts(self):
+        """
+        Fund the recipient and the senders from the initial funds account,
+        one block per account.
+        """
+        template = DeployTemplate(
+            session=self.session, payment=self.payment, payment_args=self.payment_args
+        )
+        public_keys = [self.recipient] + [Signer(s).public_key for s in self.senders]
+        for public_key in public_keys:
+            session_args = ABI.args(
+                [
+                    ABI.account(public_key),
+                    ABI.long_value(self.initial_funds_per_account),
+                ]
+            )
+            d = template.make(
+                session_args=session_args, signer=self.initial_funds_signer
+            )
+            self.client.send_deploy(d)
+            block_hash = self.client.propose().block_hash
+            self._check_success(block_hash, 1)
+
+    def _chunks(self) -> list:
+        size = max(math.ceil(len(self.senders) / (4 * self.processes)), 1)
+        return [self.senders[i : i + size] for i in range(0, len(self.senders), size)]
+
+    def _round(self, round_number: int, deploys: list) -> RoundStats:
+        start = time.perf_counter()
+        latencies, errors = _send(self.client, deploys, self.concurrency)
+        deploy_time = time.perf_counter() - start
+        if errors:
+            raise InternalError(
+                "benchmark",
+                f"{len(errors)} of {len(deploys)} deploys failed, e.g.: {errors[0]}",
+            )
+        start = time.perf_counter()
+        block_hash = self.client.propose().block_hash
+        propose_time = time.perf_counter() - start
+        self._check_success(block_hash, len(deploys))
+        return RoundStats(
+            round_number, block_hash, deploy_time, propose_time, latencies
+        )
+
+    def run(self, output_stats: str = None):
+        """
+        Initialize the accounts and run the rounds.
+
+        :param output_stats:  Path to the CSV file with times of the rounds,
+                              it is overwritten.
+        :return:              Generator of RoundStats of each round.
+        """
+        stats_file = output_stats and open(output_stats, "w")
+        try:
+            if stats_file:
+                stats_file.write(STATS_HEADER)
+                stats_file.flush()
+            logging.info("Initializing accounts...")
+            self.initialize_accounts()
+            with multiprocessing.get_context("spawn").Pool(
+                self.processes,
+                _init_worker,
+                (self.session, self.payment, self.payment_args, self.recipient, 1),
+            ) as pool:
+                chunks = self._chunks()
+                transfers = pool.map_async(_make_transfers, chunks)
+                for round_number in range(1, self.rounds_num + 1):
+                    deploys = [
+                        consensus.Deploy.FromString(d)
+                        for chunk in transfers.get()
+                        for d in chunk
+                    ]
+                    if round_number < self.rounds_num:
+                        transfers = pool.map_async(_make_transfers, chunks)
+                    stats = self._round(round_number, deploys)
+                    if stats_file:
+                        stats_file.write(stats.csv())
+                        stats_file.flush()
+                    logging.info(str(stats))
+                    yield stats
+        finally:
+            if stats_file:
+                stats_file.close()
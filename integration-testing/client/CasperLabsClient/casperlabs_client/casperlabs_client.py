@@ -2,61 +2,74 @@
 """
 CasperLabs Client API library and command line tool.
 """
-
-# Hack to fix the relative imports problems #
 import sys
-from pathlib import Path
-
-file = Path(__file__).resolve()
-parent, root = file.parent, file.parents[1]
-sys.path.append(str(root))
-
-# end of hack #
 import time
 import argparse
-import grpc
-from grpc._channel import _Rendezvous
-import ssl
 import functools
-from pyblake2 import blake2b
-import ed25519
+import importlib
+import os
+import itertools
+import math
+import threading
+import queue
+import random
+from collections import OrderedDict, deque, namedtuple
+from contextlib import ExitStack, contextmanager
 import base64
 import struct
 import json
-from operator import add
-from functools import reduce
-from itertools import dropwhile
-import logging
 
-# Monkey patching of google.protobuf.text_encoding.CEscape
-# to get keys and signatures in hex when printed
-import google.protobuf.text_format
+from .graphz import GraphzGenerator
+from .metrics import ClientMetrics
+from .profiling import Profiler, phase, timed, timed_future
 
-CEscape = google.protobuf.text_format.text_encoding.CEscape
 
+class _LazyModule:
+    """
+    Module imported on first access to any of its attributes.
 
-def _hex(text, as_utf8):
-    try:
-        return (len(text) in (32, 64)) and text.hex() or CEscape(text, as_utf8)
-    except TypeError:
-        return CEscape(text, as_utf8)
+    Importing grpc, the generated protobuf modules and the crypto libraries
+    takes much longer than anything else the command line tool does in
+    commands like --help, or users of ABI need. Modules behind these proxies
+    are imported only by code that uses them.
+    """
+
+    def __init__(self, name: str, package: str = None):
+        self._name = name
+        self._package = package
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name, self._package)
+        # Cache attributes, so that only the first access to each goes here.
+        value = getattr(module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
 
 
-google.protobuf.text_format.text_encoding.CEscape = _hex
+logging = _LazyModule("logging")
+grpc = _LazyModule("grpc")
+pyblake2 = _LazyModule("pyblake2")
+ed25519 = _LazyModule("ed25519")
 
 # ~/CasperLabs/protobuf/io/casperlabs/node/api/control.proto
-from .control_pb2_grpc import ControlServiceStub
-from . import control_pb2 as control
+control = _LazyModule(".control_pb2", __package__)
+control_grpc = _LazyModule(".control_pb2_grpc", __package__)
 
 # ~/CasperLabs/protobuf/io/casperlabs/node/api/casper.proto
-from . import casper_pb2 as casper
-from .casper_pb2_grpc import CasperServiceStub
+casper = _LazyModule(".casper_pb2", __package__)
+casper_grpc = _LazyModule(".casper_pb2_grpc", __package__)
 
 # ~/CasperLabs/protobuf/io/casperlabs/casper/consensus/consensus.proto
-from . import consensus_pb2 as consensus
+consensus = _LazyModule(".consensus_pb2", __package__)
 
 # ~/CasperLabs/protobuf/io/casperlabs/casper/consensus/info.proto
-from . import info_pb2 as info
+info = _LazyModule(".info_pb2", __package__)
+
+# ~/CasperLabs/protobuf/io/casperlabs/casper/consensus/state.proto
+state = _LazyModule(".state_pb2", __package__)
 
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 40401
@@ -92,6 +105,9 @@ class ABI:
 
       This method has been developed to support passing deploy arguments
       on command line.
+
+    Many lists of arguments of the same types are encoded faster with a schema,
+    see ABI.schema.
     """
 
     INTEGER_TYPES = ("u32", "u64", "u512", "int_value", "long_value", "big_int")
@@ -120,15 +136,10 @@ class ABI:
 
     @staticmethod
     def u512(n: int) -> bytes:
-        bs = list(
-            dropwhile(
-                lambda b: b == 0,
-                reversed(n.to_bytes(64, byteorder="little", signed=False)),
-            )
-        )
-        return len(bs).to_bytes(1, byteorder="little", signed=False) + bytes(
-            reversed(bs)
-        )
+        size = (n.bit_length() + 7) // 8
+        if size > 64:
+            raise OverflowError("u512 must be less than 2**512")
+        return bytes([size]) + n.to_bytes(size, byteorder="little", signed=False)
 
     @staticmethod
     def byte_array(a: bytes) -> bytes:
@@ -161,7 +172,24 @@ class ABI:
 
     @staticmethod
     def args(l: list) -> bytes:
-        return ABI.u32(len(l)) + reduce(add, map(ABI.byte_array, l))
+        return ABI.u32(len(l)) + b"".join(map(ABI.byte_array, l))
+
+    @staticmethod
+    def schema(types: list):
+        """
+        Compile a layout of deploy args to an encoder, for example:
+
+            transfer = ABI.schema(["account", "u64"])
+            args = transfer.encode(account, amount)
+            args_list = transfer.encode_many(accounts, amounts)
+
+        The result is the same as ABI.args([ABI.account(account), ABI.u64(amount)]),
+        but much faster for many lists of args.
+
+        :param types:  List of names of the args' types, see ABI.ALL_TYPES
+        :return:       ABISchema object
+        """
+        return ABISchema(types)
 
     @staticmethod
     def args_from_json(s: str) -> bytes:
@@ -178,32 +206,126 @@ class ABI:
             ]
 
         """
-        args = json.loads(s)
+        with phase("encode args"):
+            return ABI.args([_encode_json_arg(arg) for arg in json.loads(s)])
+
+
+class ABISchema:
+    """
+    Encoder of deploy args of given types, made with ABI.schema.
+
+    If all the types have fixed size (u32, u64, int_value, long_value, account)
+    all the args, their sizes and their count are packed with a single struct
+    format, for many lists of args at once. Otherwise args are encoded one by one.
+    """
+
+    FIXED_SIZE_FORMATS = {
+        "u32": "I",
+        "int_value": "I",
+        "u64": "Q",
+        "long_value": "Q",
+        "account": "I32s",
+    }
+
+    def __init__(self, types: list):
+        for t in types:
+            if t not in ABI.ALL_TYPES:
+                raise ValueError(f"Unknown type {t}, expected one of {ABI.ALL_TYPES}")
+        self.types = tuple(types)
+        self.encoders = [getattr(ABI, t) for t in types]
+        self.fixed_size = all(t in self.FIXED_SIZE_FORMATS for t in types)
+        if not self.fixed_size:
+            return
+
+        # Template of values packed with the format: count of args, then
+        # size of each arg followed by the arg; account is itself a byte array,
+        # so its size is followed by a second one, 32.
+        self.format = "I"
+        self.template = [len(types)]
+        self.positions = []
+        for t in types:
+            f = self.FIXED_SIZE_FORMATS[t]
+            self.format += "I" + f
+            self.template.append(struct.calcsize("<" + f))
+            if t == "account":
+                self.template.append(32)
+            self.positions.append(len(self.template))
+            self.template.append(None)
+        self.size = struct.calcsize("<" + self.format)
+        self.accounts = [p for t, p in zip(types, self.positions) if t == "account"]
+
+    def encode(self, *values) -> bytes:
+        """
+        Encode one list of args.
+        """
+        return self.encode_many(*([v] for v in values))[0]
+
+    def encode_many(self, *columns) -> list:
+        """
+        Encode many lists of args given column by column,
+        e.g. encode_many(accounts, amounts).
+
+        :return: List of encoded args
+        """
+        if len(columns) != len(self.types):
+            raise ValueError(f"Expected {len(self.types)} columns of args")
+        if not self.fixed_size:
+            return [
+                ABI.args([encode(v) for encode, v in zip(self.encoders, row)])
+                for row in zip(*columns)
+            ]
+
+        n = len(columns[0])
+        k = len(self.template)
+        values = self.template * n
+        for position, column in zip(self.positions, columns):
+            if len(column) != n:
+                raise ValueError("Columns of args must have the same length")
+            values[position::k] = column
+        for position in self.accounts:
+            if set(map(len, values[position::k])) - {32}:
+                raise Exception("Account must be 32 bytes long")
+
+        data = struct.pack("<" + self.format * n, *values)
+        size = self.size
+        return [data[i : i + size] for i in range(0, n * size, size)]
 
-        def python_value(typ, value):
-            if typ in ("big_int",):
-                try:
-                    # new style proto3 JSON
-                    return int(value["value"])
-                except TypeError:
-                    # compatibility mode
-                    return int(value)
-            if typ in ABI.INTEGER_TYPES:
-                return int(value)
-            elif typ in ABI.BYTE_ARRAY_TYPES:
-                return bytearray.fromhex(value)
-            elif typ in ABI.OPTIONAL_TYPES:
-                if not value:
-                    return None
-                return encode({"value": value})
-            raise ValueError(f"Unknown type {typ}, expected one of {ABI.ALL_TYPES}")
 
-        def encode(arg) -> bytes:
-            typ, value = list(arg["value"].items())[0]
-            v = python_value(typ, value)
-            return getattr(ABI, typ)(v)
+def _encode_big_int(value) -> bytes:
+    try:
+        # new style proto3 JSON
+        return ABI.u512(int(value["value"]))
+    except TypeError:
+        # compatibility mode
+        return ABI.u512(int(value))
+
+
+def _encode_json_optional(typ):
+    def encode(value):
+        return getattr(ABI, typ)(value and _encode_json_arg({"value": value}) or None)
+
+    return encode
 
-        return ABI.args([encode(arg) for arg in args])
+
+# Encoders of values of deploy args in JSON format, by type, see ABI.args_from_json.
+_JSON_ARG_ENCODERS = dict(
+    [(t, lambda v, e=getattr(ABI, t): e(int(v))) for t in ABI.INTEGER_TYPES]
+    + [
+        (t, lambda v, e=getattr(ABI, t): e(bytes.fromhex(v)))
+        for t in ABI.BYTE_ARRAY_TYPES
+    ]
+    + [(t, _encode_json_optional(t)) for t in ABI.OPTIONAL_TYPES]
+    + [("big_int", _encode_big_int)]
+)
+
+
+def _encode_json_arg(arg) -> bytes:
+    typ, value = next(iter(arg["value"].items()))
+    try:
+        encode = _JSON_ARG_ENCODERS[typ]
+    except KeyError:
+        raise ValueError(f"Unknown type {typ}, expected one of {ABI.ALL_TYPES}")
+    return encode(value)
 
 
 def read_pem_key(file_name: str):
@@ -246,7 +368,7 @@ def api(function):
             return function(*args, **kwargs)
         except (SyntaxError, TypeError, InternalError):
             raise
-        except _Rendezvous as e:
+        except grpc.RpcError as e:
             raise InternalError(str(e.code()), e.details())
         except Exception as e:
             raise InternalError(details=str(e)) from e
@@ -255,13 +377,14 @@ def api(function):
 
 
 def _hash(data: bytes) -> bytes:
-    h = blake2b(digest_size=32)
-    h.update(data)
-    return h.digest()
+    with phase("hash"):
+        h = pyblake2.blake2b(digest_size=32)
+        h.update(data)
+        return h.digest()
 
 
 def _read_binary(file_name: str):
-    with open(file_name, "rb") as f:
+    with phase("read wasm"), open(file_name, "rb") as f:
         return f.read()
 
 
@@ -281,70 +404,1067 @@ def _encode_contract(contract_options, contract_args):
     raise Exception("One of wasm, hash, name or uref is required")
 
 
-def _sign(private_key, data: bytes):
-    return private_key and consensus.Signature(
-        sig_algorithm="ed25519",
-        sig=ed25519.SigningKey(read_pem_key(private_key)).sign(data),
-    )
+class Signer:
+    """
+    Ed25519 key pair of an account, ready to sign deploys.
+
+    Reading and decoding of key files and expansion of the private key happen
+    once, when the signer is created, so it is much cheaper to make many deploys
+    with one signer than with paths to the key files.
+    """
+
+    def __init__(self, private_key: bytes, public_key: bytes = None):
+        """
+        :param private_key:  32 bytes seed of the Ed25519 private key
+        :param public_key:   32 bytes public key of the account, derived
+                             from private_key if not given
+        """
+        self.signing_key = ed25519.SigningKey(private_key)
+        self.public_key = public_key or self.signing_key.get_verifying_key().to_bytes()
+
+    @classmethod
+    def from_files(cls, private_key_file, public_key_file=None):
+        return cls(
+            read_pem_key(private_key_file),
+            public_key_file and read_pem_key(public_key_file),
+        )
+
+    def sign(self, data: bytes):
+        with phase("sign"):
+            return consensus.Signature(
+                sig_algorithm="ed25519", sig=self.signing_key.sign(data)
+            )
+
+
+class KeyRing:
+    """
+    Cache of signers and public keys loaded from PEM files, keyed by file paths.
+    It is safe to use from many threads.
+    """
+
+    def __init__(self):
+        self._signers = {}
+        self._public_keys = {}
+        self._lock = threading.Lock()
+
+    def signer(self, private_key_file, public_key_file=None) -> Signer:
+        key = (str(private_key_file), public_key_file and str(public_key_file))
+        with self._lock:
+            signer = self._signers.get(key)
+        if signer is None:
+            with phase("read keys"):
+                signer = Signer.from_files(private_key_file, public_key_file)
+            with self._lock:
+                signer = self._signers.setdefault(key, signer)
+        return signer
+
+    def public_key(self, public_key_file) -> bytes:
+        key = str(public_key_file)
+        with self._lock:
+            public_key = self._public_keys.get(key)
+        if public_key is None:
+            with phase("read keys"):
+                public_key = read_pem_key(public_key_file)
+            with self._lock:
+                public_key = self._public_keys.setdefault(key, public_key)
+        return public_key
+
+    def load_directory(self, directory) -> dict:
+        """
+        Load all private keys (files with names matching *private*.pem) found
+        in a directory, together with their public keys, if there are files
+        with the same names with "private" replaced by "public".
+
+        :param directory:  Path to the directory, e.g. integration-testing/resources/accounts
+        :return:           Dictionary of signers keyed by base16 encoded public keys
+        """
+        from pathlib import Path
+
+        signers = {}
+        for private_key_file in sorted(Path(directory).glob("*private*.pem")):
+            public_key_file = private_key_file.with_name(
+                private_key_file.name.replace("private", "public")
+            )
+            signer = self.signer(
+                private_key_file, public_key_file.exists() and public_key_file or None
+            )
+            signers[signer.public_key.hex()] = signer
+        return signers
 
 
 def _serialize(o) -> bytes:
-    return o.SerializeToString()
+    with phase("serialize"):
+        return o.SerializeToString()
 
 
-class InsecureGRPCService:
-    def __init__(self, host, port, serviceStub):
-        self.address = f"{host}:{port}"
-        self.serviceStub = serviceStub
+_last_timestamp = 0
+_timestamp_lock = threading.Lock()
+
+
+def _timestamp() -> int:
+    """
+    Current time in milliseconds, like in deploys made by the Scala client.
+    Timestamps are strictly increasing within the process, so that deploys
+    with the same body made in quick succession still get different hashes.
+    """
+    global _last_timestamp
+    with _timestamp_lock:
+        _last_timestamp = max(int(time.time() * 1000), _last_timestamp + 1)
+        return _last_timestamp
+
+
+def _make_deploy(
+    from_addr: bytes = None,
+    gas_price: int = 10,
+    payment: str = None,
+    session: str = None,
+    public_key: str = None,
+    private_key: str = None,
+    session_args: bytes = None,
+    payment_args: bytes = None,
+    payment_hash: bytes = None,
+    payment_name: str = None,
+    payment_uref: bytes = None,
+    session_hash: bytes = None,
+    session_name: str = None,
+    session_uref: bytes = None,
+    signer: Signer = None,
+    key_ring: KeyRing = None,
+):
+    """
+    Build a deploy and sign it, if signer or private_key is given.
+    See CasperLabsClient.deploy for description of the parameters.
+    Key files are read with key_ring, if given.
+
+    :return: consensus.Deploy object
+    """
+    session_options, payment_options = _contract_options(
+        (session, session_hash, session_name, session_uref),
+        (payment, payment_hash, payment_name, payment_uref),
+    )
+
+    # session_args must go to payment as well for now cause otherwise we'll get GASLIMIT error,
+    # if payment is same as session:
+    # https://github.com/CasperLabs/CasperLabs/blob/dev/casper/src/main/scala/io/casperlabs/casper/util/ProtoUtil.scala#L463
+    body = consensus.Deploy.Body(
+        session=_encode_contract(session_options, session_args),
+        payment=_encode_contract(
+            payment_options,
+            payment_options == session_options and session_args or payment_args,
+        ),
+    )
+    return _finish_deploy(
+        body,
+        _hash(_serialize(body)),
+        from_addr,
+        gas_price,
+        public_key,
+        private_key,
+        signer,
+        key_ring,
+    )
+
+
+def _contract_options(session_options: tuple, payment_options: tuple):
+    """
+    Check that exactly one of (file, hash, name, uref) of both session
+    and payment contracts is given, fall back to session if there's no payment.
+
+    :return: Tuple: (session_options, payment_options)
+    """
+    # Compatibility mode, should be removed when payment is obligatory
+    if len(list(filter(None, payment_options))) == 0:
+        logging.info("No payment contract provided, using session as payment")
+        payment_options = session_options
+
+    if len(list(filter(None, session_options))) != 1:
+        raise TypeError(
+            "deploy: only one of session, session_hash, session_name, session_uref must be provided"
+        )
+
+    if len(list(filter(None, payment_options))) != 1:
+        raise TypeError(
+            "deploy: only one of payment, payment_hash, payment_name, payment_uref must be provided"
+        )
+    return session_options, payment_options
+
+
+def _finish_deploy(
+    body,
+    body_hash: bytes,
+    from_addr: bytes,
+    gas_price: int,
+    public_key: str,
+    private_key: str,
+    signer: Signer,
+    key_ring: KeyRing,
+):
+    """
+    Make header of a deploy with the given body and sign it.
+    Body can be given serialized, which saves copying it.
+    """
+    if from_addr and len(from_addr) != 32:
+        raise Exception(f"from_addr must be 32 bytes")
+
+    key_ring = key_ring or KeyRing()
+    if signer is None and private_key:
+        signer = key_ring.signer(private_key, public_key)
+    # Without a signer the deploy is left without approvals, so that it can
+    # be signed later with sign_deploy, public_key only sets the account.
+    approval_public_key = signer and signer.public_key
+    account_public_key = (
+        from_addr
+        or approval_public_key
+        or public_key
+        and key_ring.public_key(public_key)
+    )
+
+    header = consensus.Deploy.Header(
+        account_public_key=account_public_key,
+        timestamp=_timestamp(),
+        gas_price=gas_price,
+        body_hash=body_hash,
+    )
+
+    deploy_hash = _hash(_serialize(header))
+    approvals = (
+        []
+        if not approval_public_key
+        else [
+            consensus.Approval(
+                approver_public_key=approval_public_key,
+                signature=signer.sign(deploy_hash),
+            )
+        ]
+    )
+    d = consensus.Deploy(deploy_hash=deploy_hash, approvals=approvals, header=header)
+    if isinstance(body, bytes):
+        d.body.MergeFromString(body)
+    else:
+        d.body.CopyFrom(body)
+    return d
+
+
+def _varint(n: int) -> bytes:
+    """
+    Protobuf base 128 varint encoding of a non-negative integer.
+    """
+    b = bytearray()
+    while n > 0x7F:
+        b.append(n & 0x7F | 0x80)
+        n >>= 7
+    b.append(n)
+    return bytes(b)
+
+
+class _TemplateCode:
+    """
+    Serialized deploy code with placeholder for abi_args.
+
+    Fields of a message are serialized in the order of their numbers,
+    so code serialized with abi_args (field 2) is the wasm (field 1)
+    followed by the args and by hash, name or uref (fields 3-5).
+    """
+
+    def __init__(self, code):
+        head, tail = consensus.Deploy.Code(), consensus.Deploy.Code()
+        tail.CopyFrom(code)
+        tail.ClearField("abi_args")
+        if code.WhichOneof("contract") == "wasm":
+            head.wasm = code.wasm
+            tail.ClearField("contract")
+        self.head = _serialize(head)
+        self.tail = _serialize(tail)
+
+    def serialize(self, abi_args: bytes) -> bytes:
+        args = abi_args and _serialize(consensus.Deploy.Code(abi_args=abi_args))
+        return self.head + (args or b"") + self.tail
+
+
+class DeployTemplate:
+    """
+    Session and payment code of deploys, loaded and serialized once.
+
+    Deploys made from a template differ only in their args, account, gas price
+    and timestamp. Wasm files are not read again and body of the deploys is put
+    together from pre-serialized parts. Session code comes first in the serialized
+    body, so hashing of the session wasm is done once too: state of the hash after
+    the session wasm is cached and copied for every deploy.
+    """
+
+    # Body fields' tags: (field number << 3) | length delimited wire type
+    SESSION_TAG = b"\x0a"
+    PAYMENT_TAG = b"\x12"
+
+    def __init__(
+        self,
+        session: str = None,
+        payment: str = None,
+        session_hash: bytes = None,
+        session_name: str = None,
+        session_uref: bytes = None,
+        payment_hash: bytes = None,
+        payment_name: str = None,
+        payment_uref: bytes = None,
+        gas_price: int = 10,
+        session_args: bytes = None,
+        payment_args: bytes = None,
+    ):
+        """
+        See CasperLabsClient.deploy for description of the parameters.
+        gas_price, session_args and payment_args are defaults of the deploys
+        made with the template.
+        """
+        session_options, payment_options = _contract_options(
+            (session, session_hash, session_name, session_uref),
+            (payment, payment_hash, payment_name, payment_uref),
+        )
+        self.gas_price = gas_price
+        self.session_args = session_args
+        self.payment_args = payment_args
+        self.payment_is_session = payment_options == session_options
+        self.session = _TemplateCode(_encode_contract(session_options, None))
+        self.payment = (
+            self.session
+            if self.payment_is_session
+            else _TemplateCode(_encode_contract(payment_options, None))
+        )
+        self.key_ring = KeyRing()
+        self._prefix_hashes = {}
+        self._lock = threading.Lock()
+
+    def _body_hash(self, session_code: bytes, payment: bytes) -> bytes:
+        size = len(session_code)
+        with self._lock:
+            h = self._prefix_hashes.get(size)
+        if h is None:
+            h = pyblake2.blake2b(digest_size=32)
+            h.update(self.SESSION_TAG + _varint(size) + self.session.head)
+            with self._lock:
+                self._prefix_hashes[size] = h
+        h = h.copy()
+        h.update(session_code[len(self.session.head) :])
+        h.update(payment)
+        return h.digest()
+
+    def make(
+        self,
+        from_addr: bytes = None,
+        session_args: bytes = None,
+        payment_args: bytes = None,
+        gas_price: int = None,
+        public_key: str = None,
+        private_key: str = None,
+        signer: Signer = None,
+    ):
+        """
+        Make a deploy and sign it, if signer or private_key is given.
+        Parameters that are not given default to the template's ones,
+        see CasperLabsClient.deploy for their description.
+
+        :return: consensus.Deploy object
+        """
+        session_args = session_args or self.session_args
+        payment_args = payment_args or self.payment_args
+        if self.payment_is_session:
+            # See _make_deploy.
+            payment_args = session_args or payment_args
+        session_code = self.session.serialize(session_args)
+        payment_code = self.payment.serialize(payment_args)
+        payment = self.PAYMENT_TAG + _varint(len(payment_code)) + payment_code
+        body_bytes = (
+            self.SESSION_TAG + _varint(len(session_code)) + session_code + payment
+        )
+        return _finish_deploy(
+            body_bytes,
+            self._body_hash(session_code, payment),
+            from_addr,
+            gas_price or self.gas_price,
+            public_key,
+            private_key,
+            signer,
+            self.key_ring,
+        )
+
+
+def make_deploy(*args, **kwargs):
+    """
+    Make a deploy, see CasperLabsClient.deploy for description of the parameters.
+    It is signed if signer or private_key is given, otherwise it can be signed
+    later with sign_deploy.
+
+    :return: consensus.Deploy object
+    """
+    return _make_deploy(*args, **kwargs)
+
+
+def sign_deploy(deploy, signer: Signer):
+    """
+    Sign a deploy, the signature is appended to its existing approvals.
+
+    :param deploy:  consensus.Deploy object
+    :param signer:  Signer of the approval
+    :return:        the deploy
+    """
+    deploy.approvals.add(
+        approver_public_key=signer.public_key, signature=signer.sign(deploy.deploy_hash)
+    )
+    return deploy
+
+
+def _write_delimited(message, f):
+    """
+    Write message to a binary file, serialized and preceded by its size
+    encoded as varint, like Java protobuf's writeDelimitedTo does.
+    """
+    data = _serialize(message)
+    f.write(_varint(len(data)))
+    f.write(data)
+
+
+def write_deploys(deploys, f):
+    """
+    Write deploys to a binary file, each one length delimited (see _write_delimited).
+    Such files can be concatenated.
+
+    :param deploys:  Iterable of consensus.Deploy objects
+    :param f:        Binary file object
+    :return:         Number of deploys written
+    """
+    count = 0
+    for deploy in deploys:
+        _write_delimited(deploy, f)
+        count += 1
+    return count
+
+
+def _read_varint(f):
+    n, shift = 0, 0
+    while True:
+        b = f.read(1)
+        if not b:
+            if shift:
+                raise Exception("Unexpected end of file")
+            return None
+        n |= (b[0] & 0x7F) << shift
+        if b[0] < 0x80:
+            return n
+        shift += 7
+
+
+def _read_delimited(f, message_class):
+    """
+    Read messages written with _write_delimited from a binary file.
+    """
+    while True:
+        size = _read_varint(f)
+        if size is None:
+            return
+        data = f.read(size)
+        if len(data) != size:
+            raise Exception("Unexpected end of file")
+        yield message_class.FromString(data)
+
+
+def read_deploys(f):
+    """
+    Read deploys from a binary file written by write_deploys.
+
+    :param f:  Binary file object
+    :return:   Generator of consensus.Deploy objects
+    """
+    return _read_delimited(f, consensus.Deploy)
+
+
+def _block_view(full_view: bool):
+    return full_view and info.BlockInfo.View.FULL or info.BlockInfo.View.BASIC
+
+
+def _deploy_view(full_view: bool):
+    return full_view and info.DeployInfo.View.FULL or info.DeployInfo.View.BASIC
+
+
+# Note, there is also casper.StateQuery.KeyVariant.KEY_VARIANT_UNSPECIFIED,
+# but it doesn't seem to have an official string representation
+# ("key_variant_unspecified"? "unspecified"?) and is not used by the client.
+# Values of casper.StateQuery.KeyVariant, literal so that the protobuf
+# modules don't have to be imported at load time.
+STATE_QUERY_KEY_VARIANT = {"hash": 1, "uref": 2, "address": 3, "local": 4}
+
+
+def _state_query(key: str, path: str, keyType: str):
+    variant = STATE_QUERY_KEY_VARIANT.get(keyType.lower(), None)
+    if variant is None:
+        raise InternalError(
+            "query-state", f"{keyType} is not a known query-state key type"
+        )
+    q = casper.StateQuery(key_variant=variant, key_base16=key)
+    q.path_segments.extend(name for name in path.split("/") if name)
+    return q
+
+
+def _mint_public_uref(value, address: str):
+    """
+    Return the known uref of the Mint contract from the account value.
+    """
+    if not value.HasField("account"):
+        raise InternalError("balance", f"Expected Account type value under {address}.")
+
+    urefs = [u for u in value.account.known_urefs if u.name == "mint"]
+    if len(urefs) == 0:
+        raise InternalError(
+            "balance",
+            "Account's known_urefs map did not contain Mint contract address.",
+        )
+    return urefs[0]
 
-    def __getattr__(self, name):
-        def f(*args):
-            with grpc.insecure_channel(self.address) as channel:
-                return getattr(self.serviceStub(channel), name)(*args)
-
-        def g(*args):
-            with grpc.insecure_channel(self.address) as channel:
-                yield from getattr(self.serviceStub(channel), name[: -len("_stream")])(
-                    *args
-                )
 
-        return name.endswith("_stream") and g or f
+def _purse_balance_local_key(mintPrivate, account) -> str:
+    """
+    Return the 'local' key, under which Mint keeps uref of the balance of account's purse.
+    """
+    mintPrivateHex = mintPrivate.key.uref.uref.hex()
+    purseAddrHex = ABI.byte_array(account.purse_id.uref).hex()
+    return f"{mintPrivateHex}:{purseAddrHex}"
+
+
+def _balances(addresses: list):
+    """
+    Generator resolving balances of accounts in 4 batches of state queries,
+    independently of the number of accounts.
+
+    It yields lists of (key, path, keyType) queries and expects lists of
+    corresponding values to be sent back, see _run_batches.
+    Returns dictionary mapping addresses to balances.
+    """
+    addresses = list(dict.fromkeys(addresses))
+    values = yield [(address, "", "address") for address in addresses]
+    mintPublic = {
+        address: _mint_public_uref(value, address).key.uref.uref.hex()
+        for address, value in zip(addresses, values)
+    }
+
+    # All accounts share the same Mint, normally.
+    mintUrefs = list(dict.fromkeys(mintPublic.values()))
+    mintPrivate = dict(zip(mintUrefs, (yield [(u, "", "uref") for u in mintUrefs])))
+
+    balanceURefs = yield [
+        (
+            _purse_balance_local_key(mintPrivate[mintPublic[address]], value.account),
+            "",
+            "local",
+        )
+        for address, value in zip(addresses, values)
+    ]
+    balances = yield [(v.key.uref.uref.hex(), "", "uref") for v in balanceURefs]
+    return {
+        address: int(balance.big_int.value)
+        for address, balance in zip(addresses, balances)
+    }
+
+
+def _run_batches(protocol, run_batch):
+    """
+    Drive generator protocol like _balances, passing every batch of queries it yields
+    to function run_batch and sending the results back.
+    """
+    try:
+        batch = next(protocol)
+        while True:
+            batch = protocol.send(run_batch(batch))
+    except StopIteration as e:
+        return e.value
+
+
+def _is_full_hash(hash_base16: str) -> bool:
+    return len(hash_base16) == 64
+
+
+class ResponseCache:
+    """
+    LRU cache of responses to requests whose results never change,
+    like queries of the global state as of a given block.
+
+    Responses are kept serialized, so users cannot modify cached objects
+    and memory use can be bounded precisely. The least recently used
+    entries are evicted when the total size of cached responses exceeds
+    max_size bytes. Entries can also expire ttl seconds after being cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return list of serialized responses cached under key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                responses, size, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return responses
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, responses: list):
+        size = sum(map(len, responses))
+        if size > self.max_size:
+            return
+        expires = self.ttl and time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (responses, size, expires)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self._entries),
+                size=self.size,
+            )
+
+
+# Keepalive settings of pooled channels. Pings are only sent while there are
+# calls in flight: the node's gRPC server (Netty) treats pings on idle
+# connections, or more often than every 5 minutes, as abuse and closes them.
+KEEPALIVE_OPTIONS = (
+    ("grpc.keepalive_time_ms", 5 * 60 * 1000),
+    ("grpc.keepalive_timeout_ms", 20 * 1000),
+    ("grpc.keepalive_permit_without_calls", 0),
+)
+
+
+class ChannelPool:
+    """
+    A fixed number of long-lived gRPC channels to one endpoint.
+
+    gRPC channels are thread-safe and multiplex concurrent calls over a single
+    HTTP/2 connection, so one channel is enough for most users. Multi-threaded
+    callers can spread their calls over several connections with a bigger pool,
+    calls are assigned to channels in a round-robin fashion.
+
+    Channels are created when the pool is first used, and connect then,
+    unless they are connected beforehand with connect().
+    """
+
+    def __init__(
+        self, address, credentials=None, options=(), size: int = 1, interceptors=()
+    ):
+        if size < 1:
+            raise ValueError("Channel pool size must be positive")
+        self.address = address
+        self.credentials = credentials
+        self._options = tuple(options or ())
+        self.options = tuple(KEEPALIVE_OPTIONS) + self._options
+        self.interceptors = tuple(interceptors)
+        self.size = size
+        self._channels = None
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._stubs = {}
+        self._ready_futures = []
+
+    def _new_channel(self):
+        if self.credentials:
+            channel = grpc.secure_channel(
+                self.address, self.credentials, options=self.options
+            )
+        else:
+            channel = grpc.insecure_channel(self.address, options=self.options)
+        if self.interceptors:
+            channel = grpc.intercept_channel(channel, *self.interceptors)
+        return channel
+
+    def resized(self, size: int) -> "ChannelPool":
+        """
+        Return a new pool of size channels to the same endpoint, with the same settings.
+        """
+        return type(self)(
+            self.address, self.credentials, self._options, size, self.interceptors
+        )
+
+    @property
+    def channels(self) -> list:
+        with self._lock:
+            if self._channels is None:
+                self._channels = [self._new_channel() for _ in range(self.size)]
+            return self._channels
+
+    def connect(self, timeout: float = None):
+        """
+        Start connecting all channels of the pool.
+
+        :param timeout: If None, return immediately and let the connections be
+                        established in the background. Otherwise wait at most
+                        timeout seconds for all channels to become ready.
+        """
+        self._ready_futures = [grpc.channel_ready_future(c) for c in self.channels]
+        if timeout is not None:
+            for future in self._ready_futures:
+                future.result(timeout=timeout)
+
+    def stub(self, serviceStub):
+        """
+        Return a stub of the given service bound to the next channel of the pool.
+        """
+        i = next(self._counter) % self.size
+        try:
+            return self._stubs[(serviceStub, i)]
+        except KeyError:
+            stub = self._stubs[(serviceStub, i)] = serviceStub(self.channels[i])
+            return stub
+
+    def close(self):
+        for future in self._ready_futures:
+            future.cancel()
+        for channel in self._channels or ():
+            channel.close()
+        self._stubs.clear()
 
 
 def extract_common_name(certificate_file: str) -> str:
+    import ssl
+
     cert_dict = ssl._ssl._test_decode_cert(certificate_file)
     return [t[0][1] for t in cert_dict["subject"] if t[0][0] == "commonName"][0]
 
 
-class SecureGRPCService:
-    def __init__(self, host, port, serviceStub, node_id, certificate_file):
-        self.address = f"{host}:{port}"
+class ChannelManager:
+    """
+    Owns the channel pools of a client, one per (host, port, credentials).
+    """
+
+    pool_class = ChannelPool
+
+    def __init__(self, pool_size: int = 1, connect_timeout: float = None, metrics=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+        self.pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, host, port, node_id=None, certificate_file=None) -> ChannelPool:
+        key = (host, port, node_id, certificate_file)
+        with self._lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                credentials, options = None, ()
+                if certificate_file:
+                    with open(certificate_file, "rb") as f:
+                        credentials = grpc.ssl_channel_credentials(f.read())
+                    options = node_id and (
+                        ("grpc.ssl_target_name_override", node_id),
+                        ("grpc.default_authority", node_id),
+                    )
+                address = f"{host}:{port}"
+                interceptors = self.metrics and [self.metrics.interceptor(address)]
+                pool = self.pool_class(
+                    address,
+                    credentials,
+                    options,
+                    size=self.pool_size,
+                    interceptors=interceptors or (),
+                )
+                if self.connect_timeout is not None:
+                    pool.connect(self.connect_timeout)
+                self.pools[key] = pool
+            return pool
+
+    def close(self):
+        with self._lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools.clear()
+
+
+def _backoff(
+    attempt: int, backoff: float, max_backoff: float, jitter: float = 1.0
+) -> float:
+    """
+    Delay before retry number attempt: exponential backoff, capped at max_backoff,
+    reduced by a random fraction of at most jitter so that clients that failed
+    at the same time don't retry at the same time again.
+    """
+    delay = min(backoff * 2 ** (attempt - 1), max_backoff)
+    return delay * (1 - jitter * random.random())
+
+
+class CallPolicy:
+    """
+    How GRPCService calls a method of a gRPC service.
+
+    :param timeout:      Deadline of each attempt in seconds, None for no deadline.
+    :param attempts:     Maximum number of attempts. Only idempotent methods
+                         should be called more than once.
+    :param backoff:      Delay before the first retry in seconds, it doubles
+                         with each retry, with full jitter.
+    :param max_backoff:  Maximum delay between attempts in seconds.
+    :param hedge_after:  If given, send a duplicate request over another channel
+                         if there is no response after this many seconds, and
+                         use the response that comes first. Only for unary methods.
+    :param retry_codes:  Names of gRPC status codes of failures that are retried.
+    """
+
+    __slots__ = (
+        "timeout",
+        "attempts",
+        "backoff",
+        "max_backoff",
+        "hedge_after",
+        "retry_codes",
+    )
+
+    def __init__(
+        self,
+        timeout: float = None,
+        attempts: int = 1,
+        backoff: float = 0.1,
+        max_backoff: float = 5.0,
+        hedge_after: float = None,
+        retry_codes=("UNAVAILABLE", "DEADLINE_EXCEEDED"),
+    ):
+        if attempts < 1:
+            raise ValueError("Number of attempts must be positive")
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.retry_codes = frozenset(retry_codes)
+
+    def __repr__(self):
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"CallPolicy({args})"
+
+    def retryable(self, e: "grpc.RpcError", attempt: int) -> bool:
+        return attempt < self.attempts and e.code().name in self.retry_codes
+
+    def delay(self, attempt: int) -> float:
+        return _backoff(attempt, self.backoff, self.max_backoff)
+
+
+DEFAULT_CALL_POLICY = CallPolicy(timeout=60)
+
+# Reads of immutable data or of the node's current view are safe to repeat.
+READ_CALL_POLICY = CallPolicy(timeout=30, attempts=3)
+
+# Policies of methods of CasperService and ControlService, by method name.
+# Streams have no deadline, they may be long, and are only retried
+# if they fail before the first object is received.
+DEFAULT_CALL_POLICIES = {
+    "GetBlockInfo": READ_CALL_POLICY,
+    "GetDeployInfo": READ_CALL_POLICY,
+    "GetBlockState": READ_CALL_POLICY,
+    "BatchGetBlockState": READ_CALL_POLICY,
+    "StreamBlockInfos": CallPolicy(attempts=3),
+    "StreamBlockDeploys": CallPolicy(attempts=3),
+    # Executing deploys in a new block may take long.
+    "Propose": CallPolicy(timeout=300),
+}
+
+# Windows of showBlocks with parallelism are resumed this many times in a row
+# without receiving whole ranks before giving up.
+WINDOW_CALL_POLICY = CallPolicy(attempts=5)
+
+
+class GRPCService:
+    """
+    Calls methods of a gRPC service stub over channels of a pool.
+    Methods with names ending with "_stream" return generators
+    of the objects streamed by the server, methods with names ending
+    with "_future" start the call and return a grpc.Future immediately.
+
+    Deadlines, retries and hedging of calls are configured per method
+    with CallPolicy objects, see DEFAULT_CALL_POLICIES.
+    """
+
+    def __init__(self, pool: ChannelPool, serviceStub, policies: dict = None):
+        self.pool = pool
+        self.address = pool.address
         self.serviceStub = serviceStub
+        self.policies = dict(DEFAULT_CALL_POLICIES, **(policies or {}))
+
+    def policy(self, method: str) -> CallPolicy:
+        return self.policies.get(method, DEFAULT_CALL_POLICY)
+
+    def _method(self, method: str):
+        return getattr(self.pool.stub(self.serviceStub), method)
+
+    def _call(self, method: str, request):
+        policy = self.policy(method)
+        attempt = 1
+        while True:
+            try:
+                with phase("rpc"):
+                    if policy.hedge_after is None:
+                        return self._method(method)(request, timeout=policy.timeout)
+                    return self._hedged_call(method, policy, request)
+            except grpc.RpcError as e:
+                if not policy.retryable(e, attempt):
+                    raise
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+
+    def _hedged_call(self, method: str, policy: CallPolicy, request):
+        """
+        Call method and, if it doesn't complete within policy.hedge_after seconds,
+        call it again over the next channel of the pool. Return the result of
+        the call that succeeds first, the other one is cancelled.
+        """
+        done = queue.Queue()
+        futures = []
+
+        def start():
+            future = self._method(method).future(request, timeout=policy.timeout)
+            futures.append(future)
+            future.add_done_callback(done.put)
+
+        start()
+        try:
+            try:
+                first = done.get(timeout=policy.hedge_after)
+            except queue.Empty:
+                start()
+                first = done.get()
+            if first.exception() is not None and len(futures) > 1:
+                # The hedged request may still succeed.
+                return done.get().result()
+            return first.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _stream(self, method: str, request):
+        policy = self.policy(method)
+        attempt = 1
+        while True:
+            received = False
+            try:
+                responses = self._method(method)(request, timeout=policy.timeout)
+                for response in timed(responses, "rpc"):
+                    received = True
+                    yield response
+                return
+            except grpc.RpcError as e:
+                # Objects received already can't be taken back.
+                if received or not policy.retryable(e, attempt):
+                    raise
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+
+    def _future(self, method: str, request):
+        future = self._method(method).future(
+            request, timeout=self.policy(method).timeout
+        )
+        return timed_future(future, "rpc")
+
+    def __getattr__(self, name):
+        if name.endswith("_stream"):
+            return functools.partial(self._stream, name[: -len("_stream")])
+        if name.endswith("_future"):
+            return functools.partial(self._future, name[: -len("_future")])
+        return functools.partial(self._call, name)
+
+
+class InsecureGRPCService(GRPCService):
+    def __init__(self, host, port, serviceStub, channel_manager=None, policies=None):
+        channel_manager = channel_manager or ChannelManager()
+        super().__init__(channel_manager.pool(host, port), serviceStub, policies)
+
+
+class SecureGRPCService(GRPCService):
+    def __init__(
+        self,
+        host,
+        port,
+        serviceStub,
+        node_id,
+        certificate_file,
+        channel_manager=None,
+        policies=None,
+    ):
         self.node_id = node_id  # or extract_common_name(certificate_file)
         self.certificate_file = certificate_file
-        with open(self.certificate_file, "rb") as f:
-            self.credentials = grpc.ssl_channel_credentials(f.read())
-        self.secure_channel_options = self.node_id and (
-            ("grpc.ssl_target_name_override", self.node_id),
-            ("grpc.default_authority", self.node_id),
+        channel_manager = channel_manager or ChannelManager()
+        super().__init__(
+            channel_manager.pool(host, port, node_id, certificate_file),
+            serviceStub,
+            policies,
         )
 
-    def __getattr__(self, name):
-        def f(*args):
-            with grpc.secure_channel(
-                self.address, self.credentials, options=self.secure_channel_options
-            ) as channel:
-                return getattr(self.serviceStub(channel), name)(*args)
-
-        def g(*args):
-            with grpc.secure_channel(
-                self.address, self.credentials, options=self.secure_channel_options
-            ) as channel:
-                yield from getattr(self.serviceStub(channel), name[: -len("_stream")])(
-                    *args
-                )
 
-        return name.endswith("_stream") and g or f
+# Outcome of one of the deploys sent by CasperLabsClient.deploy_many:
+# index of its spec, its hash (None if it couldn't be made) and InternalError or None.
+DeployResult = namedtuple("DeployResult", ["index", "deploy_hash", "error"])
+
+
+def _rpc_error(e: "grpc.RpcError") -> InternalError:
+    return InternalError(str(e.code()), e.details())
+
+
+# Formats of Graphviz dot (-T) for image file name extensions.
+DOT_FORMATS = {
+    "png": "png",
+    "svg": "svg",
+    "svg_standalone": "svg",
+    "xdot": "xdot",
+    "plain": "plain",
+    "plain_ext": "plain-ext",
+    "ps": "ps",
+    "ps2": "ps2",
+    "json": "json",
+    "json0": "json0",
+}
+
+
+def _write_image(dot, file_name: str):
+    """
+    Render DOT, given as an iterable of its parts, to an image file with Graphviz dot.
+    """
+    import subprocess
+
+    extension = file_name.rsplit(".", 1)[-1].lower()
+    if extension not in DOT_FORMATS:
+        raise InternalError("vdag", f"Unknown image format: {extension}")
+    try:
+        p = subprocess.Popen(
+            ["dot", "-T" + DOT_FORMATS[extension], "-o", file_name],
+            stdin=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise InternalError("vdag", "Graphviz dot is needed to render images")
+    with p.stdin:
+        for part in dot:
+            p.stdin.write(part.encode())
+    if p.wait():
+        raise InternalError("vdag", f"dot failed with exit code {p.returncode}")
 
 
 class CasperLabsClient:
@@ -352,15 +1472,7 @@ class CasperLabsClient:
     gRPC CasperLabs client.
     """
 
-    # Note, there is also casper.StateQuery.KeyVariant.KEY_VARIANT_UNSPECIFIED,
-    # but it doesn't seem to have an official string representation
-    # ("key_variant_unspecified"? "unspecified"?) and is not used by the client.
-    STATE_QUERY_KEY_VARIANT = {
-        "hash": casper.StateQuery.KeyVariant.HASH,
-        "uref": casper.StateQuery.KeyVariant.UREF,
-        "address": casper.StateQuery.KeyVariant.ADDRESS,
-        "local": casper.StateQuery.KeyVariant.LOCAL,
-    }
+    STATE_QUERY_KEY_VARIANT = STATE_QUERY_KEY_VARIANT
 
     def __init__(
         self,
@@ -369,6 +1481,13 @@ class CasperLabsClient:
         internal_port: int = DEFAULT_INTERNAL_PORT,
         node_id: str = None,
         certificate_file: str = None,
+        pool_size: int = 1,
+        connect_timeout: float = None,
+        cache_size: int = 0,
+        cache_ttl: float = None,
+        policies: dict = None,
+        metrics: ClientMetrics = None,
+        contract_registry=None,
     ):
         """
         CasperLabs client's constructor.
@@ -378,18 +1497,55 @@ class CasperLabsClient:
         :param internal_port:   Port used for internal gRPC API
         :param certificate_file:      Certificate file for TLS
         :param node_id:         node_id of the node, for gRPC encryption
+        :param pool_size:       Number of gRPC channels (connections) opened to each
+                                of the node's ports, useful for clients that are
+                                shared by many threads
+        :param connect_timeout: If given, connect the channels right away and block
+                                for at most this many seconds until they are connected,
+                                otherwise they connect when they are first used
+        :param cache_size:      If positive, cache responses of requests referring
+                                to blocks by their full hash (showBlock, showDeploys,
+                                queryState, queryStates) up to this many bytes
+        :param cache_ttl:       Number of seconds after which cached responses expire,
+                                by default they are evicted only when the cache is full
+        :param policies:        Dictionary of CallPolicy objects by names of gRPC methods
+                                (like "GetBlockInfo"), overriding DEFAULT_CALL_POLICIES
+        :param metrics:         ClientMetrics to record metrics of all gRPC calls in
+        :param contract_registry: ContractRegistry of stored contracts that deploy
+                                refers to instead of sending their wasm
         """
         self.host = host
         self.port = port
         self.internal_port = internal_port
         self.node_id = node_id
         self.certificate_file = certificate_file
+        self.channel_manager = ChannelManager(pool_size, connect_timeout, metrics)
+        self.metrics = metrics
+        self.cache = cache_size > 0 and ResponseCache(cache_size, cache_ttl) or None
+        self.key_ring = KeyRing()
+        self.contract_registry = contract_registry
+        # Hashes of registered contracts that have been found on the node.
+        self._stored_contracts = set()
+
+        self.casperService, self.controlService = self._services(
+            host, port, internal_port, node_id, certificate_file, policies
+        )
 
+    def _services(self, host, port, internal_port, node_id, certificate_file, policies):
+        """
+        Return CasperService and ControlService of a node.
+        """
         if node_id:
-            self.casperService = SecureGRPCService(
-                host, port, CasperServiceStub, node_id, certificate_file
+            casperService = SecureGRPCService(
+                host,
+                port,
+                casper_grpc.CasperServiceStub,
+                node_id,
+                certificate_file,
+                self.channel_manager,
+                policies,
             )
-            self.controlService = SecureGRPCService(
+            controlService = SecureGRPCService(
                 # We currently assume that if node_id is given then
                 # we get certificate_file too. This is unlike in the Scala client
                 # where node_id is all that's needed for configuring secure connection.
@@ -398,15 +1554,83 @@ class CasperLabsClient:
                 # certificate on the client side.
                 host,
                 internal_port,
-                ControlServiceStub,
+                control_grpc.ControlServiceStub,
                 node_id,
                 certificate_file,
+                self.channel_manager,
+                policies,
             )
         else:
-            self.casperService = InsecureGRPCService(host, port, CasperServiceStub)
-            self.controlService = InsecureGRPCService(
-                host, internal_port, ControlServiceStub
+            casperService = InsecureGRPCService(
+                host,
+                port,
+                casper_grpc.CasperServiceStub,
+                self.channel_manager,
+                policies,
+            )
+            controlService = InsecureGRPCService(
+                host,
+                internal_port,
+                control_grpc.ControlServiceStub,
+                self.channel_manager,
+                policies,
             )
+        return casperService, controlService
+
+    def close(self):
+        """
+        Close all gRPC channels of the client.
+        """
+        self.channel_manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def cache_stats(self) -> dict:
+        """
+        Return counters of the response cache: hits, misses, evictions,
+        number of entries and their total size in bytes.
+        """
+        return self.cache and self.cache.stats() or {}
+
+    def _cached_call(self, method: str, block_hash: str, request, response_class):
+        """
+        Call method of the CasperService, looking the response up in the cache first
+        if the request refers to a block by its full hash.
+        """
+        if self.cache is None or not _is_full_hash(block_hash):
+            return getattr(self.casperService, method)(request)
+
+        key = (method, block_hash, request.SerializeToString())
+        cached = self.cache.get(key)
+        if cached is not None:
+            return response_class.FromString(cached[0])
+        response = getattr(self.casperService, method)(request)
+        self.cache.put(key, [response.SerializeToString()])
+        return response
+
+    def _cached_stream(self, method: str, block_hash: str, request, response_class):
+        """
+        Streaming counterpart of _cached_call. Stream is cached only if it has been
+        consumed till the end.
+        """
+        if self.cache is None or not _is_full_hash(block_hash):
+            yield from getattr(self.casperService, method + "_stream")(request)
+            return
+
+        key = (method, block_hash, request.SerializeToString())
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield from map(response_class.FromString, cached)
+            return
+        responses = []
+        for response in getattr(self.casperService, method + "_stream")(request):
+            responses.append(response.SerializeToString())
+            yield response
+        self.cache.put(key, responses)
 
     @api
     def deploy(
@@ -425,6 +1649,7 @@ class CasperLabsClient:
         session_hash: bytes = None,
         session_name: str = None,
         session_uref: bytes = None,
+        signer: Signer = None,
     ):
         """
         Deploy a smart contract source file to Casper on an existing running node.
@@ -452,106 +1677,388 @@ class CasperLabsClient:
                               executing account) to be called in the payment.
         :param payment-uref:  URef of the stored contract to be called in the
                               payment; base16 encoded.
+        :param signer:        Signer to sign the deploy with, instead of
+                              public_key and private_key files.
         :return:              Tuple: (deserialized DeployServiceResponse object, deploy_hash)
-        """
-        if from_addr and len(from_addr) != 32:
-            raise Exception(f"from_addr must be 32 bytes")
 
-        session_options = (session, session_hash, session_name, session_uref)
-        payment_options = (payment, payment_hash, payment_name, payment_uref)
-
-        # Compatibility mode, should be removed when payment is obligatory
-        if len(list(filter(None, payment_options))) == 0:
-            logging.info("No payment contract provided, using session as payment")
-            payment_options = session_options
-
-        if len(list(filter(None, session_options))) != 1:
-            raise TypeError(
-                "deploy: only one of session, session_hash, session_name, session_uref must be provided"
-            )
-
-        if len(list(filter(None, payment_options))) != 1:
-            raise TypeError(
-                "deploy: only one of payment, payment_hash, payment_name, payment_uref must be provided"
-            )
-
-        # session_args must go to payment as well for now cause otherwise we'll get GASLIMIT error,
-        # if payment is same as session:
-        # https://github.com/CasperLabs/CasperLabs/blob/dev/casper/src/main/scala/io/casperlabs/casper/util/ProtoUtil.scala#L463
-        body = consensus.Deploy.Body(
-            session=_encode_contract(session_options, session_args),
-            payment=_encode_contract(
-                payment_options,
-                payment_options == session_options and session_args or payment_args,
-            ),
-        )
-
-        approval_public_key = public_key and read_pem_key(public_key)
-        account_public_key = from_addr or approval_public_key
-
-        header = consensus.Deploy.Header(
-            account_public_key=account_public_key,
-            timestamp=int(time.time()),
+        With a contract_registry, session and payment wasm files that have been
+        stored as contracts are sent as references to them (session_hash,
+        payment_hash). If the node doesn't have a contract, or rejects the deploy,
+        the wasm is sent after all.
+        """
+        kwargs = dict(
+            from_addr=from_addr,
             gas_price=gas_price,
-            body_hash=_hash(_serialize(body)),
-        )
-
-        deploy_hash = _hash(_serialize(header))
-        approvals = (
-            []
-            if not account_public_key
-            else [
-                consensus.Approval(
-                    approver_public_key=approval_public_key,
-                    signature=_sign(private_key, deploy_hash),
-                )
-            ]
+            payment=payment,
+            session=session,
+            public_key=public_key,
+            private_key=private_key,
+            session_args=session_args,
+            payment_args=payment_args,
+            payment_hash=payment_hash,
+            payment_name=payment_name,
+            payment_uref=payment_uref,
+            session_hash=session_hash,
+            session_name=session_name,
+            session_uref=session_uref,
+            signer=signer,
+            key_ring=self.key_ring,
         )
-        d = consensus.Deploy(
-            deploy_hash=deploy_hash, approvals=approvals, header=header, body=body
+        references = self.contract_registry and self._contract_references(
+            session, payment
         )
+        if references:
+            d = _make_deploy(**dict(kwargs, **references))
+            try:
+                response = self.casperService.Deploy(casper.DeployRequest(deploy=d))
+                return response, d.deploy_hash
+            except grpc.RpcError as e:
+                logging.warning(
+                    f"Deploy referring to stored contracts failed, sending wasm: {e}"
+                )
+        d = _make_deploy(**kwargs)
 
         # TODO: Deploy returns Empty, error handing via exceptions, apparently,
         # so no point in returning it.
-        return self.casperService.Deploy(casper.DeployRequest(deploy=d)), deploy_hash
+        return self.casperService.Deploy(casper.DeployRequest(deploy=d)), d.deploy_hash
+
+    def _contract_references(self, session: str, payment: str) -> dict:
+        """
+        Keyword arguments of deploy that replace session and payment wasm files
+        registered in contract_registry by hashes of their stored contracts,
+        for contracts that are found in the global state at the tip of the DAG.
+        """
+        references = {}
+        for name, wasm in (("session", session), ("payment", payment)):
+            contract_hash = wasm and self.contract_registry.lookup(wasm)
+            if contract_hash and self._is_stored(contract_hash):
+                references[name] = None
+                references[name + "_hash"] = contract_hash
+        return references
+
+    def _is_stored(self, contract_hash: bytes) -> bool:
+        if contract_hash in self._stored_contracts:
+            return True
+        try:
+            tip = next(iter(self.showBlocks(1, full_view=False)))
+            self.queryState(
+                tip.summary.block_hash.hex(), contract_hash.hex(), "", "hash"
+            )
+        except InternalError as e:
+            if "NOT_FOUND" in e.status:
+                logging.warning(
+                    f"Contract {contract_hash.hex()} not found, removed from registry"
+                )
+                self.contract_registry.forget(contract_hash)
+            else:
+                logging.warning(f"Failed to find contract {contract_hash.hex()}: {e}")
+            return False
+        self._stored_contracts.add(contract_hash)
+        return True
+
+    @api
+    def send_deploy(self, deploy):
+        """
+        Send a deploy made beforehand, e.g. with a DeployTemplate.
+
+        :param deploy:        consensus.Deploy object
+        :return:              Tuple: (deserialized DeployServiceResponse object, deploy_hash)
+        """
+        response = self.casperService.Deploy(casper.DeployRequest(deploy=deploy))
+        return response, deploy.deploy_hash
+
+    @api
+    def deploy_many(self, specs, concurrency: int = 16):
+        """
+        Deploy many smart contracts concurrently.
+
+        Deploys are made and signed in the calling thread while previously made
+        ones are being sent, at most concurrency requests are in flight at a time.
+        Failure of one deploy doesn't stop the others.
+
+        :param specs:         Iterable of dicts with keyword arguments of deploy,
+                              or of consensus.Deploy objects made beforehand
+                              (e.g. with DeployTemplate.make), it is consumed lazily.
+        :param concurrency:   Maximum number of Deploy requests in flight.
+        :return:              Generator of DeployResult objects, in the order
+                              in which the deploys complete.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+
+        completed = queue.Queue()
+
+        def done(index, deploy_hash, future):
+            try:
+                future.result()
+                completed.put(DeployResult(index, deploy_hash, None))
+            except grpc.RpcError as e:
+                completed.put(DeployResult(index, deploy_hash, _rpc_error(e)))
+            except Exception as e:
+                error = InternalError(details=str(e))
+                completed.put(DeployResult(index, deploy_hash, error))
+
+        in_flight = 0
+        for index, spec in enumerate(specs):
+            while in_flight >= concurrency:
+                yield completed.get()
+                in_flight -= 1
+            try:
+                if isinstance(spec, consensus.Deploy):
+                    d = spec
+                else:
+                    d = _make_deploy(key_ring=self.key_ring, **spec)
+            except Exception as e:
+                yield DeployResult(index, None, InternalError(details=str(e)))
+                continue
+            future = self.casperService.Deploy_future(casper.DeployRequest(deploy=d))
+            future.add_done_callback(functools.partial(done, index, d.deploy_hash))
+            in_flight += 1
+        for _ in range(in_flight):
+            yield completed.get()
 
     @api
-    def showBlocks(self, depth: int = 1, max_rank=0, full_view=True):
+    def showBlocks(
+        self,
+        depth: int = 1,
+        max_rank=0,
+        full_view=True,
+        parallelism: int = 1,
+        window: int = None,
+    ):
         """
         Get slices of the DAG, going backwards, rank by rank.
 
-        :param depth:     How many of the top ranks of the DAG to show.
-        :param max_rank:  Maximum rank to go back from.
-                          0 means go from the current tip of the DAG.
-        :param full_view: Full view if True, otherwise basic.
-        :return:          Generator of block info objects.
+        With parallelism above 1 the ranks are split into windows, which are
+        fetched concurrently over as many channels (connections), and yielded
+        in the same order as one stream would yield their blocks. If the client
+        has fewer channels (see pool_size), more are opened for the fetch.
+        A window whose stream fails is resumed from the lowest rank received.
+
+        :param depth:        How many of the top ranks of the DAG to show.
+        :param max_rank:     Maximum rank to go back from.
+                             0 means go from the current tip of the DAG.
+        :param full_view:    Full view if True, otherwise basic.
+        :param parallelism:  Number of windows fetched at the same time.
+        :param window:       Number of ranks in a window. By default there are
+                             4 windows per parallelism, of at most 1000 ranks.
+        :return:             Generator of block info objects.
         """
+        if parallelism > 1:
+            yield from self._show_blocks_parallel(
+                depth, max_rank, full_view, parallelism, window
+            )
+            return
         yield from self.casperService.StreamBlockInfos_stream(
             casper.StreamBlockInfosRequest(
                 depth=depth,
                 max_rank=max_rank,
-                view=(
-                    full_view and info.BlockInfo.View.FULL or info.BlockInfo.View.BASIC
-                ),
+                view=_block_view(full_view),
+            )
+        )
+
+    def _block_window(self, service, high: int, low: int, full_view) -> list:
+        """
+        Blocks of ranks from high down to low, in the order they are streamed.
+        If the stream fails, it is resumed from the lowest rank received, as
+        not all blocks of that rank may have been received.
+        """
+        blocks = []
+        attempt = 1
+        while True:
+            received = []
+            # max_rank=0 would mean the tip of the DAG, not the genesis.
+            max_rank = max(high, 1)
+            try:
+                for block_info in service.StreamBlockInfos_stream(
+                    casper.StreamBlockInfosRequest(
+                        depth=max_rank - low + 1,
+                        max_rank=max_rank,
+                        view=_block_view(full_view),
+                    )
+                ):
+                    if low <= block_info.summary.header.rank <= high:
+                        received.append(block_info)
+                return blocks + received
+            except grpc.RpcError as e:
+                if received:
+                    high = received[-1].summary.header.rank
+                    complete = [b for b in received if b.summary.header.rank > high]
+                    if complete:
+                        blocks.extend(complete)
+                        attempt = 1
+                if not WINDOW_CALL_POLICY.retryable(e, attempt):
+                    raise
+            time.sleep(WINDOW_CALL_POLICY.delay(attempt))
+            attempt += 1
+
+    def _show_blocks_parallel(
+        self, depth: int, max_rank, full_view, parallelism: int, window: int
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+
+        if depth < 1:
+            return
+        if not max_rank:
+            # Blocks of the tip's rank tell where the windows start.
+            tips = list(
+                self.casperService.StreamBlockInfos_stream(
+                    casper.StreamBlockInfosRequest(depth=1, view=_block_view(full_view))
+                )
             )
+            if not tips:
+                return
+            yield from tips
+            max_rank = tips[0].summary.header.rank - 1
+            depth -= 1
+        low = max(max_rank - depth + 1, 0)
+        if max_rank < low:
+            return
+        window = window or min(
+            max(math.ceil((max_rank - low + 1) / (4 * parallelism)), 1), 1000
         )
+        service, pool = self.casperService, None
+        # Each window in flight gets its own connection; if the client's pool
+        # is smaller, a bigger one is opened for the fetch.
+        if isinstance(service, GRPCService) and service.pool.size < parallelism:
+            pool = service.pool.resized(parallelism)
+            service = GRPCService(pool, service.serviceStub, service.policies)
+        executor = ThreadPoolExecutor(parallelism)
+        pending = deque()
+        try:
+            for high in range(max_rank, low - 1, -window):
+                if len(pending) >= 2 * parallelism:
+                    yield from pending.popleft().result()
+                pending.append(
+                    executor.submit(
+                        self._block_window,
+                        service,
+                        high,
+                        max(high - window + 1, low),
+                        full_view,
+                    )
+                )
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+            if pool:
+                pool.close()
+
+    @api
+    def follow_blocks(
+        self,
+        from_rank: int = None,
+        depth: int = 0,
+        full_view=True,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        window: int = 100,
+        lookback: int = 1,
+        stop: threading.Event = None,
+    ):
+        """
+        Follow the DAG: yield blocks as they are added to it, each one once,
+        in order of their ranks. The generator ends only when stop is set.
+
+        The node is polled for the top rank of the DAG. Blocks of ranks that
+        haven't been seen yet are fetched in windows of at most `window` ranks.
+        The polling interval doubles from min_interval up to max_interval
+        while there are no new blocks, and goes back to min_interval when
+        there are some.
+
+        :param from_rank:     Rank of the first blocks to yield. By default
+                              blocks of the top `depth` ranks are yielded first,
+                              and then new ones.
+        :param depth:         See from_rank.
+        :param full_view:     Full view if True, otherwise basic.
+        :param min_interval:  Minimum time between polls, in seconds.
+        :param max_interval:  Maximum time between polls, in seconds.
+        :param window:        Maximum number of ranks to fetch in one request.
+        :param lookback:      Number of top ranks that have already been seen
+                              that are checked again for blocks arriving late.
+        :param stop:          Event that ends the generator, also while it waits
+                              for the next poll.
+        :return:              Generator of block info objects.
+        """
+        stop = stop or threading.Event()
+        first_rank = from_rank
+        last_rank = None
+        seen = {}
+        interval = min_interval
+        while not stop.is_set():
+            tips = list(self.showBlocks(depth=1, full_view=full_view))
+            tip_rank = tips and tips[0].summary.header.rank or 0
+            if first_rank is None:
+                first_rank = tip_rank - depth + 1
+            if last_rank is None:
+                last_rank = first_rank - 1
+            blocks = []
+            start = max(last_rank + 1 - lookback, first_rank)
+            for low in range(start, tip_rank, window):
+                high = min(low + window, tip_rank) - 1
+                # max_rank=0 would mean the tip of the DAG, not the genesis.
+                max_rank = high or tip_rank
+                response = self.showBlocks(
+                    depth=max_rank - low + 1, max_rank=max_rank, full_view=full_view
+                )
+                blocks.extend(reversed(list(response)))
+            blocks.extend(tips)
+
+            new_blocks = False
+            for block_info in blocks:
+                rank = block_info.summary.header.rank
+                block_hash = block_info.summary.block_hash
+                if rank >= first_rank and block_hash not in seen:
+                    seen[block_hash] = rank
+                    new_blocks = True
+                    yield block_info
+
+            # Forget blocks that are too old to be checked again.
+            last_rank = max(tip_rank, last_rank)
+            oldest = last_rank + 1 - lookback
+            seen = {h: rank for h, rank in seen.items() if rank >= oldest}
+            interval = new_blocks and min_interval or min(interval * 2, max_interval)
+            stop.wait(interval)
+
+    @api
+    def follow_deploys(self, full_view=True, **kwargs):
+        """
+        Follow deploys processed in new blocks, see follow_blocks.
+        Blocks without deploys are skipped without asking the node for them.
+
+        :param full_view:  Full view of deploys if True, otherwise basic.
+        :param kwargs:     Keyword arguments of follow_blocks.
+        :return:           Generator of pairs (block info, processed deploy).
+        """
+        for block_info in self.follow_blocks(full_view=False, **kwargs):
+            if block_info.summary.header.deploy_count:
+                for deploy in self.showDeploys(
+                    block_info.summary.block_hash.hex(), full_view=full_view
+                ):
+                    yield block_info, deploy
 
     @api
     def showBlock(self, block_hash_base16: str, full_view=True):
         """
         Returns object describing a block known by Casper on an existing running node.
 
+        Note, responses are cached if the client has cache enabled and the hash is full,
+        status of the block (fault tolerance) is then as of the time of the first request.
+
         :param block_hash_base16: hash of the block to be retrieved
         :param full_view:         full view if True, otherwise basic
         :return:                  object representing the retrieved block
         """
-        return self.casperService.GetBlockInfo(
+        return self._cached_call(
+            "GetBlockInfo",
+            block_hash_base16,
             casper.GetBlockInfoRequest(
-                block_hash_base16=block_hash_base16,
-                view=(
-                    full_view and info.BlockInfo.View.FULL or info.BlockInfo.View.BASIC
-                ),
-            )
+                block_hash_base16=block_hash_base16, view=_block_view(full_view)
+            ),
+            info.BlockInfo,
         )
 
     @api
@@ -563,6 +2070,33 @@ class CasperLabsClient:
         """
         return self.controlService.Propose(control.ProposeRequest())
 
+    @api
+    def propose_with_retry(
+        self,
+        attempts: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        jitter: float = 1.0,
+    ):
+        """
+        Propose a block, retrying if the node refuses to, e.g. because
+        there are no new deploys yet or it is busy with another proposal.
+
+        :param attempts:     Maximum number of attempts.
+        :param backoff:      Delay before the first retry in seconds,
+                             it doubles with each retry.
+        :param max_backoff:  Maximum delay between attempts in seconds.
+        :param jitter:       Maximum fraction by which delays are randomly shortened.
+        :return:             response object with block_hash
+        """
+        for attempt in range(1, attempts + 1):
+            try:
+                return self.propose()
+            except InternalError:
+                if attempt == attempts:
+                    raise
+            time.sleep(_backoff(attempt, backoff, max_backoff, jitter))
+
     @api
     def visualizeDag(
         self,
@@ -570,9 +2104,15 @@ class CasperLabsClient:
         out: str = None,
         show_justification_lines: bool = False,
         stream: str = None,
+        interval: float = 5.0,
+        lookback: int = 1,
     ):
         """
-        Retrieve DAG in DOT format.
+        Draw DAG in DOT format, see GraphzGenerator.
+
+        DOT is generated from StreamBlockInfos rank by rank, and written to
+        the image file with Graphviz dot as it is generated, so the whole
+        DAG is never held in memory.
 
         :param depth:                     depth in terms of block height
         :param out:                       output image filename, outputs to stdout if
@@ -582,9 +2122,67 @@ class CasperLabsClient:
         :param show_justification_lines:  if justification lines should be shown
         :param stream:                    subscribe to changes, 'out' has to specified,
                                           valid values are 'single-output', 'multiple-outputs'
-        :return:                          VisualizeBlocksResponse object
+        :param interval:                  time between checks for changes in stream mode,
+                                          in seconds
+        :param lookback:                  number of top ranks drawn already that are
+                                          fetched again in stream mode, for blocks
+                                          arriving late; lower ranks are not fetched again
+        :return:                          Generator of parts of the DOT text if out is not
+                                          specified, otherwise of names of the written files.
         """
-        raise Exception("Not implemented yet")
+        if stream not in (None, "single-output", "multiple-outputs"):
+            raise InternalError("vdag", f"Unknown stream mode: {stream}")
+        if stream and not out:
+            raise InternalError("vdag", "out must be specified if stream is")
+
+        generator = GraphzGenerator(show_justification_lines)
+        if not stream:
+            dot = generator.generate(self.showBlocks(depth, full_view=False))
+            if not out:
+                yield from dot
+                return
+            _write_image(dot, out)
+            yield out
+            return
+
+        # Blocks of the drawn ranks by rank, only ranks above the last tip
+        # and the top lookback ranks below it are fetched in each check.
+        ranks = {}
+        index, previous, last_tip_rank = 0, None, None
+        while True:
+            tips = list(self.showBlocks(1, full_view=False))
+            tip_rank = tips and tips[0].summary.header.rank or 0
+            low = max(tip_rank - depth + 1, 0)
+            if last_tip_rank is not None:
+                low = max(low, last_tip_rank + 1 - lookback)
+            fetched = tips
+            if low < tip_rank:
+                fetched = fetched + self._block_window(
+                    self.casperService, tip_rank - 1, low, False
+                )
+            for rank in range(low, tip_rank + 1):
+                ranks.pop(rank, None)
+            for block_info in fetched:
+                ranks.setdefault(block_info.summary.header.rank, []).append(block_info)
+            for rank in [r for r in ranks if r <= tip_rank - depth]:
+                del ranks[rank]
+            last_tip_rank = tip_rank
+            # Ranks that haven't changed are not generated again,
+            # their parts are the same objects as before.
+            dot = list(
+                generator.generate(
+                    b for rank in sorted(ranks, reverse=True) for b in ranks[rank]
+                )
+            )
+            if dot != previous:
+                file_name = out
+                if stream == "multiple-outputs":
+                    base, extension = os.path.splitext(out)
+                    file_name = f"{base}_{index}{extension}"
+                _write_image(dot, file_name)
+                yield file_name
+                index, previous = index + 1, dot
+            time.sleep(interval)
 
     @api
     def queryState(self, blockHash: str, key: str, path: str, keyType: str):
@@ -601,53 +2199,55 @@ class CasperLabsClient:
         :return:                  QueryStateResponse object
         """
 
-        def key_variant(keyType):
+        return self._cached_call(
+            "GetBlockState",
+            blockHash,
+            casper.GetBlockStateRequest(
+                block_hash_base16=blockHash, query=_state_query(key, path, keyType)
+            ),
+            state.Value,
+        )
 
-            variant = self.STATE_QUERY_KEY_VARIANT.get(keyType.lower(), None)
-            if variant is None:
-                raise InternalError(
-                    "query-state", f"{keyType} is not a known query-state key type"
-                )
-            return variant
+    @api
+    def queryStates(self, block_hash: str, queries: list):
+        """
+        Query many values in the global state in one request.
 
-        q = casper.StateQuery(key_variant=key_variant(keyType), key_base16=key)
-        q.path_segments.extend(name for name in path.split("/") if name)
-        return self.casperService.GetBlockState(
-            casper.GetBlockStateRequest(block_hash_base16=blockHash, query=q)
+        :param block_hash:        Hash of the block to query the state of
+        :param queries:           List of (key, path, keyType) tuples, see queryState
+                                  for description of the tuples' elements
+        :return:                  List of Value objects, in the same order as queries
+        """
+        if not queries:
+            return []
+        return list(
+            self._cached_call(
+                "BatchGetBlockState",
+                block_hash,
+                casper.BatchGetBlockStateRequest(
+                    block_hash_base16=block_hash,
+                    queries=[_state_query(*q) for q in queries],
+                ),
+                casper.BatchGetBlockStateResponse,
+            ).values
         )
 
     @api
     def balance(self, address: str, block_hash: str):
-        value = self.queryState(block_hash, address, "", "address")
-        account = None
-        try:
-            account = value.account
-        except AttributeError:
-            return InternalError(
-                "balance", f"Expected Account type value under {address}."
-            )
+        return self.balances([address], block_hash)[address]
 
-        urefs = [u for u in account.known_urefs if u.name == "mint"]
-        if len(urefs) == 0:
-            raise InternalError(
-                "balance",
-                "Account's known_urefs map did not contain Mint contract address.",
-            )
-
-        mintPublic = urefs[0]
-        mintPrivate = self.queryState(
-            block_hash, mintPublic.key.uref.uref.hex(), "", "uref"
-        )
-
-        mintPrivateHex = mintPrivate.key.uref.uref.hex()
-        purseAddrHex = ABI.byte_array(account.purse_id.uref).hex()
-        localKeyValue = f"{mintPrivateHex}:{purseAddrHex}"
+    @api
+    def balances(self, addresses: list, block_hash: str):
+        """
+        Get balances of many accounts, in a fixed number of requests.
 
-        balanceURef = self.queryState(block_hash, localKeyValue, "", "local")
-        balance = self.queryState(
-            block_hash, balanceURef.key.uref.uref.hex(), "", "uref"
+        :param addresses:         List of accounts' public keys in hex
+        :param block_hash:        Hash of the block to query the state of
+        :return:                  Dictionary mapping addresses to balances
+        """
+        return _run_batches(
+            _balances(addresses), lambda queries: self.queryStates(block_hash, queries)
         )
-        return int(balance.big_int.value)
 
     @api
     def showDeploy(self, deploy_hash_base16: str, full_view=True):
@@ -657,11 +2257,7 @@ class CasperLabsClient:
         return self.casperService.GetDeployInfo(
             casper.GetDeployInfoRequest(
                 deploy_hash_base16=deploy_hash_base16,
-                view=(
-                    full_view
-                    and info.DeployInfo.View.FULL
-                    or info.DeployInfo.View.BASIC
-                ),
+                view=_deploy_view(full_view),
             )
         )
 
@@ -670,15 +2266,13 @@ class CasperLabsClient:
         """
         Get the processed deploys within a block.
         """
-        yield from self.casperService.StreamBlockDeploys_stream(
+        yield from self._cached_stream(
+            "StreamBlockDeploys",
+            block_hash_base16,
             casper.StreamBlockDeploysRequest(
-                block_hash_base16=block_hash_base16,
-                view=(
-                    full_view
-                    and info.DeployInfo.View.FULL
-                    or info.DeployInfo.View.BASIC
-                ),
-            )
+                block_hash_base16=block_hash_base16, view=_deploy_view(full_view)
+            ),
+            consensus.Block.ProcessedDeploy,
         )
 
 
@@ -710,25 +2304,143 @@ def guarded_command(function):
     return wrapper
 
 
+_text_format = None
+
+
+def _hex_text_format():
+    """
+    Import google.protobuf.text_format and monkey patch its text_encoding.CEscape
+    to get keys and signatures in hex when printed.
+    """
+    global _text_format
+    if _text_format is None:
+        from google.protobuf import text_format
+
+        CEscape = text_format.text_encoding.CEscape
+
+        def _hex(text, as_utf8):
+            try:
+                return (len(text) in (32, 64)) and text.hex() or CEscape(text, as_utf8)
+            except TypeError:
+                return CEscape(text, as_utf8)
+
+        text_format.text_encoding.CEscape = _hex
+        _text_format = text_format
+    return _text_format
+
+
 def hexify(o):
     """
     Convert protobuf message to text format with cryptographic keys and signatures in base 16.
     """
-    return google.protobuf.text_format.MessageToString(o)
+    return _hex_text_format().MessageToString(o)
 
 
-def _show_blocks(response, element_name="block"):
-    count = 0
-    for block in response:
-        print(f"------------- {element_name} {count} ---------------")
-        print(hexify(block))
-        print("-----------------------------------------------------\n")
-        count += 1
-    print("count:", count)
+def _is_repeated(field) -> bool:
+    try:
+        return field.is_repeated
+    except AttributeError:
+        return field.label == field.LABEL_REPEATED
+
+
+def _field_converter(field):
+    """
+    Return function converting values of a protobuf message field to values
+    that can be serialized to JSON, see _message_dict.
+    """
+    if field.type == field.TYPE_MESSAGE:
+        convert = _message_dict
+    elif field.type == field.TYPE_BYTES:
+        convert = bytes.hex
+    elif field.type == field.TYPE_ENUM:
+        names = {v.number: v.name for v in field.enum_type.values}
+
+        def convert(value):
+            return names.get(value, value)
+
+    else:
+        convert = None
+
+    if _is_repeated(field):
+        if convert is None:
+            return list
+        return lambda values: [convert(v) for v in values]
+    return convert or (lambda value: value)
+
+
+_field_converters = {}
 
 
-def _show_block(response):
-    print(hexify(response))
+def _message_dict(message) -> dict:
+    """
+    Convert protobuf message to a dictionary that can be serialized to JSON.
+    Bytes (hashes, keys, signatures) are encoded in base 16, enums by their names
+    and fields with default values are omitted.
+
+    It is much faster than google.protobuf.json_format, because functions
+    converting fields are looked up once per field and only the fields
+    that are set are visited.
+    """
+    d = {}
+    for field, value in message.ListFields():
+        try:
+            convert = _field_converters[field]
+        except KeyError:
+            convert = _field_converters[field] = _field_converter(field)
+        d[field.name] = convert(value)
+    return d
+
+
+def _show_blocks(response, element_name="block", output="text"):
+    """
+    Print a stream of messages, each one is flushed as soon as it is received.
+
+    :param output: text, json (array of objects), ndjson (one object per line)
+                   or binary (length delimited messages, see write_deploys)
+    """
+    with phase("format"):
+        _print_messages(response, element_name, output)
+
+
+def _print_messages(response, element_name, output):
+    if output == "binary":
+        f = sys.stdout.buffer
+        for message in response:
+            _write_delimited(message, f)
+            f.flush()
+    elif output == "ndjson":
+        for message in response:
+            print(json.dumps(_message_dict(message)), flush=True)
+    elif output == "json":
+        # Stream the array, one element per line.
+        separator = "["
+        for message in response:
+            print(separator + json.dumps(_message_dict(message)), flush=True)
+            separator = ","
+        print(separator == "[" and "[]" or "]", flush=True)
+    else:
+        count = 0
+        for block in response:
+            print(f"------------- {element_name} {count} ---------------")
+            print(hexify(block))
+            print("-----------------------------------------------------\n", flush=True)
+            count += 1
+        print("count:", count)
+
+
+def _show_block(response, output="text"):
+    with phase("format"):
+        _print_message(response, output)
+
+
+def _print_message(response, output):
+    if output == "text":
+        print(hexify(response))
+    elif output == "binary":
+        _write_delimited(response, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(_message_dict(response)))
 
 
 @guarded_command
@@ -737,61 +2449,313 @@ def no_command(casperlabs_client, args):
     return 1
 
 
-@guarded_command
-def deploy_command(casperlabs_client, args):
-    from_addr = bytes.fromhex(getattr(args, "from"))
+def _deploy_kwargs(options: dict) -> dict:
+    """
+    Convert deploy command's options to keyword arguments of CasperLabsClient.deploy.
+    """
+    from_addr = bytes.fromhex(options.get("from") or "")
     if len(from_addr) != 32:
         raise Exception(
             "--from must be 32 bytes encoded as 64 characters long hexadecimal"
         )
 
-    kwargs = dict(
+    def hex_option(name):
+        return options.get(name) and bytes.fromhex(options[name])
+
+    def args_option(name):
+        return options.get(name) and ABI.args_from_json(options[name]) or None
+
+    return dict(
         from_addr=from_addr,
-        gas_price=args.gas_price,
-        payment=args.payment or args.session,
-        session=args.session,
-        public_key=args.public_key or None,
-        private_key=args.private_key or None,
-        session_args=args.session_args
-        and ABI.args_from_json(args.session_args)
-        or None,
-        payment_args=args.payment_args
-        and ABI.args_from_json(args.payment_args)
-        or None,
-        payment_hash=args.payment_hash and bytes.fromhex(args.payment_hash),
-        payment_name=args.payment_name,
-        payment_uref=args.payment_uref and bytes.fromhex(args.payment_uref),
-        session_hash=args.session_hash and bytes.fromhex(args.session_hash),
-        session_name=args.session_name,
-        session_uref=args.session_uref and bytes.fromhex(args.session_uref),
+        gas_price=options.get("gas_price") or 10,
+        payment=options.get("payment") or options.get("session"),
+        session=options.get("session"),
+        public_key=options.get("public_key") or None,
+        private_key=options.get("private_key") or None,
+        session_args=args_option("session_args"),
+        payment_args=args_option("payment_args"),
+        payment_hash=hex_option("payment_hash"),
+        payment_name=options.get("payment_name"),
+        payment_uref=hex_option("payment_uref"),
+        session_hash=hex_option("session_hash"),
+        session_name=options.get("session_name"),
+        session_uref=hex_option("session_uref"),
     )
-    _, deploy_hash = casperlabs_client.deploy(**kwargs)
+
+
+@guarded_command
+def deploy_command(casperlabs_client, args):
+    kwargs = _deploy_kwargs(vars(args))
+    if args.contract_registry:
+        from .contract_registry import ContractRegistry
+
+        # Only for this deploy, the client may run more commands of batch or shell.
+        default_registry = casperlabs_client.contract_registry
+        with ContractRegistry(args.contract_registry) as registry:
+            casperlabs_client.contract_registry = registry
+            try:
+                _, deploy_hash = casperlabs_client.deploy(**kwargs)
+            finally:
+                casperlabs_client.contract_registry = default_registry
+    else:
+        _, deploy_hash = casperlabs_client.deploy(**kwargs)
     print(f"Success! Deploy {deploy_hash.hex()} deployed")
 
 
+@guarded_command
+def register_contract_command(casperlabs_client, args):
+    from .contract_registry import ContractRegistry
+
+    if bool(args.contract_hash) == bool(args.deploy_hash):
+        raise Exception("Exactly one of --contract-hash and --deploy-hash is required")
+    with ContractRegistry(args.contract_registry) as registry:
+        contract_hash = registry.register(
+            args.wasm,
+            contract_hash=args.contract_hash and bytes.fromhex(args.contract_hash),
+            deploy_hash=args.deploy_hash and bytes.fromhex(args.deploy_hash),
+            fn_store_id=args.fn_store_id,
+        )
+    print(f"Success! Contract {contract_hash.hex()} registered")
+
+
+def _unsigned_deploy_kwargs(options: dict) -> dict:
+    """
+    Like _deploy_kwargs, but for make-deploy, which takes the account from
+    --public-key if --from is not given and doesn't sign.
+    """
+    if not options.get("from") and options.get("public_key"):
+        options = dict(options, **{"from": read_pem_key(options["public_key"]).hex()})
+    return dict(_deploy_kwargs(options), public_key=None, private_key=None)
+
+
+def _deploy_specs(args, lines, convert, error):
+    """
+    Read options of deploys from JSON lines, options given on the command line
+    are their defaults. Lines that can't be converted with convert are reported
+    with error and skipped.
+
+    :return: Generator of tuples: (line number, converted options)
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        options = dict(vars(args))
+        try:
+            for name, value in json.loads(line).items():
+                if isinstance(value, list):
+                    value = json.dumps(value)
+                options[name.replace("-", "_")] = value
+            yield line_number, convert(options)
+        except Exception as e:
+            error(line_number, e)
+
+
+@contextmanager
+def _binary_file(file_name: str, mode: str):
+    """
+    Open a file in binary mode, or use standard input or output
+    (without closing them) if file_name is None.
+    """
+    if file_name:
+        with open(file_name, mode + "b") as f:
+            yield f
+    elif mode == "r":
+        yield sys.stdin.buffer
+    else:
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+
+
+class _ErrorCounter:
+    """
+    Reports errors of commands that process many deploys, see _deploy_specs.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name or "<stdin>"
+        self.count = 0
+
+    def __call__(self, line_number, e):
+        self.count += 1
+        print(f"Error! {self.file_name}:{line_number}: {e}", file=sys.stderr)
+
+
+@guarded_command
+def deploy_batch_command(casperlabs_client, args):
+    error = _ErrorCounter(args.input)
+    line_numbers = []
+
+    def specs(lines):
+        for line_number, kwargs in _deploy_specs(args, lines, _deploy_kwargs, error):
+            line_numbers.append(line_number)
+            yield kwargs
+
+    with args.input and open(args.input) or sys.stdin as f:
+        for r in casperlabs_client.deploy_many(specs(f), args.concurrency):
+            if r.error:
+                error(line_numbers[r.index], r.error)
+            else:
+                print(f"Success! Deploy {r.deploy_hash.hex()} deployed")
+    return error.count and 1 or 0
+
+
+@guarded_command
+def make_deploy_command(casperlabs_client, args):
+    def make(options):
+        return _make_deploy(**_unsigned_deploy_kwargs(options))
+
+    error = _ErrorCounter(args.input)
+    if not args.input:
+        deploy = make(vars(args))
+        with _binary_file(args.deploy_path, "w") as o:
+            write_deploys([deploy], o)
+        return
+
+    with open(args.input) as f, _binary_file(args.deploy_path, "w") as o:
+        write_deploys((d for _, d in _deploy_specs(args, f, make, error)), o)
+    return error.count and 1 or 0
+
+
+@guarded_command
+def sign_deploy_command(casperlabs_client, args):
+    signer = Signer.from_files(args.private_key, args.public_key)
+    with _binary_file(args.deploy_path, "r") as i:
+        with _binary_file(args.signed_deploy_path, "w") as o:
+            if not args.processes:
+                write_deploys((sign_deploy(d, signer) for d in read_deploys(i)), o)
+                return
+            from .signing import SigningPool
+
+            with SigningPool(signer, args.processes) as pool:
+                write_deploys(pool.sign(read_deploys(i)), o)
+
+
+@guarded_command
+def send_deploy_command(casperlabs_client, args):
+    failed = 0
+    with _binary_file(args.deploy_path, "r") as f:
+        deploys = read_deploys(f)
+        for r in casperlabs_client.deploy_many(deploys, args.concurrency):
+            if r.error:
+                failed += 1
+                print(
+                    f"Error! Deploy {r.deploy_hash.hex()} failed: {r.error}",
+                    file=sys.stderr,
+                )
+            else:
+                print(f"Success! Deploy {r.deploy_hash.hex()} deployed")
+    return failed and 1 or 0
+
+
 @guarded_command
 def propose_command(casperlabs_client, args):
     response = casperlabs_client.propose()
     print(f"Success! Block hash: {response.block_hash.hex()}")
 
 
+@guarded_command
+def benchmark_command(casperlabs_client, args):
+    from .benchmark import Benchmark
+
+    benchmark = Benchmark(
+        casperlabs_client,
+        Signer.from_files(
+            args.initial_funds_private_key, args.initial_funds_public_key
+        ),
+        session=args.session,
+        payment=args.payment,
+        payment_args=args.payment_args and ABI.args_from_json(args.payment_args),
+        accounts_num=args.accounts_num,
+        rounds_num=args.rounds_num,
+        approximate_transfer_cost=args.approximate_transfer_cost,
+        processes=args.processes,
+        concurrency=args.concurrency,
+    )
+    print("Initializing accounts...", flush=True)
+    for stats in benchmark.run(args.output):
+        print(stats, flush=True)
+    print(f"Done, stats written to {args.output}")
+
+
+@guarded_command
+def verify_command(casperlabs_client, args):
+    from .verify import Verifier
+
+    if not args.depth and not args.deploy_path:
+        raise Exception("Either --depth or --deploy-path must be given")
+    with ExitStack() as stack:
+        verifier = stack.enter_context(Verifier(casperlabs_client, args.processes))
+        if args.deploy_path:
+            f = stack.enter_context(open(args.deploy_path, "rb"))
+            mismatches = verifier.verify_deploys(read_deploys(f))
+        else:
+            mismatches = verifier.verify(
+                args.depth, args.max_rank, deploys=not args.blocks_only
+            )
+        for m in mismatches:
+            in_block = m.block_hash and f" in block {m.block_hash.hex()}" or ""
+            print(f"Error! {m.kind.capitalize()} {m.hash.hex()}{in_block}: {m.problem}")
+        stats = verifier.stats()
+    print(
+        f"Verified {stats['blocks']} blocks, {stats['deploys']} deploys"
+        f" and {stats['approvals']} approvals in {stats['seconds']:.2f} s"
+        f" ({stats['approvals_per_second']:.1f} approvals/sec),"
+        f" {stats['mismatches']} mismatches"
+    )
+    return stats["mismatches"] and 1 or 0
+
+
+def _write_metrics(metrics: ClientMetrics, file_name: str):
+    if file_name == "-":
+        sys.stderr.write(metrics.prometheus())
+    else:
+        with open(file_name, "w") as f:
+            f.write(metrics.prometheus())
+
+
+def _full_view(args, default: bool) -> bool:
+    view = getattr(args, "view", None)
+    return default if view is None else view == "full"
+
+
 @guarded_command
 def show_block_command(casperlabs_client, args):
-    response = casperlabs_client.showBlock(args.hash, full_view=True)
-    return _show_block(response)
+    response = casperlabs_client.showBlock(
+        args.hash, full_view=_full_view(args, default=True)
+    )
+    return _show_block(response, args.output)
 
 
 @guarded_command
 def show_blocks_command(casperlabs_client, args):
-    response = casperlabs_client.showBlocks(args.depth)
-    _show_blocks(response)
+    full_view = _full_view(args, default=True)
+    if not args.follow:
+        response = casperlabs_client.showBlocks(
+            args.depth, full_view=full_view, parallelism=args.parallelism
+        )
+        return _show_blocks(response, output=args.output)
+    try:
+        response = casperlabs_client.follow_blocks(
+            depth=args.depth, full_view=full_view
+        )
+        _show_blocks(response, output=args.output)
+    except KeyboardInterrupt:
+        pass
 
 
 @guarded_command
 def vdag_command(casperlabs_client, args):
-    response = casperlabs_client.visualizeDag(args.depth)
-    # TODO: call Graphviz
-    print(hexify(response))
+    response = casperlabs_client.visualizeDag(
+        args.depth, args.out, args.show_justification_lines, args.stream
+    )
+    try:
+        for part in response:
+            if args.out:
+                print(f"Wrote {part}", flush=True)
+            else:
+                sys.stdout.write(part)
+    except KeyboardInterrupt:
+        pass
 
 
 @guarded_command
@@ -799,7 +2763,8 @@ def query_state_command(casperlabs_client, args):
     response = casperlabs_client.queryState(
         args.block_hash, args.key, args.path, getattr(args, "type")
     )
-    print(hexify(response))
+    with phase("format"):
+        print(hexify(response))
 
 
 @guarded_command
@@ -810,14 +2775,93 @@ def balance_command(casperlabs_client, args):
 
 @guarded_command
 def show_deploy_command(casperlabs_client, args):
-    response = casperlabs_client.showDeploy(args.hash, full_view=False)
-    print(hexify(response))
+    response = casperlabs_client.showDeploy(
+        args.hash, full_view=_full_view(args, default=False)
+    )
+    _show_block(response, args.output)
 
 
 @guarded_command
 def show_deploys_command(casperlabs_client, args):
-    response = casperlabs_client.showDeploys(args.hash, full_view=False)
-    _show_blocks(response, element_name="deploy")
+    response = casperlabs_client.showDeploys(
+        args.hash, full_view=_full_view(args, default=False)
+    )
+    _show_blocks(response, element_name="deploy", output=args.output)
+
+
+def _run_command_line(casperlabs_client, parser, line: str) -> int:
+    """
+    Run a command of batch or shell, given in a line in the same grammar
+    as the command line of the client, with the client of batch or shell.
+    Connection options given in the line are ignored.
+
+    :return:  Exit status of the command.
+    """
+    import shlex
+
+    try:
+        args = parser.parse_args(shlex.split(line))
+    # Invalid quoting.
+    except ValueError as e:
+        print(f"Error! {e}", file=sys.stderr)
+        return 2
+    # Usage errors and --help, argparse has already printed the message.
+    except SystemExit as e:
+        return e.code or 0
+    return args.function(casperlabs_client, args)
+
+
+def _command_lines(lines):
+    """
+    Lines with commands, without blank lines and comments (lines starting with #).
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line_number, line
+
+
+@guarded_command
+def batch_command(casperlabs_client, args):
+    failed = 0
+    with args.input and open(args.input) or sys.stdin as f:
+        for line_number, line in _command_lines(f):
+            rc = _run_command_line(casperlabs_client, args.parser, line)
+            failed += rc != 0
+            sys.stdout.flush()
+            print(f"{args.delimiter} {line_number} {rc}", flush=True)
+            if rc and args.stop_on_error:
+                break
+    return failed and 1 or 0
+
+
+@guarded_command
+def shell_command(casperlabs_client, args):
+    try:
+        # Line editing and history of input().
+        import readline  # noqa: F401
+    except ImportError:
+        pass
+    print("Type commands, --help for the list of commands, exit or Ctrl-D to exit.")
+    while True:
+        try:
+            line = input(args.prompt)
+        except EOFError:
+            print()
+            return 0
+        except KeyboardInterrupt:
+            print()
+            continue
+        if line.strip() in ("exit", "quit"):
+            return 0
+        for _, line in _command_lines([line]):
+            try:
+                rc = _run_command_line(casperlabs_client, args.parser, line)
+            except KeyboardInterrupt:
+                rc = 130
+                print()
+            if rc:
+                print(f"Exit status: {rc}", file=sys.stderr)
 
 
 def main():
@@ -869,9 +2913,36 @@ def main():
                 type=str,
                 help="Certificate file for TLS connection",
             )
+            self.parser.add_argument(
+                "--metrics",
+                required=False,
+                type=str,
+                help="Write metrics of the gRPC calls in Prometheus text format"
+                " to this file when the command finishes, '-' for standard error",
+            )
+            self.parser.add_argument(
+                "--profile",
+                action="store_true",
+                help="Print times of phases of the command (reading files and keys,"
+                " serialization, hashing, signing, gRPC calls, formatting of output)"
+                " to standard error",
+            )
+            self.parser.add_argument(
+                "--profile-format",
+                choices=("table", "json"),
+                default="table",
+                help="Format of times printed with --profile",
+            )
+            self.parser.add_argument(
+                "--cprofile",
+                required=False,
+                type=str,
+                help="Write cProfile statistics of the command to this file",
+            )
             self.sp = self.parser.add_subparsers(help="Choose a request")
 
-            self.parser.set_defaults(function=no_command)
+            # Commands of batch and shell are parsed with the same parser.
+            self.parser.set_defaults(function=no_command, parser=self.parser)
 
         def addCommand(self, command: str, function, help, arguments):
             command_parser = self.sp.add_parser(command, help=help)
@@ -885,49 +2956,126 @@ def main():
                 return 1
 
             args = self.parser.parse_args()
-            return args.function(
-                CasperLabsClient(
-                    args.host,
-                    args.port,
-                    args.internal_port,
-                    args.node_id,
-                    args.certificate_file,
-                ),
-                args,
-            )
+            metrics = args.metrics and ClientMetrics()
+            profiler = (args.profile or args.cprofile) and Profiler(args.cprofile)
+            try:
+                with ExitStack() as stack:
+                    if profiler:
+                        stack.enter_context(profiler)
+                    return args.function(
+                        CasperLabsClient(
+                            args.host,
+                            args.port,
+                            args.internal_port,
+                            args.node_id,
+                            args.certificate_file,
+                            metrics=metrics,
+                        ),
+                        args,
+                    )
+            finally:
+                if metrics:
+                    _write_metrics(metrics, args.metrics)
+                if profiler and args.profile:
+                    sys.stderr.write(
+                        profiler.table()
+                        if args.profile_format == "table"
+                        else profiler.json() + "\n"
+                    )
 
     parser = Parser()
 
     # fmt: off
+    contract_options = [[('--gas-price',), dict(required=False, type=int, default=10, help='The price of gas for this transaction in units dust/gas. Must be positive integer.')],
+                        [('-p', '--payment'), dict(required=False, type=str, default=None, help='Path to the file with payment code, by default fallbacks to the --session code')],
+                        [('--payment-hash',), dict(required=False, type=str, default=None, help='Hash of the stored contract to be called in the payment; base16 encoded')],
+                        [('--payment-name',), dict(required=False, type=str, default=None, help='Name of the stored contract (associated with the executing account) to be called in the payment')],
+                        [('--payment-uref',), dict(required=False, type=str, default=None, help='URef of the stored contract to be called in the payment; base16 encoded')],
+                        [('-s', '--session'), dict(required=False, type=str, default=None, help='Path to the file with session code')],
+                        [('--session-hash',), dict(required=False, type=str, default=None, help='Hash of the stored contract to be called in the session; base16 encoded')],
+                        [('--session-name',), dict(required=False, type=str, default=None, help='Name of the stored contract (associated with the executing account) to be called in the session')],
+                        [('--session-uref',), dict(required=False, type=str, default=None, help='URef of the stored contract to be called in the session; base16 encoded')],
+                        [('--session-args',), dict(required=False, type=str, help='JSON encoded list of session args, e.g.: [{"u32":1024},{"u64":12}]')],
+                        [('--payment-args',), dict(required=False, type=str, help="""JSON encoded list of payment args, e.g.: [{"u512":100000}]""")]]
+
+    output_options = [[('--output',), dict(required=False, choices=('text', 'json', 'ndjson', 'binary'), default='text', help="Output format: 'text' (default), 'json', 'ndjson' (one JSON object per line) or 'binary' (length delimited protobuf messages). In JSON bytes are base16 encoded.")],
+                      [('--view',), dict(required=False, choices=('basic', 'full'), default=None, help="View of the objects; 'basic' omits details that are expensive to get and print")]]
+
     parser.addCommand('deploy', deploy_command, 'Deploy a smart contract source file to Casper on an existing running node. The deploy will be packaged and sent as a block to the network depending on the configuration of the Casper instance',
-                      [[('-f', '--from'), dict(required=True, type=str, help="The public key of the account which is the context of this deployment, base16 encoded.")],
-                       [('--gas-price',), dict(required=False, type=int, default=10, help='The price of gas for this transaction in units dust/gas. Must be positive integer.')],
-                       [('-p', '--payment'), dict(required=False, type=str, default=None, help='Path to the file with payment code, by default fallbacks to the --session code')],
-                       [('--payment-hash',), dict(required=False, type=str, default=None, help='Hash of the stored contract to be called in the payment; base16 encoded')],
-                       [('--payment-name',), dict(required=False, type=str, default=None, help='Name of the stored contract (associated with the executing account) to be called in the payment')],
-                       [('--payment-uref',), dict(required=False, type=str, default=None, help='URef of the stored contract to be called in the payment; base16 encoded')],
-                       [('-s', '--session'), dict(required=False, type=str, default=None, help='Path to the file with session code')],
-                       [('--session-hash',), dict(required=False, type=str, default=None, help='Hash of the stored contract to be called in the session; base16 encoded')],
-                       [('--session-name',), dict(required=False, type=str, default=None, help='Name of the stored contract (associated with the executing account) to be called in the session')],
-                       [('--session-uref',), dict(required=False, type=str, default=None, help='URef of the stored contract to be called in the session; base16 encoded')],
-                       [('--session-args',), dict(required=False, type=str, help='JSON encoded list of session args, e.g.: [{"u32":1024},{"u64":12}]')],
-                       [('--payment-args',), dict(required=False, type=str, help="""JSON encoded list of payment args, e.g.: [{"u512":100000}]""")],
-                       [('--private-key',), dict(required=True, type=str, help='Path to the file with account public key (Ed25519)')],
-                       [('--public-key',), dict(required=True, type=str, help='Path to the file with account private key (Ed25519)')]])
+                      [[('-f', '--from'), dict(required=True, type=str, help="The public key of the account which is the context of this deployment, base16 encoded.")]]
+                      + contract_options
+                      + [[('--private-key',), dict(required=True, type=str, help='Path to the file with account public key (Ed25519)')],
+                         [('--public-key',), dict(required=True, type=str, help='Path to the file with account private key (Ed25519)')],
+                         [('--contract-registry',), dict(required=False, type=str, help='Path to a contract registry (see register-contract). Session and payment wasm registered in it are sent as hashes of their stored contracts')]])
+
+    parser.addCommand('register-contract', register_contract_command, 'Register a contract stored on the network in a local contract registry, so that deploy --contract-registry refers to it instead of sending the wasm it was stored from.',
+                      [[('--contract-registry',), dict(required=True, type=str, help='Path to the contract registry file (sqlite), it is created if it does not exist')],
+                       [('-w', '--wasm'), dict(required=True, type=str, help='Path to the wasm file whose deploys should refer to the stored contract')],
+                       [('--contract-hash',), dict(required=False, type=str, help='Hash of the stored contract, base16 encoded')],
+                       [('--deploy-hash',), dict(required=False, type=str, help='Hash of the deploy that stored the contract, base16 encoded, to derive the contract hash from')],
+                       [('--fn-store-id',), dict(required=False, type=int, default=0, help='Index of the contract among those stored by the deploy, 0 for the first')]])
+
+    parser.addCommand('deploy-batch', deploy_batch_command, 'Deploy many smart contracts concurrently. Deploys are read from a file with one JSON object per line, keys of the objects are options of the deploy command, e.g.: {"from": "<hex>", "session-args": [{"name": "amount", "value": {"long_value": 1}}]}. Options given on the command line are defaults for all deploys.',
+                      [[('-i', '--input'), dict(required=False, type=str, default=None, help='Path to the file with deploys, one JSON object per line, by default they are read from the standard input')],
+                       [('-c', '--concurrency'), dict(required=False, type=int, default=16, help='Maximum number of deploys being sent at the same time')],
+                       [('-f', '--from'), dict(required=False, type=str, help="The public key of the account which is the context of the deployments, base16 encoded.")]]
+                      + contract_options
+                      + [[('--private-key',), dict(required=False, type=str, help='Path to the file with account private key (Ed25519)')],
+                         [('--public-key',), dict(required=False, type=str, help='Path to the file with account public key (Ed25519)')]])
+
+    parser.addCommand('make-deploy', make_deploy_command, 'Constructs a deploy that can be signed and sent to a node. Deploys are written to a binary file, where each one is preceded by its size (varint), files with many deploys can be concatenated.',
+                      [[('-f', '--from'), dict(required=False, type=str, help="The public key of the account which is the context of this deployment, base16 encoded. Either --from or --public-key must be given.")],
+                       [('--public-key',), dict(required=False, type=str, help='Path to the file with account public key (Ed25519)')]]
+                      + contract_options
+                      + [[('-o', '--deploy-path'), dict(required=False, type=str, help='Path to the file where deploy will be saved. Optional, if not provided the deploy will be printed to STDOUT.')],
+                         [('-i', '--input'), dict(required=False, type=str, default=None, help='Path to a file with options of many deploys, one JSON object per line like in deploy-batch, all of them are written to the deploy file')]])
+
+    parser.addCommand('sign-deploy', sign_deploy_command, 'Cryptographically signs deploys. The signature is appended to existing approvals.',
+                      [[('--public-key',), dict(required=True, type=str, help='Path to the file with account public key (Ed25519)')],
+                       [('--private-key',), dict(required=True, type=str, help='Path to the file with account private key (Ed25519)')],
+                       [('-o', '--signed-deploy-path'), dict(required=False, type=str, help='Path to the file where signed deploys will be saved. If not provided, the signed deploys will be sent to STDOUT.')],
+                       [('-i', '--deploy-path'), dict(required=False, type=str, help='Path to the deploy file. If not provided, the deploys are read from STDIN.')],
+                       [('--processes',), dict(required=False, type=int, default=0, help='Number of processes hashing and signing the deploys, for files with many deploys. By default they are signed in the main process.')]])
+
+    parser.addCommand('send-deploy', send_deploy_command, 'Send deploys made with make-deploy and signed with sign-deploy to Casper on an existing running node.',
+                      [[('-i', '--deploy-path'), dict(required=False, type=str, help='Path to the file with signed deploys. If not provided, the deploys are read from STDIN.')],
+                       [('-c', '--concurrency'), dict(required=False, type=int, default=16, help='Maximum number of deploys being sent at the same time')]])
 
     parser.addCommand('propose', propose_command, 'Force a node to propose a block based on its accumulated deploys.', [])
 
+    parser.addCommand('benchmark', benchmark_command, 'Run rounds of token transfers from many new accounts to one and write their deploy and propose times to a CSV file, like the Scala client\'s benchmark.',
+                      [[('-o', '--output'), dict(required=False, type=str, default='benchmarking_stats.csv.txt', help='Path to the file where stats of the rounds will be written, it is overwritten')],
+                       [('--initial-funds-private-key',), dict(required=True, type=str, help='Path to the file with private key (Ed25519) of the account that funds the new accounts')],
+                       [('--initial-funds-public-key',), dict(required=True, type=str, help='Path to the file with public key (Ed25519) of the account that funds the new accounts')],
+                       [('--accounts-num',), dict(required=False, type=int, default=250, help='Number of accounts sending transfers in each round')],
+                       [('--rounds-num',), dict(required=False, type=int, default=100, help='Number of rounds')],
+                       [('--approximate-transfer-cost',), dict(required=False, type=int, default=10000000, help='Cost of a transfer, accounts are funded with enough for all the rounds')],
+                       [('-s', '--session'), dict(required=True, type=str, help='Path to the transfer_to_account.wasm contract')],
+                       [('-p', '--payment'), dict(required=False, type=str, default=None, help='Path to the file with payment code, by default fallbacks to the --session code')],
+                       [('--payment-args',), dict(required=False, type=str, help="""JSON encoded list of payment args, e.g.: [{"u512":10000000}]""")],
+                       [('--processes',), dict(required=False, type=int, default=None, help='Number of processes making and signing the transfers, by default the number of CPUs')],
+                       [('-c', '--concurrency'), dict(required=False, type=int, default=16, help='Maximum number of deploys being sent at the same time')]])
+
     parser.addCommand('show-block', show_block_command, 'View properties of a block known by Casper on an existing running node. Output includes: parent hashes, storage contents of the tuplespace.',
-                      [[('hash',), dict(type=str, help='the hash value of the block')]])
+                      [[('hash',), dict(type=str, help='the hash value of the block')]] + output_options)
 
     parser.addCommand('show-blocks', show_blocks_command, 'View list of blocks in the current Casper view on an existing running node.',
-                      [[('-d', '--depth'), dict(required=True, type=int, help='depth in terms of block height')]])
+                      [[('-d', '--depth'), dict(required=True, type=int, help='depth in terms of block height')],
+                       [('--follow',), dict(action='store_true', help='After the blocks of the top ranks keep printing new blocks as they are added to the DAG, until interrupted')],
+                       [('--parallelism',), dict(required=False, type=int, default=1, help='Number of windows of ranks fetched at the same time, each over its own connection, for deep DAGs')]] + output_options)
 
     parser.addCommand('show-deploy', show_deploy_command, 'View properties of a deploy known by Casper on an existing running node.',
-                      [[('hash',), dict(type=str, help='Value of the deploy hash, base16 encoded.')]])
+                      [[('hash',), dict(type=str, help='Value of the deploy hash, base16 encoded.')]] + output_options)
 
     parser.addCommand('show-deploys', show_deploys_command, 'View deploys included in a block.',
-                      [[('hash',), dict(type=str, help='Value of the block hash, base16 encoded.')]])
+                      [[('hash',), dict(type=str, help='Value of the block hash, base16 encoded.')]] + output_options)
+
+    parser.addCommand('verify', verify_command, 'Verify hashes and signatures of blocks of the top ranks of the DAG and of deploys in them, or of deploys in a file. Mismatches are printed as they are found.',
+                      [[('-d', '--depth'), dict(required=False, type=int, help='depth in terms of block height')],
+                       [('--max-rank',), dict(required=False, type=int, default=0, help='Maximum rank to go back from, by default the tip of the DAG')],
+                       [('--blocks-only',), dict(action='store_true', help='Verify only the blocks, not their deploys')],
+                       [('-i', '--deploy-path'), dict(required=False, type=str, help='Path to a file with deploys (e.g. made with make-deploy) to verify instead of blocks')],
+                       [('--processes',), dict(required=False, type=int, default=None, help='Number of processes verifying signatures, by default the number of CPUs')]])
 
     parser.addCommand('vdag', vdag_command, 'DAG in DOT format',
                       [[('-d', '--depth'), dict(required=True, type=int, help='depth in terms of block height')],
@@ -945,6 +3093,14 @@ def main():
     parser.addCommand('balance', balance_command, 'Returns the balance of the account at the specified block.',
                       [[('-a', '--address'), dict(required=True, type=str, help="Account's public key in hex.")],
                        [('-b', '--block-hash'), dict(required=True, type=str, help='Hash of the block to query the state of')]])
+
+    parser.addCommand('batch', batch_command, 'Run many commands over one connection. Commands are read one per line, in the same grammar as the command line (e.g. "show-blocks --depth 5"), connection options are those of the batch command. Output of each command is followed by a line with the delimiter, the line number of the command and its exit status.',
+                      [[('-i', '--input'), dict(required=False, type=str, help='Path to the file with commands, by default they are read from standard input. Blank lines and lines starting with # are skipped')],
+                       [('--delimiter',), dict(required=False, type=str, default='---', help='Delimiter of outputs of the commands (default: ---)')],
+                       [('--stop-on-error',), dict(action='store_true', help='Stop at the first command that fails')]])
+
+    parser.addCommand('shell', shell_command, 'Interactive shell running commands over one connection, in the same grammar as the command line (e.g. "show-blocks --depth 5").',
+                      [[('--prompt',), dict(required=False, type=str, default='casperlabs> ', help='Prompt of the shell')]])
     # fmt:on
     sys.exit(parser.run())
 
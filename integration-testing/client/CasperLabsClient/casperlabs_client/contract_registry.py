@@ -0,0 +1,148 @@
+"""
+Local registry of wasm stored on the network as contracts, so that deploys
+can refer to the stored contracts instead of sending the wasm again.
+"""
+import os
+import threading
+import time
+
+from .casperlabs_client import _LazyModule, _hash, _read_binary
+
+sqlite3 = _LazyModule("sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    wasm_hash TEXT PRIMARY KEY,
+    contract_hash TEXT NOT NULL,
+    registered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contracts_contract_hash ON contracts (contract_hash);
+"""
+
+
+def contract_address(deploy_hash: bytes, fn_store_id: int = 0) -> bytes:
+    """
+    Hash of a contract stored by a deploy, the same as the execution engine's
+    new_function_address: blake2b256 of the deploy hash followed by the index
+    of the stored function in the deploy (4 bytes, little endian).
+
+    :param deploy_hash:  Hash of the deploy that stored the contract.
+    :param fn_store_id:  Index of the function stored by the deploy, 0 for the first.
+    """
+    return _hash(deploy_hash + fn_store_id.to_bytes(4, "little"))
+
+
+class ContractRegistry:
+    """
+    Index of contracts stored on the network, keyed by blake2b256 hashes of
+    the wasm they were stored from, kept in an sqlite database.
+
+    CasperLabsClient with a registry deploys wasm files found in it by the hash
+    of their stored contract (session_hash or payment_hash) instead of sending
+    the code. Registering is opt-in: a wasm should be registered only if calling
+    the stored contract does the same as running the wasm.
+
+        registry = ContractRegistry("contracts.db")
+        registry.register("counter_call.wasm", deploy_hash=define_deploy_hash)
+        client = CasperLabsClient(host, contract_registry=registry)
+        client.deploy(session="counter_call.wasm", ...)  # sent as session_hash
+
+    Hashes of files are cached by their path, size and modification time.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        :param path:  Path to the sqlite database file, by default
+                      the registry is kept in memory.
+        """
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+        self._file_hashes = {}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def wasm_hash(self, wasm) -> bytes:
+        """
+        :param wasm:  Path to a wasm file, or the wasm itself (bytes).
+        :return:      blake2b256 hash of the wasm.
+        """
+        if isinstance(wasm, bytes):
+            return _hash(wasm)
+        st = os.stat(wasm)
+        key = (str(wasm), st.st_size, st.st_mtime_ns)
+        h = self._file_hashes.get(key)
+        if h is None:
+            h = self._file_hashes[key] = _hash(_read_binary(wasm))
+        return h
+
+    def register(
+        self,
+        wasm,
+        contract_hash: bytes = None,
+        deploy_hash: bytes = None,
+        fn_store_id: int = 0,
+    ) -> bytes:
+        """
+        Register the contract stored from a wasm, given by its hash or by the hash
+        of the deploy that stored it (see contract_address).
+
+        :param wasm:           Path to the wasm file, or the wasm itself (bytes).
+        :param contract_hash:  Hash of the stored contract.
+        :param deploy_hash:    Hash of the deploy that stored the contract.
+        :param fn_store_id:    Index of the function stored by the deploy.
+        :return:               Hash of the stored contract.
+        """
+        if contract_hash is None:
+            if deploy_hash is None:
+                raise ValueError("Either contract_hash or deploy_hash is required")
+            contract_hash = contract_address(deploy_hash, fn_store_id)
+        with self._lock, self._db:
+            self._db.execute(
+                "REPLACE INTO contracts (wasm_hash, contract_hash, registered_at)"
+                " VALUES (?, ?, ?)",
+                (self.wasm_hash(wasm).hex(), contract_hash.hex(), time.time()),
+            )
+        return contract_hash
+
+    def lookup(self, wasm) -> bytes:
+        """
+        :param wasm:  Path to a wasm file, or the wasm itself (bytes).
+        :return:      Hash of the contract stored from the wasm, None if it is
+                      not registered.
+        """
+        wasm_hash = self.wasm_hash(wasm).hex()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT contract_hash FROM contracts WHERE wasm_hash = ?", (wasm_hash,)
+            ).fetchone()
+        return row and bytes.fromhex(row[0]) or None
+
+    def forget(self, contract_hash: bytes):
+        """
+        Remove a stored contract from the registry, e.g. because it isn't found
+        on the network.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM contracts WHERE contract_hash = ?", (contract_hash.hex(),)
+            )
+
+    def contracts(self) -> dict:
+        """
+        :return:  Dictionary of hashes of the stored contracts keyed by hashes
+                  of the wasm they were stored from, both base16 encoded.
+        """
+        with self._lock:
+            return dict(
+                self._db.execute("SELECT wasm_hash, contract_hash FROM contracts")
+            )
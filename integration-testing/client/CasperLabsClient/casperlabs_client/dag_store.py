@@ -0,0 +1,338 @@
+"""
+Local copy of the DAG, stored in sqlite.
+"""
+import threading
+import time
+
+from .casperlabs_client import _LazyModule, _is_full_hash, api, consensus, info
+
+sqlite3 = _LazyModule("sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    block_hash TEXT PRIMARY KEY,
+    rank INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    block_info BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_rank ON blocks (rank);
+CREATE TABLE IF NOT EXISTS parents (
+    block_hash TEXT NOT NULL,
+    parent_hash TEXT NOT NULL,
+    PRIMARY KEY (block_hash, parent_hash)
+);
+CREATE INDEX IF NOT EXISTS parents_parent_hash ON parents (parent_hash);
+CREATE TABLE IF NOT EXISTS justifications (
+    block_hash TEXT NOT NULL,
+    latest_block_hash TEXT NOT NULL,
+    validator_public_key TEXT NOT NULL,
+    PRIMARY KEY (block_hash, latest_block_hash)
+);
+CREATE INDEX IF NOT EXISTS justifications_latest_block_hash
+    ON justifications (latest_block_hash);
+CREATE TABLE IF NOT EXISTS deploy_lists (
+    block_hash TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS deploys (
+    block_hash TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    deploy_hash TEXT NOT NULL,
+    processed_deploy BLOB NOT NULL,
+    PRIMARY KEY (block_hash, position)
+);
+CREATE INDEX IF NOT EXISTS deploys_deploy_hash ON deploys (deploy_hash);
+"""
+
+
+def _basic_block_info(block_info):
+    # Basic view only includes information based on the block header.
+    block_info.status.ClearField("stats")
+    return block_info
+
+
+def _basic_processed_deploy(processed_deploy):
+    # Basic view doesn't include the body with the code.
+    processed_deploy.deploy.ClearField("body")
+    return processed_deploy
+
+
+class DagStore:
+    """
+    Local copy of the DAG of a node: block infos (full view), their parents,
+    justifications and deploys, stored in an sqlite database.
+
+    The store is synced incrementally: sync() fetches ranks above the highest
+    rank it has already stored (its high water mark), and the top `lookback`
+    ranks up to it again, for blocks of other validators that arrive late.
+    showBlocks, showBlock and showDeploys have the same parameters and return
+    values as the CasperLabsClient methods, but they are served from the store.
+    Lists of deploys are fetched from the node the first time they are needed.
+
+    Block summaries and their deploys never change, but block statuses
+    (fault tolerance) do. Calls take an optional max_age, the maximum age
+    in seconds of the data they return.
+
+        store = DagStore(client, "dag.db")
+        for block_info in store.showBlocks(depth=1000, max_age=10):
+            ...
+    """
+
+    def __init__(
+        self, client, path: str = ":memory:", window: int = 1000, lookback: int = 10
+    ):
+        """
+        :param client:    CasperLabsClient to fetch blocks and deploys with.
+        :param path:      Path to the sqlite database file, by default the store
+                          is kept in memory.
+        :param window:    Maximum number of ranks to fetch in one request when syncing.
+        :param lookback:  Number of top ranks already stored that each sync
+                          fetches again, for blocks arriving late.
+        """
+        self.client = client
+        self.window = window
+        self.lookback = lookback
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _meta(self, key: str, default=None):
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value):
+        self._db.execute("REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def high_water_mark(self) -> int:
+        """
+        Highest rank stored by the last sync, -1 if none. Blocks of the top
+        lookback ranks up to it may still arrive, the next sync fetches them again.
+        """
+        with self._lock:
+            return self._meta("high_water_mark", -1)
+
+    @property
+    def synced_at(self) -> float:
+        """
+        Time of the last sync, or None if the store has never been synced.
+        """
+        with self._lock:
+            return self._meta("synced_at")
+
+    def _store_blocks(self, block_infos, fetched_at: float):
+        rows, parents, justifications = [], [], []
+        for b in block_infos:
+            block_hash = b.summary.block_hash.hex()
+            header = b.summary.header
+            rows.append((block_hash, header.rank, fetched_at, b.SerializeToString()))
+            parents.extend((block_hash, p.hex()) for p in header.parent_hashes)
+            justifications.extend(
+                (block_hash, j.latest_block_hash.hex(), j.validator_public_key.hex())
+                for j in header.justifications
+            )
+        self._db.executemany("REPLACE INTO blocks VALUES (?, ?, ?, ?)", rows)
+        self._db.executemany("INSERT OR IGNORE INTO parents VALUES (?, ?)", parents)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO justifications VALUES (?, ?, ?)", justifications
+        )
+
+    @api
+    def sync(self) -> int:
+        """
+        Fetch blocks with ranks above the high water mark, and those of the top
+        self.lookback ranks up to it again, up to the current tip of the DAG,
+        in windows of at most self.window ranks. Blocks that are stored already
+        are replaced. Each window is stored in one transaction.
+
+        :return:  Number of blocks fetched.
+        """
+        with self._lock:
+            started_at = time.time()
+            tip = next(iter(self.client.showBlocks(depth=1)), None)
+            if tip is None:
+                return 0
+            tip_rank = tip.summary.header.rank
+            count = 0
+            low = max(self.high_water_mark + 1 - self.lookback, 0)
+            while low <= tip_rank:
+                high = min(low + self.window - 1, tip_rank)
+                # max_rank=0 would mean the tip of the DAG, not the genesis.
+                max_rank = max(high, 1)
+                block_infos = [
+                    block_info
+                    for block_info in self.client.showBlocks(
+                        depth=max_rank - low + 1, max_rank=max_rank, full_view=True
+                    )
+                    if low <= block_info.summary.header.rank <= high
+                ]
+                with self._db:
+                    self._store_blocks(block_infos, started_at)
+                    self._set_meta("high_water_mark", high)
+                count += len(block_infos)
+                low = high + 1
+            with self._db:
+                self._set_meta("synced_at", started_at)
+            return count
+
+    def _sync_if_stale(self, max_age: float = None):
+        synced_at = self.synced_at
+        if synced_at is None or (
+            max_age is not None and time.time() - synced_at > max_age
+        ):
+            self.sync()
+
+    @api
+    def showBlocks(self, depth: int = 1, max_rank=0, full_view=True, max_age=None):
+        """
+        Get slices of the DAG, going backwards, rank by rank,
+        see CasperLabsClient.showBlocks.
+
+        The store is synced first if it has never been synced, if max_rank
+        is above its high water mark, or if the last sync is older than
+        max_age seconds.
+
+        :return:          Generator of block info objects.
+        """
+        self._sync_if_stale(max_age)
+        if max_rank > self.high_water_mark:
+            self.sync()
+        with self._lock:
+            top = max_rank or self.high_water_mark
+            rows = self._db.execute(
+                "SELECT block_info FROM blocks WHERE rank BETWEEN ? AND ?"
+                " ORDER BY rank DESC, block_hash",
+                (top - depth + 1, top),
+            ).fetchall()
+        for (data,) in rows:
+            block_info = info.BlockInfo.FromString(data)
+            yield full_view and block_info or _basic_block_info(block_info)
+
+    def _block_row(self, block_hash_base16: str):
+        block_hash_base16 = block_hash_base16.lower()
+        if _is_full_hash(block_hash_base16):
+            return self._db.execute(
+                "SELECT block_hash, fetched_at, block_info FROM blocks WHERE block_hash = ?",
+                (block_hash_base16,),
+            ).fetchone()
+        # Hash prefix, it must match exactly one block.
+        rows = self._db.execute(
+            "SELECT block_hash, fetched_at, block_info FROM blocks"
+            " WHERE block_hash >= ? AND block_hash < ? LIMIT 2",
+            (block_hash_base16, block_hash_base16 + "~"),
+        ).fetchall()
+        return len(rows) == 1 and rows[0] or None
+
+    @api
+    def showBlock(self, block_hash_base16: str, full_view=True, max_age=None):
+        """
+        Returns object describing a block, see CasperLabsClient.showBlock.
+        Blocks that are not in the store, or were fetched more than max_age
+        seconds ago, are fetched from the node and stored.
+        """
+        with self._lock:
+            row = self._block_row(block_hash_base16)
+        if row and (max_age is None or time.time() - row[1] <= max_age):
+            block_info = info.BlockInfo.FromString(row[2])
+        else:
+            fetched_at = time.time()
+            block_info = self.client.showBlock(block_hash_base16, full_view=True)
+            with self._lock, self._db:
+                self._store_blocks([block_info], fetched_at)
+        return full_view and block_info or _basic_block_info(block_info)
+
+    @api
+    def showDeploys(self, block_hash_base16: str, full_view=True):
+        """
+        Get the processed deploys within a block, see CasperLabsClient.showDeploys.
+        Deploys of a block are fetched from the node once.
+
+        :return:  Generator of processed deploy objects.
+        """
+        with self._lock:
+            row = self._block_row(block_hash_base16)
+            block_hash = row and row[0] or block_hash_base16.lower()
+            stored = self._db.execute(
+                "SELECT 1 FROM deploy_lists WHERE block_hash = ?", (block_hash,)
+            ).fetchone()
+        if not stored:
+            if not _is_full_hash(block_hash):
+                # Unknown prefix, the deploys can't be stored under the block's hash.
+                yield from self.client.showDeploys(block_hash, full_view=full_view)
+                return
+            self._store_deploys(block_hash)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT processed_deploy FROM deploys WHERE block_hash = ?"
+                " ORDER BY position",
+                (block_hash,),
+            ).fetchall()
+        for (data,) in rows:
+            processed_deploy = consensus.Block.ProcessedDeploy.FromString(data)
+            yield full_view and processed_deploy or _basic_processed_deploy(
+                processed_deploy
+            )
+
+    def _store_deploys(self, block_hash: str):
+        rows = [
+            (block_hash, i, d.deploy.deploy_hash.hex(), d.SerializeToString())
+            for i, d in enumerate(self.client.showDeploys(block_hash, full_view=True))
+        ]
+        with self._lock, self._db:
+            self._db.executemany("REPLACE INTO deploys VALUES (?, ?, ?, ?)", rows)
+            self._db.execute("REPLACE INTO deploy_lists VALUES (?)", (block_hash,))
+
+    def _hashes(self, query: str, block_hash_base16: str) -> list:
+        with self._lock:
+            return [h for (h,) in self._db.execute(query, (block_hash_base16.lower(),))]
+
+    def parents(self, block_hash_base16: str) -> list:
+        """
+        :return:  Base16 encoded hashes of the parents of a stored block.
+        """
+        return self._hashes(
+            "SELECT parent_hash FROM parents WHERE block_hash = ?", block_hash_base16
+        )
+
+    def children(self, block_hash_base16: str) -> list:
+        """
+        :return:  Base16 encoded hashes of the stored blocks that have the block as a parent.
+        """
+        return self._hashes(
+            "SELECT block_hash FROM parents WHERE parent_hash = ?", block_hash_base16
+        )
+
+    def justified_by(self, block_hash_base16: str) -> list:
+        """
+        :return:  Base16 encoded hashes of the stored blocks that cite the block
+                  in their justifications.
+        """
+        return self._hashes(
+            "SELECT block_hash FROM justifications WHERE latest_block_hash = ?",
+            block_hash_base16,
+        )
+
+    def blocks_with_deploy(self, deploy_hash_base16: str) -> list:
+        """
+        :return:  Base16 encoded hashes of the blocks with the deploy,
+                  among those whose deploys have been stored.
+        """
+        return self._hashes(
+            "SELECT block_hash FROM deploys WHERE deploy_hash = ?", deploy_hash_base16
+        )
@@ -0,0 +1,279 @@
+"""
+Tracking of inclusion of deploys in blocks.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from .casperlabs_client import InternalError, _LazyModule, casper, grpc, info
+
+logging = _LazyModule("logging")
+
+# Hashes are bytes, like deploy_hash returned by CasperLabsClient.deploy.
+DeployInclusion = namedtuple(
+    "DeployInclusion",
+    ["deploy_hash", "block_hash", "cost", "is_error", "error_message"],
+)
+
+
+class _Pending:
+    __slots__ = ("future", "deadline", "next_poll", "interval")
+
+    def __init__(self, future, deadline, next_poll, interval):
+        self.future = future
+        self.deadline = deadline
+        self.next_poll = next_poll
+        self.interval = interval
+
+
+class DeployTracker:
+    """
+    Waits for inclusion of many deploys in blocks at once.
+
+    A watcher thread follows new blocks of the DAG (see follow_blocks)
+    and reads deploys of each block once for all tracked deploys.
+    Deploys that it misses, e.g. because they were included before they
+    were tracked, are found by a poller thread, which asks the node
+    for deploys that have been pending for a while with GetDeployInfo,
+    many at a time. The interval between polls of a deploy doubles up to
+    max_poll_interval.
+
+        with DeployTracker(client) as tracker:
+            futures = [tracker.track(client.deploy(**kwargs)[1]) for kwargs in specs]
+            for future in concurrent.futures.as_completed(futures):
+                inclusion = future.result()
+                print(inclusion.block_hash.hex(), inclusion.cost, inclusion.is_error)
+
+    Threads run only while there are deploys being tracked.
+    """
+
+    def __init__(
+        self,
+        client,
+        poll_interval: float = 5.0,
+        max_poll_interval: float = 60.0,
+        batch_size: int = 100,
+        depth: int = 1,
+    ):
+        """
+        :param client:             CasperLabsClient.
+        :param poll_interval:      Time after which a deploy that hasn't been found
+                                   in new blocks is polled for the first time, in seconds.
+        :param max_poll_interval:  Maximum interval between polls of a deploy, in seconds.
+        :param batch_size:         Maximum number of GetDeployInfo requests in flight.
+        :param depth:              Number of the top ranks of the DAG the watcher reads
+                                   when it starts.
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.batch_size = batch_size
+        self.depth = depth
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._watch, daemon=True),
+            threading.Thread(target=self._poll, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """
+        Stop the threads. Futures of deploys that are still pending are cancelled.
+        """
+        with self._lock:
+            self._closed = True
+            self._stop.set()
+            pending, self._pending = self._pending, {}
+            self._changed.notify_all()
+        for p in pending.values():
+            p.future.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def track(self, deploy_hash, callback=None, timeout: float = None) -> Future:
+        """
+        Start tracking a deploy.
+
+        :param deploy_hash:  Hash of the deploy, bytes or base16 encoded.
+        :param callback:     Function called with the future when it is done.
+        :param timeout:      Time in seconds after which the future fails
+                             with InternalError if the deploy hasn't been found.
+        :return:             concurrent.futures.Future of DeployInclusion.
+                             Cancelling it stops tracking of the deploy.
+        """
+        if isinstance(deploy_hash, str):
+            deploy_hash = bytes.fromhex(deploy_hash)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                raise InternalError("track", "DeployTracker is closed")
+            p = self._pending.get(deploy_hash)
+            if p is None:
+                p = self._pending[deploy_hash] = _Pending(
+                    Future(),
+                    timeout is not None and now + timeout or None,
+                    now + self.poll_interval,
+                    self.poll_interval,
+                )
+                p.future.add_done_callback(
+                    lambda f: f.cancelled() and self._forget(deploy_hash, f)
+                )
+                self._changed.notify_all()
+        if callback:
+            p.future.add_done_callback(callback)
+        return p.future
+
+    def track_many(self, deploy_hashes, callback=None, timeout: float = None) -> dict:
+        """
+        Start tracking many deploys, see track.
+
+        :return:  Dictionary of futures keyed by the deploy hashes.
+        """
+        return {h: self.track(h, callback, timeout) for h in deploy_hashes}
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of deploys that haven't been found yet.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def _forget(self, deploy_hash: bytes, future: Future):
+        with self._lock:
+            p = self._pending.get(deploy_hash)
+            if p and p.future is future:
+                del self._pending[deploy_hash]
+
+    def _resolve(self, inclusion):
+        with self._lock:
+            p = self._pending.pop(inclusion.deploy_hash, None)
+        # Futures cancelled by the caller can't be resolved.
+        if p and p.future.set_running_or_notify_cancel():
+            p.future.set_result(inclusion)
+
+    def _wait_for_deploys(self) -> bool:
+        with self._lock:
+            while not self._pending and not self._closed:
+                self._changed.wait()
+            return not self._closed
+
+    def _watch(self):
+        """
+        Read deploys of new blocks.
+        """
+        while self._wait_for_deploys():
+            try:
+                for block_info in self.client.follow_blocks(
+                    depth=self.depth, full_view=False, stop=self._stop
+                ):
+                    summary = block_info.summary
+                    if summary.header.deploy_count:
+                        for d in self.client.showDeploys(
+                            summary.block_hash.hex(), full_view=False
+                        ):
+                            if d.deploy.deploy_hash in self._pending:
+                                self._resolve(
+                                    DeployInclusion(
+                                        d.deploy.deploy_hash,
+                                        summary.block_hash,
+                                        d.cost,
+                                        d.is_error,
+                                        d.error_message,
+                                    )
+                                )
+                    if not self._pending:
+                        # Start from the tip again when there are new deploys.
+                        break
+            except Exception as e:
+                logging.warning(f"DeployTracker failed to read new blocks: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _due(self) -> list:
+        """
+        Wait for deploys that should be polled, fail those that timed out.
+        """
+        with self._lock:
+            while not self._closed:
+                now = time.time()
+                timed_out = [
+                    (h, p)
+                    for h, p in self._pending.items()
+                    if p.deadline is not None and p.deadline <= now
+                ]
+                for h, _ in timed_out:
+                    del self._pending[h]
+                due = [(h, p) for h, p in self._pending.items() if p.next_poll <= now][
+                    : self.batch_size
+                ]
+                if timed_out or due:
+                    break
+                wait_until = min(
+                    (
+                        min(p.next_poll, p.deadline or p.next_poll)
+                        for p in self._pending.values()
+                    ),
+                    default=None,
+                )
+                self._changed.wait(wait_until and wait_until - now)
+            else:
+                return []
+        for h, p in timed_out:
+            if p.future.set_running_or_notify_cancel():
+                p.future.set_exception(
+                    InternalError("track", f"Deploy {h.hex()} not found in time")
+                )
+        return due
+
+    def _poll(self):
+        """
+        Ask the node for deploys that haven't been found in new blocks.
+        """
+        while not self._closed:
+            due = self._due()
+            requests = [
+                (
+                    h,
+                    p,
+                    self.client.casperService.GetDeployInfo_future(
+                        casper.GetDeployInfoRequest(
+                            deploy_hash_base16=h.hex(),
+                            view=info.DeployInfo.View.BASIC,
+                        )
+                    ),
+                )
+                for h, p in due
+            ]
+            for h, p, request in requests:
+                try:
+                    results = request.result().processing_results
+                except grpc.RpcError as e:
+                    # The node may not have the deploy yet.
+                    if e.code() != grpc.StatusCode.NOT_FOUND:
+                        logging.warning(f"DeployTracker failed to poll {h.hex()}: {e}")
+                    results = []
+                if results:
+                    r = results[0]
+                    self._resolve(
+                        DeployInclusion(
+                            h,
+                            r.block_info.summary.block_hash,
+                            r.cost,
+                            r.is_error,
+                            r.error_message,
+                        )
+                    )
+                else:
+                    with self._lock:
+                        p.interval = min(p.interval * 2, self.max_poll_interval)
+                        p.next_poll = time.time() + p.interval
@@ -0,0 +1,161 @@
+"""
+DAG visualization in DOT format, generated rank by rank.
+"""
+import bisect
+import itertools
+
+TAB = "  "
+
+HEADER = """digraph "dag" {
+  rankdir=BT
+  node [width=0 height=0 margin=0.03 fontsize=8]
+  splines=false
+"""
+
+
+def _short(hash: bytes) -> str:
+    s = hash.hex()
+    return s if len(s) <= 10 else s[:10] + "..."
+
+
+def _node(name: str, style: str = None) -> str:
+    attrs = style and f"style={style} shape=box" or "shape=box"
+    return f'"{name}" [{attrs}]'
+
+
+def _edge(src: str, dst: str, attrs: str) -> str:
+    return f'"{src}" -> "{dst}" [{attrs}]'
+
+
+class GraphzGenerator:
+    """
+    Generates DOT of the DAG in the same format as the Scala client's
+    GraphzGenerator: blocks of each validator are in a separate cluster,
+    with invisible placeholders at ranks where the validator has no block,
+    edges to main parents are bold and justifications are dotted lines.
+
+    The graph is generated from a stream of block infos going from the tip
+    backwards, as StreamBlockInfos returns them, one rank at a time.
+    Only nodes of the last rank are kept in memory, so DAGs of any depth
+    can be drawn. Clusters of validators are reopened in each rank, DOT
+    merges subgraphs with the same name. Validators are taken from bonds
+    of the newest block; validators found only in older blocks get clusters
+    from their newest block on.
+
+    DOT of each rank is kept until the next call of generate and reused
+    if the rank hasn't changed, so redrawing a DAG that grows is cheap.
+    """
+
+    def __init__(self, show_justification_lines: bool = False):
+        self.show_justification_lines = show_justification_lines
+        self._fragments = {}
+
+    def generate(self, block_infos):
+        """
+        :param block_infos:  Iterable of block infos, ordered by rank, from the newest.
+        :return:             Generator of parts of the DOT text.
+        """
+        validators = None
+        # Validator => name of its node in the previous (newer) rank.
+        newer = {}
+        finalized = None
+        oldest = []
+        fragments = {}
+
+        yield HEADER
+        for rank, infos in itertools.groupby(
+            block_infos, key=lambda b: b.summary.header.rank
+        ):
+            infos = list(infos)
+            if validators is None:
+                validators = sorted(
+                    _short(bond.validator_public_key)
+                    for bond in infos[0].summary.header.state.bonds
+                )
+            # The newest block with positive fault tolerance is drawn filled.
+            rank_finalized = None
+            blocks = {}
+            for info in infos:
+                validator = _short(info.summary.header.validator_public_key)
+                blocks[validator] = info.summary
+                if validator not in validators:
+                    bisect.insort(validators, validator)
+                if finalized is None and info.status.fault_tolerance > 0:
+                    finalized = rank_finalized = _short(info.summary.block_hash)
+
+            key = (
+                rank,
+                tuple(info.summary.block_hash for info in infos),
+                rank_finalized,
+                tuple((v, newer.get(v)) for v in validators),
+            )
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                fragment = self._rank(
+                    rank, infos, blocks, validators, newer, rank_finalized
+                )
+            fragments[key] = fragment
+            yield fragment
+
+            newer = {
+                v: _short(blocks[v].block_hash) if v in blocks else f"{rank}_{v}"
+                for v in validators
+            }
+            oldest = infos
+
+        yield self._ancestors(oldest, validators or [], newer, finalized)
+        yield "}\n"
+        self._fragments = fragments
+
+    def _rank(self, rank, infos, blocks, validators, newer, finalized) -> str:
+        lines = []
+        for v in validators:
+            if v in blocks:
+                name = _short(blocks[v].block_hash)
+                style = name == finalized and "filled" or None
+            else:
+                name, style = f"{rank}_{v}", "invis"
+            lines.append(f'{TAB}subgraph "cluster_{v}" {{')
+            lines.append(f'{TAB}{TAB}label = "{v}"')
+            lines.append(TAB + TAB + _node(name, style))
+            if v in newer:
+                lines.append(TAB + TAB + _edge(name, newer[v], "style=invis"))
+            lines.append(TAB + "}")
+
+        for info in infos:
+            block_hash = _short(info.summary.block_hash)
+            header = info.summary.header
+            for i, parent in enumerate(header.parent_hashes):
+                # Edge to the main parent is bold.
+                attrs = i == 0 and "style=bold constraint=false" or "constraint=false"
+                lines.append(TAB + _edge(block_hash, _short(parent), attrs))
+            if self.show_justification_lines:
+                for j in sorted(
+                    {_short(j.latest_block_hash) for j in header.justifications}
+                ):
+                    lines.append(
+                        TAB
+                        + _edge(
+                            block_hash,
+                            j,
+                            "style=dotted constraint=false arrowhead=none",
+                        )
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _ancestors(self, oldest, validators, newer, finalized) -> str:
+        """
+        Parents of the blocks of the oldest rank, connected to the first node
+        of each cluster for proper alignment.
+        """
+        ancestors = sorted(
+            {_short(p) for info in oldest for p in info.summary.header.parent_hashes}
+        )
+        lines = [TAB + _node(a, a == finalized and "filled" or None) for a in ancestors]
+        lines.extend(
+            TAB + _edge(a, newer[v], "style=invis")
+            for v in validators
+            for a in ancestors
+            if v in newer
+        )
+        return "".join(line + "\n" for line in lines)
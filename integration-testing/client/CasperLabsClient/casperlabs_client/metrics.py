@@ -0,0 +1,313 @@
+"""
+Client-side metrics of gRPC calls, collected by interceptors of the channels.
+"""
+import bisect
+import functools
+import threading
+import time
+from collections import namedtuple
+
+# Buckets of histograms, the same as the node's Prometheus reporter uses
+# (Kamon's defaults) for time in seconds and information in bytes.
+TIME_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1,
+    2.5,
+    5,
+    7.5,
+    10,
+)
+INFORMATION_BUCKETS = (512, 1024, 2048, 4096, 16384, 65536, 524288, 1048576)
+
+# Statistics of one call, passed to listeners of ClientMetrics. Method is the full
+# gRPC method name, status the name of its status code, latency is in seconds.
+# Items is the number of objects received from a stream, 1 for unary calls.
+CallStats = namedtuple(
+    "CallStats",
+    [
+        "node",
+        "method",
+        "status",
+        "latency",
+        "request_bytes",
+        "response_bytes",
+        "items",
+    ],
+)
+
+
+def _format(value) -> str:
+    # Same format as the node's: at least one decimal digit, at most nine.
+    s = f"{value:.9f}".rstrip("0")
+    return s + "0" if s.endswith(".") else s
+
+
+def _labels(labels) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last count is of values above the highest bucket.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def prometheus(self, name: str, labels: tuple) -> str:
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = labels + (("le", str(float(bucket))),)
+            lines.append(f"{name}_bucket{_labels(le)} {_format(cumulative)}")
+        le = labels + (("le", "+Inf"),)
+        lines.append(f"{name}_bucket{_labels(le)} {_format(self.count)}")
+        lines.append(f"{name}_count{_labels(labels)} {_format(self.count)}")
+        lines.append(f"{name}_sum{_labels(labels)} {_format(self.sum)}")
+        return "".join(line + "\n" for line in lines)
+
+
+class ClientMetrics:
+    """
+    Metrics of the gRPC calls of clients: numbers of calls by status code,
+    histograms of latencies and of sizes of requests and responses, and numbers
+    of objects received from streams, all by node and method.
+
+    Pass it to CasperLabsClient to instrument all its channels:
+
+        metrics = ClientMetrics()
+        client = CasperLabsClient(host, metrics=metrics)
+        ...
+        print(metrics.prometheus())
+
+    Listeners added with add_listener are called with CallStats of each call
+    as soon as it is complete, in the thread that completes it.
+    """
+
+    def __init__(
+        self, time_buckets=TIME_BUCKETS, information_buckets=INFORMATION_BUCKETS
+    ):
+        self.time_buckets = time_buckets
+        self.information_buckets = information_buckets
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._calls = {}
+        self._latency = {}
+        self._request_bytes = {}
+        self._response_bytes = {}
+        self._items = {}
+
+    def add_listener(self, listener):
+        """
+        :param listener:  Function called with CallStats of each call.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def interceptor(self, node: str):
+        """
+        Return an interceptor of channels to the node (host:port) for grpc.intercept_channel.
+        """
+        return _interceptor_class()(self, node)
+
+    def record(self, stats: CallStats):
+        service, _, method = stats.method.rpartition("/")
+        labels = (
+            ("node", stats.node),
+            ("service", service.rpartition(".")[2]),
+            ("method", method),
+        )
+        with self._lock:
+            key = labels + (("status", stats.status),)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            for histograms, buckets, value in (
+                (self._latency, self.time_buckets, stats.latency),
+                (self._request_bytes, self.information_buckets, stats.request_bytes),
+                (self._response_bytes, self.information_buckets, stats.response_bytes),
+            ):
+                h = histograms.get(labels)
+                if h is None:
+                    h = histograms[labels] = Histogram(buckets)
+                h.observe(value)
+            self._items[labels] = self._items.get(labels, 0) + stats.items
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(stats)
+            except Exception:
+                import logging
+
+                logging.exception("ClientMetrics listener failed")
+
+    def prometheus(self) -> str:
+        """
+        Return the metrics in Prometheus text format, like the node's
+        /metrics endpoint (with the --metrics-prometheus option).
+        """
+        parts = []
+        with self._lock:
+            for name, counters in (
+                ("casperlabs_client_rpc_calls_total", self._calls),
+                ("casperlabs_client_rpc_stream_items_total", self._items),
+            ):
+                parts.append(f"# TYPE {name} counter\n")
+                parts.extend(
+                    f"{name}{_labels(labels)} {_format(value)}\n"
+                    for labels, value in sorted(counters.items())
+                )
+            for name, histograms in (
+                ("casperlabs_client_rpc_latency_seconds", self._latency),
+                ("casperlabs_client_rpc_request_size_bytes", self._request_bytes),
+                ("casperlabs_client_rpc_response_size_bytes", self._response_bytes),
+            ):
+                parts.append(f"# TYPE {name} histogram\n")
+                parts.extend(
+                    h.prometheus(name, labels)
+                    for labels, h in sorted(histograms.items())
+                )
+        return "".join(parts)
+
+
+class _Call:
+    """
+    Statistics of a call that is in progress. They are recorded when gRPC reports
+    that the call is done and, for successful streams, once the responses have
+    been read or the reader has dropped the stream.
+    """
+
+    def __init__(self, metrics, node, method, request, stream: bool):
+        self.metrics = metrics
+        self.node = node
+        self.method = method if isinstance(method, str) else method.decode()
+        self.stream = stream
+        self.start = time.time()
+        self.request_bytes = request.ByteSize()
+        self.response_bytes = 0
+        self.items = 0
+        self.latency = None
+        self.status = None
+        self._pending = 2 if stream else 1
+        self._read = False
+        self._lock = threading.Lock()
+
+    def item(self, response):
+        self.items += 1
+        self.response_bytes += response.ByteSize()
+
+    def done(self, call):
+        self.latency = time.time() - self.start
+        code = call.code()
+        self.status = code is not None and code.name or "UNKNOWN"
+        if self.status != "OK":
+            # There is nothing more to read.
+            self._complete(self._pending)
+            return
+        if not self.stream:
+            self.item(call.result())
+        self._complete(1)
+
+    def read(self):
+        if not self._read:
+            self._read = True
+            self._complete(1)
+
+    def _complete(self, n: int):
+        with self._lock:
+            if self._pending <= 0:
+                return
+            self._pending -= n
+            if self._pending > 0:
+                return
+        self.metrics.record(
+            CallStats(
+                self.node,
+                self.method,
+                self.status,
+                self.latency,
+                self.request_bytes,
+                self.response_bytes,
+                self.items,
+            )
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _interceptor_class():
+    # gRPC is imported only when channels are made, see _LazyModule.
+    import grpc
+
+    class Responses:
+        """
+        Responses of a stream, counted as they are read.
+        Otherwise the same as the call object returned by gRPC.
+        """
+
+        def __init__(self, responses, call):
+            self._responses = responses
+            self._call = call
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            try:
+                response = next(self._responses)
+            except StopIteration:
+                self._call.read()
+                raise
+            except grpc.RpcError:
+                self._call.read()
+                raise
+            self._call.item(response)
+            return response
+
+        def __getattr__(self, name):
+            return getattr(self._responses, name)
+
+        def __del__(self):
+            self._call.read()
+
+    class Interceptor(
+        grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor
+    ):
+        def __init__(self, metrics, node):
+            self.metrics = metrics
+            self.node = node
+
+        def intercept_unary_unary(self, continuation, client_call_details, request):
+            call = _Call(
+                self.metrics, self.node, client_call_details.method, request, False
+            )
+            outcome = continuation(client_call_details, request)
+            outcome.add_done_callback(call.done)
+            return outcome
+
+        def intercept_unary_stream(self, continuation, client_call_details, request):
+            call = _Call(
+                self.metrics, self.node, client_call_details.method, request, True
+            )
+            responses = continuation(client_call_details, request)
+            responses.add_done_callback(call.done)
+            return Responses(responses, call)
+
+    return Interceptor
@@ -0,0 +1,368 @@
+"""
+Client of many nodes, routing reads to the fastest healthy node.
+"""
+import functools
+import itertools
+import threading
+import time
+
+from .casperlabs_client import (
+    DEFAULT_INTERNAL_PORT,
+    DEFAULT_PORT,
+    CasperLabsClient,
+    grpc,
+)
+
+# Status codes of failures that show that a node is down or overloaded,
+# rather than that the request was wrong.
+NODE_FAILURE_CODES = frozenset(("UNAVAILABLE", "DEADLINE_EXCEEDED"))
+
+
+def _parse_endpoint(endpoint, node_id=None) -> tuple:
+    """
+    :param endpoint:  "host", "host:port" or "host:port:internal_port",
+                      or a tuple (host, port, internal_port, node_id)
+                      of which only the host is required.
+    :return:          Tuple (host, port, internal_port, node_id).
+    """
+    parts = endpoint.split(":") if isinstance(endpoint, str) else list(endpoint)
+    if not 1 <= len(parts) <= 4:
+        raise ValueError(f"Invalid node endpoint: {endpoint}")
+    defaults = [None, DEFAULT_PORT, DEFAULT_INTERNAL_PORT, node_id]
+    host, port, internal_port, node_id = parts + defaults[len(parts) :]
+    return host, int(port), int(internal_port), node_id
+
+
+def _node_failure(error) -> bool:
+    return isinstance(error, grpc.RpcError) and error.code().name in NODE_FAILURE_CODES
+
+
+class Node:
+    """
+    One of the nodes of a MultiNodeCasperLabsClient, with statistics of calls to it.
+    """
+
+    def __init__(self, host, port, internal_port, casperService, controlService):
+        self.host = host
+        self.port = port
+        self.internal_port = internal_port
+        self.casperService = casperService
+        self.controlService = controlService
+        # EWMA of latencies of the node's responses in seconds, None until measured.
+        self.latency = None
+        self.inflight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def load(self) -> float:
+        # Calls in flight make the node look slower, so that concurrent
+        # reads are spread over the fastest nodes.
+        return (self.latency or 0.0) * (self.inflight + 1)
+
+    def stats(self, now: float) -> dict:
+        return {
+            "address": self.address,
+            "latency": self.latency,
+            "inflight": self.inflight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "ejected": self.ejected_until > now,
+        }
+
+
+class NodeRouter:
+    """
+    Chooses nodes for calls and keeps their statistics.
+
+    Reads go to the healthy node with the lowest load: the EWMA of its latency
+    multiplied by the number of its calls in flight. Nodes whose latency
+    hasn't been measured yet are tried first.
+
+    A node that fails max_failures times in a row (with UNAVAILABLE or
+    DEADLINE_EXCEEDED) is ejected for eject_time seconds. After that, calls
+    probe it one at a time; each failed probe ejects it for twice as long,
+    up to max_eject_time, and the first success brings it back. Reads that fail
+    that way are retried on the next node, writes only if the node was
+    UNAVAILABLE, as the request may have been processed otherwise.
+    """
+
+    def __init__(
+        self,
+        nodes: list,
+        write_node: Node = None,
+        alpha: float = 0.3,
+        max_failures: int = 3,
+        eject_time: float = 5.0,
+        max_eject_time: float = 60.0,
+    ):
+        self.nodes = nodes
+        self.write_node = write_node
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _available(self, node: Node, now: float) -> bool:
+        if node.consecutive_failures < self.max_failures:
+            return True
+        return node.ejected_until <= now and node.inflight == 0
+
+    def select(self, write: bool = False, exclude=()) -> Node:
+        """
+        Choose the node for the next call and count the call as in flight.
+        """
+        with self._lock:
+            if write and self.write_node is not None:
+                node = self.write_node
+            else:
+                now = time.time()
+                candidates = [n for n in self.nodes if n not in exclude]
+                available = [n for n in candidates if self._available(n, now)]
+                if not available:
+                    # All nodes are failing, try the one that is due to be probed first.
+                    available = [min(candidates, key=lambda n: n.ejected_until)]
+                if write:
+                    node = available[next(self._counter) % len(available)]
+                else:
+                    node = min(available, key=Node.load)
+            node.inflight += 1
+            return node
+
+    def record(self, node: Node, latency: float = None, error=None):
+        """
+        Record the outcome of a call selected with select.
+        """
+        with self._lock:
+            node.inflight -= 1
+            node.calls += 1
+            if _node_failure(error):
+                node.failures += 1
+                node.consecutive_failures += 1
+                ejections = node.consecutive_failures - self.max_failures
+                if ejections >= 0:
+                    node.ejected_until = time.time() + min(
+                        self.eject_time * 2 ** ejections, self.max_eject_time
+                    )
+                return
+            node.consecutive_failures = 0
+            if latency is not None:
+                node.latency = (
+                    latency
+                    if node.latency is None
+                    else node.latency + self.alpha * (latency - node.latency)
+                )
+
+    def _fails_over(self, error, write: bool, tried: list) -> bool:
+        if len(tried) >= len(self.nodes) or (write and self.write_node is not None):
+            return False
+        if write:
+            return error.code().name == "UNAVAILABLE"
+        return _node_failure(error)
+
+    def call(self, service: str, method: str, write: bool, request):
+        tried = []
+        while True:
+            node = self.select(write, tried)
+            start = time.time()
+            try:
+                response = getattr(getattr(node, service), method)(request)
+            except grpc.RpcError as e:
+                self.record(node, error=e)
+                tried.append(node)
+                if not self._fails_over(e, write, tried):
+                    raise
+                continue
+            except BaseException:
+                self.record(node)
+                raise
+            self.record(node, time.time() - start)
+            return response
+
+    def stream(self, service: str, method: str, write: bool, request):
+        tried = []
+        while True:
+            node = self.select(write, tried)
+            start = time.time()
+            recorded = False
+            try:
+                for response in getattr(getattr(node, service), method + "_stream")(
+                    request
+                ):
+                    # Latency of a stream is the time to its first object.
+                    if not recorded:
+                        recorded = True
+                        self.record(node, time.time() - start)
+                    yield response
+                return
+            except grpc.RpcError as e:
+                # Objects received already can't be taken back.
+                if recorded:
+                    raise
+                recorded = True
+                self.record(node, error=e)
+                tried.append(node)
+                if not self._fails_over(e, write, tried):
+                    raise
+            finally:
+                if not recorded:
+                    self.record(node, time.time() - start)
+
+    def future(self, service: str, method: str, write: bool, request):
+        node = self.select(write)
+        start = time.time()
+        try:
+            future = getattr(getattr(node, service), method + "_future")(request)
+        except BaseException:
+            self.record(node)
+            raise
+        future.add_done_callback(functools.partial(self._done, node, start))
+        return future
+
+    def _done(self, node: Node, start: float, future):
+        if future.cancelled():
+            self.record(node)
+        elif future.exception() is not None:
+            self.record(node, error=future.exception())
+        else:
+            self.record(node, time.time() - start)
+
+    def stats(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [node.stats(now) for node in self.nodes]
+
+
+class RoutedGRPCService:
+    """
+    Calls methods of a gRPC service of the nodes of a NodeRouter,
+    with the same interface as GRPCService.
+    """
+
+    def __init__(self, router: NodeRouter, service: str, writes=()):
+        """
+        :param router:   NodeRouter.
+        :param service:  Name of the service attribute of Node.
+        :param writes:   Names of the methods that change the state of the node.
+        """
+        self.router = router
+        self.service = service
+        self.writes = frozenset(writes)
+
+    def __getattr__(self, name):
+        if name.endswith("_stream"):
+            method, call = name[: -len("_stream")], self.router.stream
+        elif name.endswith("_future"):
+            method, call = name[: -len("_future")], self.router.future
+        else:
+            method, call = name, self.router.call
+        return functools.partial(call, self.service, method, method in self.writes)
+
+
+class MultiNodeCasperLabsClient(CasperLabsClient):
+    """
+    CasperLabsClient of many nodes, with the same API.
+
+    Reads are routed to the fastest healthy node, see NodeRouter.
+    Deploys and proposals go to write_node if it is given, otherwise
+    they are spread over the healthy nodes in a round-robin fashion.
+
+        client = MultiNodeCasperLabsClient(["node-0", "node-1:40401:40402", "node-2"])
+        for block_info in client.showBlocks(depth=10):
+            ...
+        print(client.node_stats())
+    """
+
+    def __init__(
+        self,
+        nodes: list,
+        node_id: str = None,
+        certificate_file: str = None,
+        pool_size: int = 1,
+        connect_timeout: float = None,
+        cache_size: int = 0,
+        cache_ttl: float = None,
+        policies: dict = None,
+        metrics=None,
+        write_node=None,
+        alpha: float = 0.3,
+        max_failures: int = 3,
+        eject_time: float = 5.0,
+        max_eject_time: float = 60.0,
+        contract_registry=None,
+    ):
+        """
+        :param nodes:           Endpoints of the nodes: "host", "host:port",
+                                "host:port:internal_port" or tuples
+                                (host, port, internal_port, node_id).
+        :param node_id:         node_id of nodes whose endpoints don't give one,
+                                for gRPC encryption
+        :param write_node:      Index of the node, or its "host:port" address,
+                                that receives all deploys and proposals.
+        :param alpha:           Weight of the newest latency in the EWMA of latencies.
+        :param max_failures:    Number of failures in a row after which a node is ejected.
+        :param eject_time:      Number of seconds for which a node is ejected the first time.
+        :param max_eject_time:  Maximum number of seconds for which a node is ejected.
+
+        Other parameters are the same as those of CasperLabsClient.
+        """
+        endpoints = [_parse_endpoint(e, node_id) for e in nodes]
+        if not endpoints:
+            raise ValueError("At least one node is required")
+        host, port, internal_port, node_id = endpoints[0]
+        super().__init__(
+            host,
+            port,
+            internal_port,
+            node_id,
+            certificate_file,
+            pool_size,
+            connect_timeout,
+            cache_size,
+            cache_ttl,
+            policies,
+            metrics,
+            contract_registry,
+        )
+        self.nodes = [
+            Node(
+                host,
+                port,
+                internal_port,
+                *self._services(
+                    host, port, internal_port, node_id, certificate_file, policies
+                ),
+            )
+            for host, port, internal_port, node_id in endpoints
+        ]
+        if isinstance(write_node, str):
+            write_node = [n.address for n in self.nodes].index(write_node)
+        self.router = NodeRouter(
+            self.nodes,
+            None if write_node is None else self.nodes[write_node],
+            alpha,
+            max_failures,
+            eject_time,
+            max_eject_time,
+        )
+        self.casperService = RoutedGRPCService(
+            self.router, "casperService", writes=("Deploy",)
+        )
+        self.controlService = RoutedGRPCService(
+            self.router, "controlService", writes=("Propose",)
+        )
+
+    def node_stats(self) -> list:
+        """
+        Return statistics of the nodes: address, EWMA of latency in seconds
+        (None if not measured yet), number of calls in flight, number of calls,
+        number of failures, and whether the node is ejected.
+        """
+        return self.router.stats()
@@ -0,0 +1,197 @@
+"""
+Timing of the phases of client operations, see Profiler.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Phases timed by the client, in the order in which they are reported.
+PHASES = (
+    "encode args",
+    "read wasm",
+    "read keys",
+    "serialize",
+    "hash",
+    "sign",
+    "rpc",
+    "format",
+)
+
+# Profiler receiving times of phases, None when profiling is off.
+_profiler = None
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "calls", "start", "children")
+
+    def __init__(self, profiler, name: str, calls: int = 1):
+        self.profiler = profiler
+        self.name = name
+        self.calls = calls
+
+    def __enter__(self):
+        self.children = 0.0
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        self.profiler.add(self.name, elapsed - self.children, self.calls)
+
+
+def phase(name: str, calls: int = 1):
+    """
+    Context manager that times a phase, if a Profiler is active.
+    Time spent in phases nested in it is not counted in it.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _NO_PHASE
+    return _Phase(profiler, name, calls)
+
+
+def timed(iterable, name: str):
+    """
+    Time taken to get items of iterable (e.g. a stream of responses) as a phase.
+    """
+    if _profiler is None:
+        return iterable
+    return _timed(iter(iterable), name)
+
+
+def _timed(iterator, name: str):
+    calls = 1
+    while True:
+        with phase(name, calls):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        calls = 0
+        yield item
+
+
+def timed_future(future, name: str):
+    """
+    Time from now until future is done as a phase.
+    """
+    profiler = _profiler
+    if profiler is not None:
+        start = time.perf_counter()
+        future.add_done_callback(
+            lambda _: profiler.add(name, time.perf_counter() - start)
+        )
+    return future
+
+
+class Profiler:
+    """
+    Times phases of client operations: encoding of args, reading of wasm files
+    and keys, serialization, hashing, signing, gRPC calls and formatting of output.
+
+        with Profiler() as profiler:
+            client.deploy(...)
+        print(profiler.table())
+
+    The profiler is active in all threads, times of phases are added up.
+    "other" is the wall clock time not spent in any phase.
+    With cprofile_file, cProfile statistics are written to that file as well.
+    """
+
+    def __init__(self, cprofile_file: str = None):
+        self.cprofile_file = cprofile_file
+        self.total = 0.0
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = None
+        self._previous = None
+        self._cprofile = None
+
+    def __enter__(self):
+        global _profiler
+        self._previous, _profiler = _profiler, self
+        if self.cprofile_file:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _profiler
+        self.total += time.perf_counter() - self._start
+        self._start = None
+        _profiler = self._previous
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_file)
+            self._cprofile = None
+
+    def _stack(self) -> list:
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def add(self, name: str, elapsed: float, calls: int = 1):
+        with self._lock:
+            p = self._phases.get(name)
+            if p is None:
+                self._phases[name] = [calls, elapsed]
+            else:
+                p[0] += calls
+                p[1] += elapsed
+
+    def results(self) -> dict:
+        """
+        :return:  Dictionary with the total time, and number of calls and time
+                  of each phase, in seconds.
+        """
+        total = self.total
+        if self._start is not None:
+            total += time.perf_counter() - self._start
+        with self._lock:
+            phases = {name: list(p) for name, p in self._phases.items()}
+        order = {name: i for i, name in enumerate(PHASES)}
+        names = sorted(phases, key=lambda name: (order.get(name, len(order)), name))
+        other = max(total - sum(p[1] for p in phases.values()), 0.0)
+        results = OrderedDict(
+            (name, {"calls": phases[name][0], "time": phases[name][1]})
+            for name in names
+        )
+        results["other"] = {"calls": 0, "time": other}
+        return {"total": total, "phases": results}
+
+    def json(self) -> str:
+        return json.dumps(self.results())
+
+    def table(self) -> str:
+        results = self.results()
+        total = results["total"]
+        lines = [f"{'phase':<12} {'calls':>7} {'ms':>10} {'%':>6}"]
+        for name, p in results["phases"].items():
+            share = total and 100 * p["time"] / total
+            lines.append(
+                f"{name:<12} {p['calls'] or '':>7} {1000 * p['time']:>10.3f} {share:>6.1f}"
+            )
+        lines.append(f"{'total':<12} {'':>7} {1000 * total:>10.3f} {100.0:>6.1f}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,144 @@
+"""
+Hashing and signing of many deploys in a pool of processes.
+"""
+import collections
+import itertools
+
+from .casperlabs_client import (
+    Signer,
+    _LazyModule,
+    _hash,
+    _serialize,
+    _timestamp,
+    consensus,
+    sign_deploy,
+)
+
+multiprocessing = _LazyModule("multiprocessing")
+
+# Signers of a worker process: the default one and those keyed by account public keys.
+_worker = None
+
+
+def _init_worker(default, keys: dict):
+    global _worker
+    _worker = (
+        default and Signer(*default),
+        {account: Signer(*key) for account, key in keys.items()},
+    )
+
+
+def _sign_chunk(chunk: list) -> list:
+    """
+    Hash and sign serialized deploys. Deploys are passed between processes
+    serialized, as protobuf objects can't be pickled.
+    """
+    default, signers = _worker
+    signed = []
+    for data in chunk:
+        d = consensus.Deploy.FromString(data)
+        signer = signers.get(d.header.account_public_key, default)
+        if signer is None:
+            raise Exception(
+                f"No key to sign deploy of account {d.header.account_public_key.hex()}"
+            )
+        if not d.header.account_public_key:
+            d.header.account_public_key = signer.public_key
+        d.header.body_hash = _hash(_serialize(d.body))
+        d.deploy_hash = _hash(_serialize(d.header))
+        signed.append(_serialize(sign_deploy(d, signer)))
+    return signed
+
+
+def _bounded_map(pool, function, chunks, window: int):
+    """
+    Like pool.imap, but with at most window chunks in flight, so that chunks
+    are taken from the iterable only as fast as the pool processes them.
+
+    :return:  Generator of results of function, in the order of the chunks.
+    """
+    pending = collections.deque()
+    for chunk in chunks:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (chunk,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def _key(signer: Signer) -> tuple:
+    return signer.signing_key.to_seed(), signer.public_key
+
+
+class SigningPool:
+    """
+    Hashes and signs deploys in a pool of processes.
+
+        with SigningPool(KeyRing().load_directory("accounts")) as pool:
+            for deploy in pool.sign(make_deploy(**kwargs) for kwargs in specs):
+                client.send_deploy(deploy)
+
+    Deploys are sent to the processes in chunks, with a bounded number of chunks
+    in flight, so generators of any number of deploys can be signed.
+    Body hash and deploy hash of each deploy are computed from its body and header,
+    so the deploys don't have to be hashed beforehand, the approval is appended
+    to the existing ones like with sign_deploy.
+    """
+
+    def __init__(self, signers, processes: int = None, chunk_size: int = 100):
+        """
+        :param signers:     Signer of all the deploys, or dictionary of signers keyed
+                            by public keys of the accounts whose deploys they sign
+                            (bytes or base16, as returned by KeyRing.load_directory).
+        :param processes:   Number of processes, by default the number of CPUs.
+        :param chunk_size:  Number of deploys sent to a process at a time.
+        """
+        if isinstance(signers, Signer):
+            default, keys = _key(signers), {}
+        else:
+            default = None
+            keys = {
+                isinstance(account, str) and bytes.fromhex(account) or account: _key(s)
+                for account, s in signers.items()
+            }
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        # Processes are spawned, forking a process with open gRPC channels isn't safe.
+        self._pool = multiprocessing.get_context("spawn").Pool(
+            self.processes, _init_worker, (default, keys)
+        )
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _chunks(self, deploys):
+        deploys = iter(deploys)
+        while True:
+            chunk = list(itertools.islice(deploys, self.chunk_size))
+            if not chunk:
+                return
+            for d in chunk:
+                if not d.header.timestamp:
+                    d.header.timestamp = _timestamp()
+            yield [_serialize(d) for d in chunk]
+
+    def sign(self, deploys):
+        """
+        Hash and sign deploys.
+
+        :param deploys:  Iterable of consensus.Deploy objects, it is consumed lazily.
+                         Deploys without timestamp get the current time.
+        :return:         Generator of signed consensus.Deploy objects,
+                         in the same order.
+        """
+        for signed in _bounded_map(
+            self._pool, _sign_chunk, self._chunks(deploys), 2 * self.processes
+        ):
+            yield from map(consensus.Deploy.FromString, signed)
@@ -0,0 +1,253 @@
+"""
+Verification of hashes and signatures of blocks and deploys received from a node.
+"""
+import collections
+import itertools
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .casperlabs_client import _LazyModule, _hash, _serialize, consensus, ed25519
+from .signing import _bounded_map
+
+multiprocessing = _LazyModule("multiprocessing")
+
+# Hash or signature of a block or a deploy that doesn't check out.
+# Kind is "block" or "deploy", hash is the block or deploy hash, block_hash
+# is that of the block in which the deploy was received (None for blocks
+# and for deploys verified on their own), problem describes what is wrong.
+Mismatch = namedtuple("Mismatch", ["kind", "hash", "block_hash", "problem"])
+
+
+def _signature_problem(signature, public_key: bytes, data: bytes, name: str):
+    if signature.sig_algorithm != "ed25519":
+        return f"{name} has unsupported algorithm '{signature.sig_algorithm}'"
+    try:
+        ed25519.VerifyingKey(public_key).verify(signature.sig, data)
+    # Keys of wrong length fail an assertion.
+    except (ed25519.BadSignatureError, AssertionError):
+        return f"{name} is invalid"
+    return None
+
+
+def _hash_problem(name: str, got: bytes, expected: bytes):
+    if got == expected:
+        return None
+    return f"{name} is {got.hex()}, expected {expected.hex()}"
+
+
+def _block_problems(summary) -> list:
+    problems = [
+        _hash_problem(
+            "block hash", summary.block_hash, _hash(_serialize(summary.header))
+        )
+    ]
+    # Genesis is not signed.
+    if summary.header.validator_public_key:
+        problems.append(
+            _signature_problem(
+                summary.signature,
+                summary.header.validator_public_key,
+                summary.block_hash,
+                "signature",
+            )
+        )
+    return problems
+
+
+def _deploy_problems(deploy) -> list:
+    problems = [
+        _hash_problem(
+            "deploy hash", deploy.deploy_hash, _hash(_serialize(deploy.header))
+        )
+    ]
+    # Bodies are left out of the basic view.
+    if deploy.HasField("body"):
+        problems.append(
+            _hash_problem(
+                "body hash", deploy.header.body_hash, _hash(_serialize(deploy.body))
+            )
+        )
+    if not deploy.approvals:
+        problems.append("deploy has no approvals")
+    for approval in deploy.approvals:
+        problems.append(
+            _signature_problem(
+                approval.signature,
+                approval.approver_public_key,
+                deploy.deploy_hash,
+                f"approval of {approval.approver_public_key.hex()}",
+            )
+        )
+    return problems
+
+
+def _verify_batch(batch: list) -> tuple:
+    """
+    Verify a batch of serialized objects: tuples (kind, block_hash, data), see Mismatch.
+    Objects are passed between processes serialized, as protobuf objects
+    can't be pickled.
+
+    :return:  Tuple: (number of approvals, list of Mismatch tuples)
+    """
+    approvals = 0
+    mismatches = []
+    for kind, block_hash, data in batch:
+        if kind == "block":
+            o = consensus.BlockSummary.FromString(data)
+            h, problems = o.block_hash, _block_problems(o)
+        else:
+            o = consensus.Deploy.FromString(data)
+            h, problems = o.deploy_hash, _deploy_problems(o)
+            approvals += len(o.approvals)
+        mismatches.extend(Mismatch(kind, h, block_hash, p) for p in problems if p)
+    return approvals, mismatches
+
+
+class Verifier:
+    """
+    Checks what a node sends: recomputes hashes of blocks (of their headers)
+    and of deploys (of their headers and bodies), the same way as deploy does,
+    and verifies signatures of blocks and approvals of deploys.
+
+        with Verifier(client) as verifier:
+            for mismatch in verifier.verify(depth=1000):
+                print(mismatch)
+            print(verifier.stats())
+
+    Objects are verified in batches in a pool of processes, while deploys of
+    the next blocks are being downloaded by a pool of threads.
+    """
+
+    def __init__(
+        self,
+        client,
+        processes: int = None,
+        batch_size: int = 500,
+        concurrency: int = 4,
+    ):
+        """
+        :param client:       CasperLabsClient.
+        :param processes:    Number of processes verifying objects,
+                             by default the number of CPUs.
+        :param batch_size:   Number of objects sent to a process at a time.
+        :param concurrency:  Number of blocks whose deploys are downloaded
+                             at the same time.
+        """
+        self.client = client
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._counts = collections.Counter()
+        self._time = 0.0
+        # Processes are spawned, forking a process with open gRPC channels isn't safe.
+        self._pool = multiprocessing.get_context("spawn").Pool(self.processes)
+        self._executor = ThreadPoolExecutor(concurrency)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stats(self) -> dict:
+        """
+        Return numbers of blocks, deploys and approvals verified so far, of mismatches
+        found, time spent verifying in seconds and the numbers of objects per second.
+        """
+        stats = dict(
+            blocks=self._counts["blocks"],
+            deploys=self._counts["deploys"],
+            approvals=self._counts["approvals"],
+            mismatches=self._counts["mismatches"],
+            seconds=self._time,
+        )
+        for name in ("blocks", "deploys", "approvals"):
+            stats[f"{name}_per_second"] = self._time and stats[name] / self._time
+        return stats
+
+    def _deploys(self, block_hash: bytes) -> list:
+        return [
+            _serialize(d.deploy)
+            for d in self.client.showDeploys(block_hash.hex(), full_view=True)
+        ]
+
+    def _objects(self, block_infos, deploys: bool):
+        """
+        Serialized block summaries, each followed by its deploys.
+        """
+        pending = collections.deque()
+
+        def flush():
+            summary, future = pending.popleft()
+            yield "block", None, _serialize(summary)
+            for data in future and future.result() or ():
+                yield "deploy", summary.block_hash, data
+
+        for block_info in block_infos:
+            summary = block_info.summary
+            future = (
+                deploys
+                and summary.header.deploy_count
+                and self._executor.submit(self._deploys, summary.block_hash)
+                or None
+            )
+            pending.append((summary, future))
+            if len(pending) > self.concurrency:
+                yield from flush()
+        while pending:
+            yield from flush()
+
+    def _count(self, objects):
+        for kind, block_hash, data in objects:
+            self._counts[kind + "s"] += 1
+            yield kind, block_hash, data
+
+    def _verify(self, objects):
+        objects = self._count(objects)
+        batches = iter(lambda: list(itertools.islice(objects, self.batch_size)), [])
+        start = time.perf_counter()
+        try:
+            for approvals, mismatches in _bounded_map(
+                self._pool, _verify_batch, batches, 2 * self.processes
+            ):
+                self._counts["approvals"] += approvals
+                self._counts["mismatches"] += len(mismatches)
+                yield from mismatches
+        finally:
+            self._time += time.perf_counter() - start
+
+    def verify_blocks(self, block_infos, deploys: bool = True):
+        """
+        Verify blocks and, if deploys is True, the deploys in them.
+
+        :param block_infos:  Iterable of info.BlockInfo objects, e.g. from showBlocks.
+        :param deploys:      Whether to download and verify deploys of the blocks.
+        :return:             Generator of Mismatch objects.
+        """
+        return self._verify(self._objects(block_infos, deploys))
+
+    def verify(self, depth: int, max_rank=0, deploys: bool = True):
+        """
+        Verify blocks of the top ranks of the DAG and their deploys,
+        see showBlocks for description of depth and max_rank.
+
+        :return:  Generator of Mismatch objects.
+        """
+        return self.verify_blocks(
+            self.client.showBlocks(depth, max_rank, full_view=True), deploys
+        )
+
+    def verify_deploys(self, deploys):
+        """
+        Verify deploys, e.g. read from a file with read_deploys.
+
+        :param deploys:  Iterable of consensus.Deploy objects.
+        :return:         Generator of Mismatch objects.
+        """
+        return self._verify(("deploy", None, _serialize(d)) for d in deploys)
@@ -182,6 +182,8 @@ setup(
         "pyblake2==1.1.2",
         "ed25519==1.4",
     ],
+    # AsyncCasperLabsClient is built on grpc.aio.
+    extras_require={"aio": ["grpcio>=1.32"]},
     cmdclass={"install": CInstall, "develop": CDevelop},
     description="Python Client for interacting with a CasperLabs Node",
     long_description=long_description,
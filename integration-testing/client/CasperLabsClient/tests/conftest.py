@@ -0,0 +1,54 @@
+from concurrent import futures
+
+import grpc
+import pytest
+
+from casperlabs_client import casper_pb2_grpc, control_pb2_grpc
+import mock_server
+
+
+@pytest.fixture()
+def casper_servicer():
+    return mock_server.CasperServiceServicer()
+
+
+@pytest.fixture()
+def control_servicer(casper_servicer):
+    return mock_server.ControlServiceServicer(casper_servicer)
+
+
+def _serve(request, casper_servicer, control_servicer):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    casper_pb2_grpc.add_CasperServiceServicer_to_server(casper_servicer, server)
+    control_pb2_grpc.add_ControlServiceServicer_to_server(control_servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    internal_port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    request.addfinalizer(lambda: server.stop(0))
+    return port, internal_port
+
+
+@pytest.fixture()
+def mock_node(request, casper_servicer, control_servicer):
+    """
+    Start CasperService and ControlService mocks on free ports,
+    return (port, internal_port).
+    """
+    return _serve(request, casper_servicer, control_servicer)
+
+
+@pytest.fixture()
+def mock_nodes(request):
+    """
+    Start mocks of two nodes, return a list of
+    (port, internal_port, casper_servicer, control_servicer) of each.
+    """
+    nodes = []
+    for _ in range(2):
+        casper_servicer = mock_server.CasperServiceServicer()
+        control_servicer = mock_server.ControlServiceServicer()
+        nodes.append(
+            _serve(request, casper_servicer, control_servicer)
+            + (casper_servicer, control_servicer)
+        )
+    return nodes
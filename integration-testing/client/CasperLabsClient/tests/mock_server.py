@@ -3,13 +3,21 @@
 Mock gRPC server (node) used in Python client's unit tests suite.
 """
 from concurrent import futures
+import hashlib
 import time
 import grpc
 
+from casperlabs_client import ABI
 from casperlabs_client import CasperMessage_pb2
 from casperlabs_client import CasperMessage_pb2_grpc
+from casperlabs_client import casper_pb2
 from casperlabs_client import casper_pb2_grpc
+from casperlabs_client import control_pb2
+from casperlabs_client import control_pb2_grpc
+from casperlabs_client import consensus_pb2
 from casperlabs_client import empty_pb2
+from casperlabs_client import info_pb2
+from casperlabs_client import state_pb2
 
 CL_GRPC_PORT_EXTERNAL = 3477
 
@@ -58,15 +66,115 @@ digraph "dag" {
 """
 
 
+# Mock DAG is a chain of blocks, one per rank.
+TIP_RANK = 20
+VALIDATOR = b"\x99" * 32
+
+
+def block_hash(rank):
+    return bytes([rank]) * 32
+
+
+def block_info(rank):
+    b = info_pb2.BlockInfo()
+    b.summary.block_hash = block_hash(rank)
+    b.summary.header.rank = rank
+    if rank > 0:
+        b.summary.header.parent_hashes.append(block_hash(rank - 1))
+        b.summary.header.justifications.add(
+            validator_public_key=VALIDATOR, latest_block_hash=block_hash(rank - 1)
+        )
+    return b
+
+
+def processed_deploys(rank):
+    """Two deploys in each block."""
+    for i in range(2):
+        d = consensus_pb2.Block.ProcessedDeploy(cost=i)
+        d.deploy.deploy_hash = bytes([rank, i]) * 16
+        d.deploy.body.session.wasm = b"wasm"
+        yield d
+
+
+# Mock global state: accounts whose balance is their index times 1000.
+ACCOUNTS = [bytes([0xA0 + i]) * 32 for i in range(10)]
+MINT_PUBLIC = b"\x01" * 32
+MINT_PRIVATE = b"\x02" * 32
+# Contract stored in the mock global state.
+CONTRACT_HASH = b"\x05" * 32
+
+
+def _purse(i):
+    return bytes([0x30 + i]) * 32
+
+
+def _balance_uref(i):
+    return bytes([0x40 + i]) * 32
+
+
+def _state():
+    def uref_value(uref):
+        v = state_pb2.Value()
+        v.key.uref.uref = uref
+        return v
+
+    state = {("uref", MINT_PUBLIC.hex()): uref_value(MINT_PRIVATE)}
+    contract = state_pb2.Value()
+    contract.contract.body = b"\x00asm"
+    state[("hash", CONTRACT_HASH.hex())] = contract
+    for i, account in enumerate(ACCOUNTS):
+        v = state_pb2.Value()
+        v.account.public_key = account
+        v.account.purse_id.uref = _purse(i)
+        mint = v.account.known_urefs.add(name="mint")
+        mint.key.uref.uref = MINT_PUBLIC
+        state[("address", account.hex())] = v
+        local_key = f"{MINT_PRIVATE.hex()}:{ABI.byte_array(_purse(i)).hex()}"
+        state[("local", local_key)] = uref_value(_balance_uref(i))
+        balance = state_pb2.Value()
+        balance.big_int.value = str(i * 1000)
+        state[("uref", _balance_uref(i).hex())] = balance
+    return state
+
+
+STATE = _state()
+KEY_VARIANTS = {1: "hash", 2: "uref", 3: "address", 4: "local"}
+
+
 class CasperServiceServicer(casper_pb2_grpc.CasperServiceServicer):
     """CasperService is the way for user and dApp developer to interact with the system,
   including deploying contracts, looking at the DAG and querying state.
   """
 
+    def __init__(self):
+        self.requests = []
+        self.deploys = {}
+        # Deploys not proposed yet, and deploys of proposed blocks by block hash.
+        self.pending = []
+        self.blocks = {}
+        self.tip_rank = TIP_RANK
+        # (seconds to sleep, status code to fail with or None) for the next
+        # calls of GetBlockInfo and StreamBlockInfos.
+        self.faults = []
+        # Numbers of blocks after which the next calls of StreamBlockInfos
+        # fail with UNAVAILABLE, None for calls that don't fail.
+        self.stream_breaks = []
+
+    def _fault(self, context):
+        if self.faults:
+            delay, code = self.faults.pop(0)
+            time.sleep(delay)
+            if code is not None:
+                context.abort(code, "Injected fault")
+
     def Deploy(self, request, context):
         """Add a deploy to the deploy pool on the node,
     to be processed during subsequent block proposals.
     """
+        if request.deploy.deploy_hash in self.deploys:
+            context.abort(grpc.StatusCode.ALREADY_EXISTS, "Deploy already exists")
+        self.deploys[request.deploy.deploy_hash] = request.deploy
+        self.pending.append(request.deploy)
         context.set_code(grpc.StatusCode.OK)
         context.set_details("")
         return empty_pb2.Empty()
@@ -74,16 +182,76 @@ class CasperServiceServicer(casper_pb2_grpc.CasperServiceServicer):
     def GetBlockInfo(self, request, context):
         """Get the block summary with extra information about finality.
     """
-        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-        context.set_details("Method not implemented!")
-        raise NotImplementedError("Method not implemented!")
+        self.requests.append(("GetBlockInfo", request))
+        self._fault(context)
+        b = info_pb2.BlockInfo()
+        b.summary.block_hash = bytes.fromhex(request.block_hash_base16)
+        b.summary.header.deploy_count = len(self.blocks.get(b.summary.block_hash, ()))
+        return b
 
     def StreamBlockInfos(self, request, context):
         """Get slices of the DAG, going backwards, rank by rank.
     """
-        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-        context.set_details("Method not implemented!")
-        raise NotImplementedError("Method not implemented!")
+        self.requests.append(("StreamBlockInfos", request))
+        self._fault(context)
+        max_rank = min(request.max_rank or self.tip_rank, self.tip_rank)
+        limit = self.stream_breaks.pop(0) if self.stream_breaks else None
+        for i, rank in enumerate(range(max_rank, max(max_rank - request.depth, -1), -1)):
+            if i == limit:
+                context.abort(grpc.StatusCode.UNAVAILABLE, "Injected fault")
+            yield block_info(rank)
+
+    def GetDeployInfo(self, request, context):
+        """Deploys are found in blocks by the first byte of their hash, see processed_deploys."""
+        self.requests.append(("GetDeployInfo", request))
+        deploy_hash = bytes.fromhex(request.deploy_hash_base16)
+        rank, i = deploy_hash[0], deploy_hash[1]
+        if rank > self.tip_rank or i > 1:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Deploy not found")
+        d = info_pb2.DeployInfo()
+        d.deploy.deploy_hash = deploy_hash
+        d.processing_results.add(block_info=block_info(rank), cost=i)
+        return d
+
+    def StreamBlockDeploys(self, request, context):
+        self.requests.append(("StreamBlockDeploys", request))
+        yield from processed_deploys(bytes.fromhex(request.block_hash_base16)[0])
+
+    def GetBlockState(self, request, context):
+        self.requests.append(("GetBlockState", request))
+        return self._value(request.query, context)
+
+    def BatchGetBlockState(self, request, context):
+        self.requests.append(("BatchGetBlockState", request))
+        return casper_pb2.BatchGetBlockStateResponse(
+            values=[self._value(q, context) for q in request.queries]
+        )
+
+    def _value(self, query, context):
+        try:
+            return STATE[(KEY_VARIANTS[query.key_variant], query.key_base16)]
+        except KeyError:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Value not found")
+
+
+class ControlServiceServicer(control_pb2_grpc.ControlServiceServicer):
+    def __init__(self, casper_servicer=None):
+        # Number of the next proposals that fail.
+        self.refusals = 0
+        # Proposed blocks take pending deploys of casper_servicer, if given.
+        self.casper_servicer = casper_servicer
+
+    def Propose(self, request, context):
+        if self.refusals > 0:
+            self.refusals -= 1
+            context.abort(grpc.StatusCode.OUT_OF_RANGE, "No new deploys.")
+        casper = self.casper_servicer
+        if casper is None or not casper.pending:
+            return control_pb2.ProposeResponse(block_hash=bytes.fromhex(HASH))
+        deploys, casper.pending = casper.pending, []
+        block_hash = hashlib.sha256(b"".join(d.deploy_hash for d in deploys)).digest()
+        casper.blocks[block_hash] = deploys
+        return control_pb2.ProposeResponse(block_hash=block_hash)
 
 
 class DeployServicer(CasperMessage_pb2_grpc.DeployServiceServicer):
@@ -0,0 +1,1191 @@
+#!/usr/bin/env python3
+"""
+Python CasperLabs client unit tests running against a mock node.
+"""
+import asyncio
+import functools
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import ed25519
+import grpc
+import pytest
+
+from casperlabs_client import (
+    AsyncCasperLabsClient,
+    Benchmark,
+    CallPolicy,
+    ClientMetrics,
+    CasperLabsClient,
+    ContractRegistry,
+    ChannelPool,
+    DagStore,
+    DeployTemplate,
+    DeployTracker,
+    GraphzGenerator,
+    InternalError,
+    KeyRing,
+    MultiNodeCasperLabsClient,
+    Profiler,
+    ResponseCache,
+    Signer,
+    SigningPool,
+    Verifier,
+    contract_address,
+    make_deploy,
+    read_deploys,
+    sign_deploy,
+    write_deploys,
+)
+
+import casperlabs_client
+from casperlabs_client import ABI, casper_pb2, consensus_pb2, info_pb2, state_pb2
+from casperlabs_client.casperlabs_client import (
+    _message_dict,
+    _read_delimited,
+    _show_blocks,
+    main,
+)
+import mock_server
+
+ACCOUNTS_DIR = Path(__file__).parents[3] / "resources" / "accounts"
+
+
+@pytest.fixture()
+def client(mock_node):
+    port, internal_port = mock_node
+    with CasperLabsClient(
+        port=port, internal_port=internal_port, pool_size=2, connect_timeout=5
+    ) as client:
+        yield client
+
+
+def test_channels_are_reused(client):
+    pools = dict(client.channel_manager.pools)
+    channels = [c for pool in pools.values() for c in pool.channels]
+    assert len(pools) == 2
+    assert len(channels) == 4
+
+    for _ in range(10):
+        assert client.showBlock(mock_server.HASH).summary.block_hash.hex() == (
+            mock_server.HASH
+        )
+        assert client.propose().block_hash.hex() == mock_server.HASH
+
+    assert client.channel_manager.pools == pools
+    assert [c for pool in pools.values() for c in pool.channels] == channels
+
+
+def test_channels_are_created_on_first_use(mock_node):
+    port, internal_port = mock_node
+    with CasperLabsClient(port=port, internal_port=internal_port) as client:
+        pools = client.channel_manager.pools
+        assert [pool._channels for pool in pools.values()] == [None, None]
+        client.showBlock(mock_server.HASH)
+        assert [pool._channels is None for pool in pools.values()] == [False, True]
+
+
+def test_pool_round_robin():
+    pool = ChannelPool("127.0.0.1:1", size=3)
+    stubs = [pool.stub(lambda channel: channel) for _ in range(6)]
+    assert stubs[:3] == pool.channels
+    assert stubs[3:] == pool.channels
+    pool.close()
+
+
+def test_close(mock_node):
+    port, internal_port = mock_node
+    client = CasperLabsClient(port=port, internal_port=internal_port)
+    assert client.propose().block_hash.hex() == mock_server.HASH
+    client.close()
+    assert client.channel_manager.pools == {}
+
+
+def _run_async(coroutine):
+    # asyncio.run is new in Python 3.7.
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+requires_aio = pytest.mark.skipif(
+    importlib.util.find_spec("grpc.aio") is None,
+    reason="grpc.aio requires grpcio 1.32 or newer",
+)
+
+
+@requires_aio
+def test_async_client(mock_node):
+    port, internal_port = mock_node
+
+    async def run():
+        async with AsyncCasperLabsClient(
+            port=port, internal_port=internal_port
+        ) as client:
+            blocks = await asyncio.gather(
+                *(client.showBlock(mock_server.HASH) for _ in range(10))
+            )
+            ranks = [b.summary.header.rank async for b in client.showBlocks(depth=3)]
+            proposed = await client.propose()
+        return blocks, ranks, proposed
+
+    blocks, ranks, proposed = _run_async(run())
+    assert [b.summary.block_hash.hex() for b in blocks] == [mock_server.HASH] * 10
+    assert ranks == [mock_server.TIP_RANK - i for i in range(3)]
+    assert proposed.block_hash.hex() == mock_server.HASH
+
+
+@requires_aio
+def test_async_client_internal_error(mock_node):
+    port, internal_port = mock_node
+
+    async def run():
+        async with AsyncCasperLabsClient(port=port) as client:
+            return await client.showBlock("not a hash")
+
+    with pytest.raises(InternalError):
+        _run_async(run())
+
+
+def test_query_states(client):
+    queries = [(a.hex(), "", "address") for a in mock_server.ACCOUNTS[:3]]
+    values = client.queryStates(mock_server.HASH, queries)
+    assert [v.account.public_key for v in values] == mock_server.ACCOUNTS[:3]
+
+
+def test_balances_are_batched(client, casper_servicer):
+    addresses = [a.hex() for a in mock_server.ACCOUNTS]
+    balances = client.balances(addresses, mock_server.HASH)
+    assert balances == {a: i * 1000 for i, a in enumerate(addresses)}
+    assert [name for name, _ in casper_servicer.requests] == ["BatchGetBlockState"] * 4
+
+    assert client.balance(addresses[3], mock_server.HASH) == 3000
+
+
+def test_cache(mock_node, casper_servicer):
+    port, internal_port = mock_node
+    client = CasperLabsClient(port=port, internal_port=internal_port, cache_size=10000)
+    address = mock_server.ACCOUNTS[1].hex()
+
+    for _ in range(3):
+        assert client.showBlock(mock_server.HASH).summary.block_hash.hex() == (
+            mock_server.HASH
+        )
+        assert client.queryState(mock_server.HASH, address, "", "address").account
+        assert client.balance(address, mock_server.HASH) == 1000
+    # Prefixes of hashes are never cached.
+    client.showBlock(mock_server.HASH[:10])
+    client.showBlock(mock_server.HASH[:10])
+
+    assert [name for name, _ in casper_servicer.requests] == (
+        ["GetBlockInfo", "GetBlockState"]
+        + ["BatchGetBlockState"] * 4
+        + ["GetBlockInfo"] * 2
+    )
+    stats = client.cache_stats()
+    assert (stats["hits"], stats["misses"]) == (2 * 6, 6)
+
+
+def test_cache_eviction():
+    cache = ResponseCache(max_size=10)
+    cache.put("a", [b"12345"])
+    cache.put("b", [b"123", b"45"])
+    assert cache.get("a") == [b"12345"]
+    cache.put("c", [b"1"])
+    assert cache.get("b") is None
+    assert cache.get("a") == [b"12345"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 6
+
+    cache = ResponseCache(max_size=10, ttl=0)
+    cache.put("a", [b"1"])
+    assert cache.get("a") is None
+
+
+def test_deploy_many(client, casper_servicer):
+    spec = dict(from_addr=b"1" * 32, session_hash=b"2" * 32)
+    specs = [spec] * 50 + [dict(spec, from_addr=b"3")]
+    results = list(client.deploy_many(specs, concurrency=4))
+
+    assert sorted(r.index for r in results) == list(range(51))
+    failed = [r for r in results if r.error]
+    assert [(r.index, r.deploy_hash) for r in failed] == [(50, None)]
+    # Identical deploys made in the same second get different hashes.
+    hashes = {r.deploy_hash for r in results if not r.error}
+    assert len(hashes) == 50
+    assert hashes == set(casper_servicer.deploys)
+
+
+def test_deploy_many_errors(client, monkeypatch):
+    monkeypatch.setattr(casperlabs_client.casperlabs_client, "_timestamp", lambda: 1)
+    spec = dict(from_addr=b"1" * 32, session_hash=b"2" * 32)
+    results = list(client.deploy_many([spec] * 3))
+
+    assert len({r.deploy_hash for r in results}) == 1
+    errors = sorted(str(r.error) for r in results if r.error)
+    assert errors == ["StatusCode.ALREADY_EXISTS: Deploy already exists"] * 2
+
+
+def test_key_ring():
+    key_ring = KeyRing()
+    signers = key_ring.load_directory(ACCOUNTS_DIR)
+    assert len(signers) == 302
+
+    account_id = (ACCOUNTS_DIR / "account-id-hex-7").read_text().strip()
+    private_key = ACCOUNTS_DIR / "account-private-7.pem"
+    public_key = ACCOUNTS_DIR / "account-public-7.pem"
+    signer = key_ring.signer(private_key, public_key)
+    assert signers[account_id] is signer
+    assert key_ring.signer(str(private_key), str(public_key)) is signer
+    assert key_ring.public_key(public_key) == signer.public_key
+
+
+def test_deploy_with_signer(client, casper_servicer):
+    signer = KeyRing().signer(ACCOUNTS_DIR / "account-private-3.pem")
+    _, deploy_hash = client.deploy(session_hash=b"2" * 32, signer=signer)
+    _, deploy_hash_from_files = client.deploy(
+        session_hash=b"2" * 32,
+        public_key=ACCOUNTS_DIR / "account-public-3.pem",
+        private_key=ACCOUNTS_DIR / "account-private-3.pem",
+    )
+
+    assert set(casper_servicer.deploys) == {deploy_hash, deploy_hash_from_files}
+    approval = casper_servicer.deploys[deploy_hash].approvals[0]
+    assert approval.approver_public_key == signer.public_key
+    ed25519.VerifyingKey(signer.public_key).verify(approval.signature.sig, deploy_hash)
+
+
+@pytest.mark.parametrize(
+    "contracts",
+    [
+        dict(session="session.wasm", payment="payment.wasm"),
+        dict(session="session.wasm"),
+        dict(session="session.wasm", payment_hash=b"3" * 32),
+        dict(session_name="transfer", payment_uref=b"4" * 32),
+    ],
+)
+def test_deploy_template(tmp_path, contracts):
+    (tmp_path / "session.wasm").write_bytes(b"\x00asm" * 50000)
+    (tmp_path / "payment.wasm").write_bytes(b"\x01asm" * 100)
+    contracts = {
+        k: k in ("session", "payment") and str(tmp_path / v) or v
+        for k, v in contracts.items()
+    }
+    template = DeployTemplate(payment_args=ABI.args([ABI.u512(10)]), **contracts)
+    signer = KeyRing().signer(ACCOUNTS_DIR / "account-private-1.pem")
+
+    for i in (0, 1, 300, 2**40):
+        session_args = i and ABI.args([ABI.account(b"5" * 32), ABI.u64(i)]) or None
+        d = template.make(session_args=session_args, signer=signer)
+        assert d.header.body_hash == casperlabs_client.casperlabs_client._hash(
+            d.body.SerializeToString()
+        )
+        expected = casperlabs_client.casperlabs_client._make_deploy(
+            session_args=session_args,
+            payment_args=ABI.args([ABI.u512(10)]),
+            signer=signer,
+            **contracts,
+        )
+        assert d.body == expected.body
+        assert d.header.account_public_key == signer.public_key
+        assert d.approvals[0].approver_public_key == signer.public_key
+
+
+def test_send_templated_deploys(client, casper_servicer):
+    template = DeployTemplate(session_hash=b"2" * 32)
+    deploys = (template.make(from_addr=bytes([i]) * 32) for i in range(10))
+    results = list(client.deploy_many(deploys))
+    assert [r.error for r in results] == [None] * 10
+    assert {r.deploy_hash for r in results} == set(casper_servicer.deploys)
+    assert isinstance(
+        casper_servicer.deploys[results[0].deploy_hash], consensus_pb2.Deploy
+    )
+
+
+def test_deploy_files(client, casper_servicer):
+    signer = KeyRing().signer(ACCOUNTS_DIR / "account-private-2.pem")
+    unsigned = [
+        make_deploy(from_addr=signer.public_key, session_hash=bytes([i]) * 32)
+        for i in range(1, 4)
+    ]
+    assert [len(d.approvals) for d in unsigned] == [0] * 3
+
+    f = io.BytesIO()
+    assert write_deploys(unsigned[:1], f) == 1
+    assert write_deploys(unsigned[1:], f) == 2
+    f.seek(0)
+    assert list(read_deploys(f)) == unsigned
+
+    f = io.BytesIO()
+    write_deploys((sign_deploy(d, signer) for d in unsigned), f)
+    f.seek(0)
+    results = list(client.deploy_many(read_deploys(f)))
+    assert [r.error for r in results] == [None] * 3
+
+    deploy = casper_servicer.deploys[unsigned[0].deploy_hash]
+    assert [a.approver_public_key for a in deploy.approvals] == [signer.public_key]
+    ed25519.VerifyingKey(signer.public_key).verify(
+        deploy.approvals[0].signature.sig, deploy.deploy_hash
+    )
+
+    with pytest.raises(Exception, match="Unexpected end"):
+        list(read_deploys(io.BytesIO(f.getvalue()[:-1])))
+
+
+def test_make_deploy_with_public_key_then_sign():
+    signer = KeyRing().signer(ACCOUNTS_DIR / "account-private-2.pem")
+    deploy = make_deploy(
+        session_hash=b"2" * 32, public_key=ACCOUNTS_DIR / "account-public-2.pem"
+    )
+    assert deploy.header.account_public_key == signer.public_key
+    assert len(deploy.approvals) == 0
+
+    sign_deploy(deploy, signer)
+    assert [a.approver_public_key for a in deploy.approvals] == [signer.public_key]
+    ed25519.VerifyingKey(signer.public_key).verify(
+        deploy.approvals[0].signature.sig, deploy.deploy_hash
+    )
+
+
+def test_u512():
+    assert ABI.u512(0) == b"\x00"
+    assert ABI.u512(256) == b"\x02\x00\x01"
+    assert ABI.u512(2**512 - 1) == b"\x40" + b"\xff" * 64
+    with pytest.raises(OverflowError):
+        ABI.u512(2**512)
+
+
+@pytest.mark.parametrize(
+    "types, columns",
+    [
+        (["account", "u64"], [[b"1" * 32, b"2" * 32], [1, 2**64 - 1]]),
+        (["u32", "long_value", "int_value"], [[1, 2], [3, 4], [5, 6]]),
+        (["account", "u512", "byte_array"], [[b"1" * 32], [10**30], [b"abc"]]),
+    ],
+)
+def test_abi_schema(types, columns):
+    schema = ABI.schema(types)
+    expected = [
+        ABI.args([getattr(ABI, t)(v) for t, v in zip(types, row)])
+        for row in zip(*columns)
+    ]
+    assert schema.encode_many(*columns) == expected
+    assert schema.encode(*[c[0] for c in columns]) == expected[0]
+
+
+def test_abi_schema_checks_accounts():
+    with pytest.raises(Exception, match="32 bytes"):
+        ABI.schema(["account", "u64"]).encode_many([b"1" * 32, b"2"], [1, 2])
+
+
+def test_message_dict():
+    key = state_pb2.Key(
+        uref=state_pb2.Key.URef(
+            uref=b"\x01\xff", access_rights=state_pb2.Key.URef.READ_ADD_WRITE
+        )
+    )
+    assert _message_dict(key) == {
+        "uref": {"uref": "01ff", "access_rights": "READ_ADD_WRITE"}
+    }
+
+
+@pytest.mark.parametrize("output", ["json", "ndjson", "binary"])
+def test_show_blocks_output(client, capsysbinary, output):
+    blocks = list(client.showBlocks(depth=3))
+    _show_blocks(iter(blocks), output=output)
+    out = capsysbinary.readouterr().out
+    if output == "binary":
+        assert list(_read_delimited(io.BytesIO(out), type(blocks[0]))) == blocks
+        return
+    if output == "json":
+        dicts = json.loads(out)
+    else:
+        dicts = [json.loads(line) for line in out.splitlines()]
+    assert [d["summary"]["block_hash"] for d in dicts] == [
+        b.summary.block_hash.hex() for b in blocks
+    ]
+    assert dicts[0]["summary"]["header"]["rank"] == blocks[0].summary.header.rank
+
+
+STARTUP_SCRIPT = """
+import sys
+import casperlabs_client
+from casperlabs_client.casperlabs_client import main
+
+casperlabs_client.ABI.args_from_json('[{"name": "amount", "value": {"long_value": 1}}]')
+sys.argv = ["casperlabs_client", "show-blocks", "--help"]
+try:
+    main()
+except SystemExit:
+    pass
+print(" ".join(sys.modules), file=sys.stderr)
+"""
+
+
+def test_startup_imports():
+    """
+    Commands that don't talk to a node, like --help, must not import
+    grpc, protobuf or crypto libraries, they take most of the startup time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    assert b"--depth" in result.stdout
+    modules = result.stderr.decode().split()
+    heavy = ("grpc", "google", "ed25519", "pyblake2", "asyncio")
+    assert [m for m in modules if m.split(".")[0] in heavy or "_pb2" in m] == []
+
+
+def test_state_query_key_variants():
+    assert casperlabs_client.STATE_QUERY_KEY_VARIANT == {
+        name.lower(): value
+        for name, value in casper_pb2.StateQuery.KeyVariant.items()
+        if value
+    }
+
+
+def _requests(casper_servicer, method):
+    return [r for m, r in casper_servicer.requests if m == method]
+
+
+def test_dag_store_sync(client, casper_servicer, tmp_path):
+    path = str(tmp_path / "dag.db")
+    with DagStore(client, path, window=8) as store:
+        assert store.sync() == mock_server.TIP_RANK + 1
+        assert store.high_water_mark == mock_server.TIP_RANK
+        windows = [
+            (r.max_rank, r.depth)
+            for r in _requests(casper_servicer, "StreamBlockInfos")
+        ]
+        assert windows == [(0, 1), (7, 8), (15, 8), (20, 5)]
+
+    casper_servicer.tip_rank += 3
+    casper_servicer.requests.clear()
+    with DagStore(client, path, window=8) as store:
+        # 3 new ranks and the top 10 ranks stored already.
+        assert store.sync() == 13
+        windows = [
+            (r.max_rank, r.depth)
+            for r in _requests(casper_servicer, "StreamBlockInfos")
+        ]
+        assert windows == [(0, 1), (18, 8), (23, 5)]
+
+        casper_servicer.requests.clear()
+        blocks = list(store.showBlocks(depth=5, max_rank=10))
+        assert blocks == [mock_server.block_info(rank) for rank in range(10, 5, -1)]
+        h = [mock_server.block_hash(rank).hex() for rank in range(5)]
+        assert store.showBlock(h[3][:10]) == mock_server.block_info(3)
+        assert store.parents(h[3]) == [h[2]]
+        assert store.children(h[3]) == [h[4]]
+        assert store.justified_by(h[3]) == [h[4]]
+        assert _requests(casper_servicer, "StreamBlockInfos") == []
+        assert _requests(casper_servicer, "GetBlockInfo") == []
+
+    casper_servicer.requests.clear()
+    with DagStore(client, window=1) as store:
+        assert store.sync() == mock_server.TIP_RANK + 4
+        windows = [
+            (r.max_rank, r.depth)
+            for r in _requests(casper_servicer, "StreamBlockInfos")
+        ]
+        # The genesis is fetched with rank 1, as max_rank=0 means the tip.
+        assert windows == [(0, 1), (1, 2)] + [
+            (rank, 1) for rank in range(1, mock_server.TIP_RANK + 4)
+        ]
+        assert store.high_water_mark == mock_server.TIP_RANK + 3
+
+
+def test_dag_store_late_blocks(client, casper_servicer, monkeypatch):
+    late = mock_server.block_info(18)
+    late.summary.block_hash = b"\x99" * 32
+
+    def block_info(rank, block_info=mock_server.block_info):
+        return block_info(rank) if rank != 18 or not arrived else late
+
+    arrived = False
+    monkeypatch.setattr(mock_server, "block_info", block_info)
+    store = DagStore(client, lookback=3)
+    store.sync()
+    parent = mock_server.block_hash(17).hex()
+    assert store.children(parent) == [mock_server.block_hash(18).hex()]
+
+    # A block of another validator arrives at a rank that has been synced.
+    arrived = True
+    store.sync()
+    assert sorted(store.children(parent)) == sorted(
+        [mock_server.block_hash(18).hex(), late.summary.block_hash.hex()]
+    )
+    assert late in list(store.showBlocks(depth=1, max_rank=18))
+
+
+def test_dag_store_deploys(client, casper_servicer):
+    store = DagStore(client)
+    block_hash = mock_server.block_hash(5).hex()
+    deploys = list(store.showDeploys(block_hash))
+    assert deploys == list(mock_server.processed_deploys(5))
+    assert list(store.showDeploys(block_hash)) == deploys
+    assert len(_requests(casper_servicer, "StreamBlockDeploys")) == 1
+
+    basic = list(store.showDeploys(block_hash, full_view=False))
+    assert [d.deploy.deploy_hash for d in basic] == [
+        d.deploy.deploy_hash for d in deploys
+    ]
+    assert not basic[0].deploy.HasField("body")
+    assert store.blocks_with_deploy(deploys[1].deploy.deploy_hash.hex()) == [block_hash]
+
+
+def test_dag_store_max_age(client, casper_servicer):
+    store = DagStore(client)
+    list(store.showBlocks(depth=2))
+    list(store.showBlocks(depth=2, max_age=60))
+    assert len(_requests(casper_servicer, "StreamBlockInfos")) == 2
+    list(store.showBlocks(depth=2, max_age=0))
+    # The tip and the lookback ranks.
+    assert len(_requests(casper_servicer, "StreamBlockInfos")) == 4
+
+    block_hash = mock_server.block_hash(7).hex()
+    store.showBlock(block_hash)
+    assert _requests(casper_servicer, "GetBlockInfo") == []
+    store.showBlock(block_hash, max_age=0)
+    assert len(_requests(casper_servicer, "GetBlockInfo")) == 1
+
+
+def test_follow_blocks(client, casper_servicer):
+    blocks = client.follow_blocks(from_rank=18, min_interval=0, max_interval=0)
+    assert [next(blocks).summary.header.rank for _ in range(3)] == [18, 19, 20]
+    casper_servicer.tip_rank += 2
+    casper_servicer.requests.clear()
+    assert [next(blocks).summary.header.rank for _ in range(2)] == [21, 22]
+    windows = [
+        (r.max_rank, r.depth) for r in _requests(casper_servicer, "StreamBlockInfos")
+    ]
+    # Tip of the DAG, rank 20 again for late blocks, and 21.
+    assert windows == [(0, 1), (21, 2)]
+
+
+def test_follow_deploys(client, casper_servicer, monkeypatch):
+    def block_info(rank, block_info=mock_server.block_info):
+        b = block_info(rank)
+        b.summary.header.deploy_count = rank % 2 and 2 or 0
+        return b
+
+    monkeypatch.setattr(mock_server, "block_info", block_info)
+    deploys = client.follow_deploys(depth=4, min_interval=0, max_interval=0)
+    assert [(b.summary.header.rank, d) for b, d in itertools.islice(deploys, 4)] == [
+        (rank, d) for rank in (17, 19) for d in mock_server.processed_deploys(rank)
+    ]
+    assert len(_requests(casper_servicer, "StreamBlockDeploys")) == 2
+
+
+def _dag_block(rank, validator, parents, fault_tolerance=0):
+    b = info_pb2.BlockInfo()
+    b.summary.block_hash = bytes([rank, validator]) * 16
+    b.summary.header.rank = rank
+    b.summary.header.validator_public_key = bytes([validator]) * 32
+    b.summary.header.parent_hashes.extend(parents)
+    b.summary.header.state.bonds.add(validator_public_key=b"\x01" * 32)
+    b.summary.header.state.bonds.add(validator_public_key=b"\x02" * 32)
+    b.status.fault_tolerance = fault_tolerance
+    return b
+
+
+def test_graphz_generator():
+    genesis = b"\x00" * 32
+    b11 = _dag_block(1, 1, [genesis], fault_tolerance=0.5)
+    b12 = _dag_block(1, 2, [genesis], fault_tolerance=0.5)
+    b21 = _dag_block(2, 1, [b11.summary.block_hash, b12.summary.block_hash])
+    generator = GraphzGenerator()
+    parts = list(generator.generate([b21, b11, b12]))
+    dot = "".join(parts)
+    v1, v2 = "0101010101...", "0202020202..."
+    h11, h12, h21 = "0101010101...", "0102010201...", "0201020102..."
+    assert dot.startswith('digraph "dag" {\n  rankdir=BT\n')
+    assert dot.endswith("}\n")
+    assert dot.count(f'subgraph "cluster_{v1}"') == 2
+    assert f'"2_{v2}" [style=invis shape=box]' in dot
+    assert f'"{h11}" [style=filled shape=box]' in dot
+    assert f'"{h12}" [shape=box]' in dot
+    assert f'"{h21}" -> "{h11}" [style=bold constraint=false]' in dot
+    assert f'"{h21}" -> "{h12}" [constraint=false]' in dot
+    assert f'"{h12}" -> "2_{v2}" [style=invis]' in dot
+    assert f'"0000000000..." -> "{h11}" [style=invis]' in dot
+    assert "dotted" not in dot
+
+    # Parts of ranks that haven't changed are reused, rank 2 is now
+    # connected to the new rank 3.
+    b31 = _dag_block(3, 1, [b21.summary.block_hash])
+    again = list(generator.generate([b31, b21, b11, b12]))
+    assert again[3] is parts[2]
+    assert again[2] != parts[1]
+
+
+def test_visualize_dag_stream(client, casper_servicer, monkeypatch):
+    images = []
+    monkeypatch.setattr(
+        casperlabs_client.casperlabs_client,
+        "_write_image",
+        lambda dot, file_name: images.append((file_name, "".join(dot))),
+    )
+    files = client.visualizeDag(3, out="dag.svg", stream="multiple-outputs", interval=0)
+    assert next(files) == "dag_0.svg"
+    casper_servicer.tip_rank += 1
+    del casper_servicer.requests[:]
+    assert next(files) == "dag_1.svg"
+    assert [f for f, _ in images] == ["dag_0.svg", "dag_1.svg"]
+    for rank in (21, 20, 19):
+        assert mock_server.block_hash(rank).hex()[:10] in images[1][1]
+    # Rank 18 is drawn as the parent of rank 19, older ones are not.
+    assert mock_server.block_hash(17).hex()[:10] not in images[1][1]
+    # The tip, and the previous tip again for blocks arriving late;
+    # rank 19 is drawn from the blocks fetched before.
+    windows = [
+        (r.max_rank, r.depth) for r in _requests(casper_servicer, "StreamBlockInfos")
+    ]
+    assert windows == [(0, 1), (20, 1)]
+
+    with pytest.raises(InternalError):
+        next(client.visualizeDag(3, stream="single-output"))
+
+
+def _fast_deploy_tracking(monkeypatch):
+    def block_info(rank, block_info=mock_server.block_info):
+        b = block_info(rank)
+        b.summary.header.deploy_count = 2
+        return b
+
+    monkeypatch.setattr(mock_server, "block_info", block_info)
+    monkeypatch.setattr(
+        casperlabs_client.CasperLabsClient,
+        "follow_blocks",
+        functools.partialmethod(
+            casperlabs_client.CasperLabsClient.follow_blocks,
+            min_interval=0.01,
+            max_interval=0.01,
+        ),
+    )
+
+
+def test_deploy_tracker(client, casper_servicer, monkeypatch):
+    _fast_deploy_tracking(monkeypatch)
+    new_deploys = [bytes([21, i]) * 16 for i in range(2)]
+    old_deploy = bytes([5, 1]) * 16
+    unknown_deploy = bytes([99, 1]) * 16
+    with DeployTracker(client, poll_interval=0.05, max_poll_interval=0.05) as tracker:
+        callbacks = []
+        futures = tracker.track_many(new_deploys + [old_deploy], callbacks.append)
+        lost = tracker.track(unknown_deploy.hex(), timeout=0.2)
+        casper_servicer.tip_rank += 1
+
+        inclusions = [futures[h].result(timeout=5) for h in new_deploys]
+        assert [(i.block_hash, i.cost) for i in inclusions] == [
+            (mock_server.block_hash(21), 0),
+            (mock_server.block_hash(21), 1),
+        ]
+        old = futures[old_deploy].result(timeout=5)
+        assert old.block_hash == mock_server.block_hash(5)
+        with pytest.raises(InternalError):
+            lost.result(timeout=5)
+        assert len(callbacks) == 3
+
+    deploys_requests = _requests(casper_servicer, "StreamBlockDeploys")
+    polled = {r.deploy_hash_base16 for r in _requests(casper_servicer, "GetDeployInfo")}
+    assert [r.block_hash_base16 for r in deploys_requests].count(
+        mock_server.block_hash(21).hex()
+    ) == 1
+    assert old_deploy.hex() in polled
+
+
+def test_deploy_tracker_cancel(client, casper_servicer, monkeypatch):
+    _fast_deploy_tracking(monkeypatch)
+    new_deploys = [bytes([21, i]) * 16 for i in range(2)]
+    with DeployTracker(client, poll_interval=0.05, max_poll_interval=0.05) as tracker:
+        futures = tracker.track_many(new_deploys)
+        lost = tracker.track(bytes([99, 1]) * 16, timeout=0.2)
+        assert futures[new_deploys[0]].cancel()
+        assert tracker.pending == 2
+        assert lost.cancel()
+        assert tracker.pending == 1
+        casper_servicer.tip_rank += 1
+
+        inclusion = futures[new_deploys[1]].result(timeout=5)
+        assert inclusion.block_hash == mock_server.block_hash(21)
+        assert futures[new_deploys[0]].cancelled()
+        # Cancelled deploys can be tracked again.
+        again = tracker.track(new_deploys[0])
+        assert again.result(timeout=5).block_hash == mock_server.block_hash(21)
+
+
+def _policy_client(mock_node, **policies):
+    port, internal_port = mock_node
+    return CasperLabsClient(
+        port=port, internal_port=internal_port, pool_size=2, policies=policies
+    )
+
+
+def test_call_deadline(mock_node, casper_servicer):
+    casper_servicer.faults = [(1.0, None)]
+    with _policy_client(mock_node, GetBlockInfo=CallPolicy(timeout=0.1)) as client:
+        with pytest.raises(InternalError) as e:
+            client.showBlock(mock_server.HASH)
+    assert "DEADLINE_EXCEEDED" in e.value.status
+
+
+def test_call_retries(mock_node, casper_servicer):
+    unavailable = (0, grpc.StatusCode.UNAVAILABLE)
+    policy = CallPolicy(attempts=3, backoff=0.01)
+    with _policy_client(
+        mock_node, GetBlockInfo=policy, StreamBlockInfos=policy
+    ) as client:
+        casper_servicer.faults = [unavailable, unavailable]
+        assert client.showBlock(mock_server.HASH).summary.block_hash.hex() == (
+            mock_server.HASH
+        )
+        assert len(_requests(casper_servicer, "GetBlockInfo")) == 3
+
+        casper_servicer.faults = [unavailable]
+        assert len(list(client.showBlocks(depth=2))) == 2
+
+        # Failures other than those in retry_codes are not retried.
+        casper_servicer.faults = [(0, grpc.StatusCode.NOT_FOUND)]
+        with pytest.raises(InternalError):
+            client.showBlock(mock_server.HASH)
+        assert len(_requests(casper_servicer, "GetBlockInfo")) == 4
+
+
+def test_hedged_call(mock_node, casper_servicer):
+    casper_servicer.faults = [(1.0, None)]
+    policy = CallPolicy(timeout=5, hedge_after=0.05)
+    with _policy_client(mock_node, GetBlockInfo=policy) as client:
+        start = time.time()
+        client.showBlock(mock_server.HASH)
+        assert time.time() - start < 0.5
+    assert len(_requests(casper_servicer, "GetBlockInfo")) == 2
+
+
+def test_propose_with_retry(client, control_servicer):
+    control_servicer.refusals = 2
+    with pytest.raises(InternalError):
+        client.propose_with_retry(attempts=2, backoff=0.01)
+    assert client.propose_with_retry(attempts=2, backoff=0.01).block_hash.hex() == (
+        mock_server.HASH
+    )
+
+
+def _multi_node_client(mock_nodes, **kwargs):
+    return MultiNodeCasperLabsClient(
+        [
+            f"127.0.0.1:{port}:{internal_port}"
+            for port, internal_port, _, _ in mock_nodes
+        ],
+        # No retries on the same node, so that failures are seen by the router.
+        policies={"GetBlockInfo": CallPolicy(timeout=5)},
+        **kwargs,
+    )
+
+
+def test_multi_node_reads_go_to_fastest_node(mock_nodes):
+    (_, _, slow, _), (_, _, fast, _) = mock_nodes
+    slow.faults = [(0.2, None)] * 10
+    with _multi_node_client(mock_nodes) as client:
+        for _ in range(10):
+            client.showBlock(mock_server.HASH)
+        stats = client.node_stats()
+    assert len(_requests(slow, "GetBlockInfo")) == 1
+    assert len(_requests(fast, "GetBlockInfo")) == 9
+    assert [s["calls"] for s in stats] == [1, 9]
+    assert stats[0]["latency"] > stats[1]["latency"]
+
+
+def test_multi_node_failover(mock_nodes):
+    (_, _, failing, _), (_, _, healthy, _) = mock_nodes
+    failing.faults = [(0, grpc.StatusCode.UNAVAILABLE)] * 2
+    with _multi_node_client(mock_nodes, max_failures=1, eject_time=0.1) as client:
+        client.showBlock(mock_server.HASH)
+        client.showBlock(mock_server.HASH)
+        stats = client.node_stats()
+        assert [s["ejected"] for s in stats] == [True, False]
+        assert [s["failures"] for s in stats] == [1, 0]
+        assert len(_requests(failing, "GetBlockInfo")) == 1
+        assert len(_requests(healthy, "GetBlockInfo")) == 2
+
+        # Probes after the ejection time, the first one fails again.
+        time.sleep(0.15)
+        client.showBlock(mock_server.HASH)
+        assert client.node_stats()[0]["ejected"]
+        time.sleep(0.25)
+        client.showBlock(mock_server.HASH)
+        assert not client.node_stats()[0]["ejected"]
+        assert len(_requests(failing, "GetBlockInfo")) == 3
+
+
+def test_multi_node_writes(mock_nodes):
+    (_, _, _, refusing), _ = mock_nodes
+    refusing.refusals = 10
+    with _multi_node_client(mock_nodes, write_node=1) as client:
+        for _ in range(3):
+            client.propose()
+    assert refusing.refusals == 10
+
+    with _multi_node_client(mock_nodes) as client:
+        outcomes = []
+        for _ in range(4):
+            try:
+                client.propose()
+                outcomes.append(True)
+            except InternalError:
+                outcomes.append(False)
+    assert sorted(outcomes) == [False, False, True, True]
+
+
+def test_client_metrics(mock_node, casper_servicer):
+    port, internal_port = mock_node
+    metrics = ClientMetrics()
+    calls = []
+    metrics.add_listener(calls.append)
+    with CasperLabsClient(
+        port=port,
+        internal_port=internal_port,
+        metrics=metrics,
+        policies={"GetBlockInfo": CallPolicy(timeout=5)},
+    ) as client:
+        client.showBlock(mock_server.HASH)
+        assert len(list(client.showBlocks(depth=3))) == 3
+        # Streams that aren't read to the end are recorded too.
+        next(client.showBlocks(depth=3))
+        casper_servicer.faults = [(0, grpc.StatusCode.NOT_FOUND)]
+        with pytest.raises(InternalError):
+            client.showBlock(mock_server.HASH)
+        client.propose()
+
+    # Cancellation of the stream that wasn't read to the end is reported by gRPC
+    # in the background, so calls may be recorded in any order.
+    calls = {(c.method.rpartition("/")[2], c.status): c for c in calls}
+    assert sorted((m, status, c.items) for (m, status), c in calls.items()) == [
+        ("GetBlockInfo", "NOT_FOUND", 0),
+        ("GetBlockInfo", "OK", 1),
+        ("Propose", "OK", 1),
+        ("StreamBlockInfos", "CANCELLED", 1),
+        ("StreamBlockInfos", "OK", 3),
+    ]
+    assert calls["GetBlockInfo", "OK"].node == f"127.0.0.1:{port}"
+    assert calls["Propose", "OK"].node == f"127.0.0.1:{internal_port}"
+    ok = calls["GetBlockInfo", "OK"]
+    assert ok.request_bytes > 0 and ok.response_bytes > 0 and ok.latency > 0
+
+    text = metrics.prometheus()
+    labels = f'node="127.0.0.1:{port}",service="CasperService",method="GetBlockInfo"'
+    assert f'casperlabs_client_rpc_calls_total{{{labels},status="OK"}} 1.0\n' in text
+    assert (
+        f'casperlabs_client_rpc_calls_total{{{labels},status="NOT_FOUND"}} 1.0\n'
+        in text
+    )
+    assert "# TYPE casperlabs_client_rpc_latency_seconds histogram\n" in text
+    assert (
+        f'casperlabs_client_rpc_latency_seconds_bucket{{{labels},le="10.0"}} 2.0\n'
+        in text
+    )
+    assert (
+        f'casperlabs_client_rpc_latency_seconds_bucket{{{labels},le="+Inf"}} 2.0\n'
+        in text
+    )
+    assert f"casperlabs_client_rpc_latency_seconds_count{{{labels}}} 2.0\n" in text
+    items = 'service="CasperService",method="StreamBlockInfos"'
+    assert (
+        f'casperlabs_client_rpc_stream_items_total{{node="127.0.0.1:{port}",{items}}} 4.0\n'
+        in text
+    )
+
+
+def test_profiler(client, tmp_path):
+    session = tmp_path / "session.wasm"
+    session.write_bytes(b"\0asm" + bytes(1000))
+    with Profiler(cprofile_file=str(tmp_path / "deploy.prof")) as profiler:
+        client.deploy(
+            session=str(session),
+            session_args=ABI.args_from_json(
+                '[{"name": "a", "value": {"int_value": 1}}]'
+            ),
+            public_key=ACCOUNTS_DIR / "account-public-3.pem",
+            private_key=ACCOUNTS_DIR / "account-private-3.pem",
+        )
+        list(client.showBlocks(depth=3))
+    # Phases aren't timed once the profiler isn't active.
+    client.propose()
+
+    results = profiler.results()
+    phases = results["phases"]
+    assert list(phases) == [
+        "encode args",
+        "read wasm",
+        "read keys",
+        "serialize",
+        "hash",
+        "sign",
+        "rpc",
+        "other",
+    ]
+    assert phases["read wasm"]["calls"] == 2
+    assert phases["hash"]["calls"] == 2
+    assert phases["rpc"]["calls"] == 2
+    assert sum(p["time"] for p in phases.values()) == pytest.approx(results["total"])
+    assert profiler.table().splitlines()[0].split() == ["phase", "calls", "ms", "%"]
+    assert json.loads(profiler.json()) == results
+    assert (tmp_path / "deploy.prof").stat().st_size > 0
+
+
+def test_benchmark(client, casper_servicer, tmp_path):
+    session = tmp_path / "transfer_to_account.wasm"
+    session.write_bytes(b"\0asm" + bytes(100))
+    funds = KeyRing().signer(
+        ACCOUNTS_DIR / "account-private-1.pem", ACCOUNTS_DIR / "account-public-1.pem"
+    )
+    benchmark = Benchmark(
+        client,
+        funds,
+        session=str(session),
+        accounts_num=5,
+        rounds_num=3,
+        approximate_transfer_cost=10,
+        processes=2,
+        concurrency=2,
+    )
+    stats = list(benchmark.run(str(tmp_path / "stats.csv")))
+
+    assert [s.round for s in stats] == [1, 2, 3]
+    assert [s.deploys for s in stats] == [5, 5, 5]
+    assert stats[0].percentile(50) <= stats[0].percentile(99)
+    # One block funding each of the accounts, then one block per round.
+    assert len(casper_servicer.blocks) == 6 + 3
+    assert len(casper_servicer.deploys) == 6 + 3 * 5
+    senders = {Signer(s).public_key for s in benchmark.senders}
+    for s in stats:
+        deploys = casper_servicer.blocks[s.block_hash]
+        assert {d.header.account_public_key for d in deploys} == senders
+
+    lines = (tmp_path / "stats.csv").read_text().splitlines()
+    assert lines[0].startswith("Deploy time, Propose time, Total time")
+    assert len(lines) == 4
+    assert all(len(line.split(", ")) == 8 for line in lines)
+
+
+def test_signing_pool():
+    signers = KeyRing().load_directory(ACCOUNTS_DIR)
+    accounts = sorted(signers)[:3]
+    unsigned = [
+        make_deploy(
+            from_addr=bytes.fromhex(accounts[i % 3]), session_hash=bytes([i]) * 32
+        )
+        for i in range(250)
+    ]
+    expected = [
+        sign_deploy(consensus_pb2.Deploy.FromString(d.SerializeToString()), signers[a])
+        for d, a in zip(unsigned, itertools.cycle(accounts))
+    ]
+    with SigningPool(signers, processes=2, chunk_size=16) as pool:
+        assert list(pool.sign(iter(unsigned))) == expected
+
+        # Deploys don't have to be hashed beforehand.
+        d = consensus_pb2.Deploy()
+        d.CopyFrom(unsigned[0])
+        d.ClearField("deploy_hash")
+        d.header.ClearField("body_hash")
+        d.header.ClearField("timestamp")
+        (signed,) = pool.sign([d])
+        assert signed.header.body_hash == unsigned[0].header.body_hash
+        assert signed.header.timestamp > 0
+        ed25519.VerifyingKey(signed.header.account_public_key).verify(
+            signed.approvals[0].signature.sig, signed.deploy_hash
+        )
+
+        d.header.account_public_key = b"\x01" * 32
+        with pytest.raises(Exception, match="No key"):
+            list(pool.sign([d]))
+
+    signer = signers[accounts[0]]
+    with SigningPool(signer, processes=1) as pool:
+        (signed,) = pool.sign(unsigned[1:2])
+        assert signed.approvals[0].approver_public_key == signer.public_key
+
+
+def test_verifier(client):
+    signers = KeyRing().load_directory(ACCOUNTS_DIR)
+    validator, other = [signers[k] for k in sorted(signers)[:2]]
+
+    def signed_block(rank, signer):
+        b = info_pb2.BlockInfo()
+        b.summary.header.rank = rank
+        b.summary.header.deploy_count = 2
+        b.summary.header.validator_public_key = validator.public_key
+        b.summary.block_hash = casperlabs_client.casperlabs_client._hash(
+            b.summary.header.SerializeToString()
+        )
+        b.summary.signature.CopyFrom(signer.sign(b.summary.block_hash))
+        return b
+
+    blocks = [signed_block(1, validator), signed_block(2, other)]
+    deploys = [make_deploy(session_hash=b"1" * 32, signer=validator) for _ in range(3)]
+    deploys[1].header.gas_price += 1
+    deploys[2].approvals[0].signature.sig = bytes(64)
+
+    with Verifier(client, processes=2, batch_size=2) as verifier:
+        # Deploys of the mock node are neither hashed nor signed.
+        mismatches = list(verifier.verify_blocks(blocks))
+        assert [
+            (m.hash, m.block_hash, m.problem) for m in mismatches if m.kind == "block"
+        ] == [(blocks[1].summary.block_hash, None, "signature is invalid")]
+        assert {m.block_hash for m in mismatches if m.kind == "deploy"} == {
+            b.summary.block_hash for b in blocks
+        }
+        problems = {m.problem.split()[0] for m in mismatches if m.kind == "deploy"}
+        assert problems == {"deploy", "body"}
+        assert verifier.stats()["deploys"] == 4
+
+        mismatches = list(verifier.verify_deploys(deploys))
+        assert [m.hash for m in mismatches] == [d.deploy_hash for d in deploys[1:]]
+        assert mismatches[0].problem.startswith("deploy hash is")
+        assert (
+            mismatches[1].problem
+            == f"approval of {validator.public_key.hex()} is invalid"
+        )
+
+        mismatches = list(verifier.verify(depth=3, deploys=False))
+        assert [m.hash for m in mismatches] == [
+            mock_server.block_hash(r) for r in (20, 19, 18)
+        ]
+
+        stats = verifier.stats()
+        assert stats["blocks"] == 5
+        assert stats["deploys"] == 7
+        assert stats["approvals"] == 3
+        assert stats["mismatches"] == 4 * 3 + 1 + 2 + 3
+        assert stats["approvals_per_second"] > 0
+
+
+def test_contract_registry(client, casper_servicer, tmp_path):
+    stored, other = tmp_path / "stored.wasm", tmp_path / "other.wasm"
+    stored.write_bytes(b"\0asm" + bytes(5000))
+    other.write_bytes(b"\0asm" + bytes(100))
+    deploy_hash = b"\x07" * 32
+    assert (
+        contract_address(deploy_hash, 1)
+        == hashlib.blake2b(deploy_hash + b"\1\0\0\0", digest_size=32).digest()
+    )
+
+    path = str(tmp_path / "contracts.db")
+    registry = ContractRegistry(path)
+    contract_hash = mock_server.CONTRACT_HASH
+    assert registry.register(str(stored), contract_hash=contract_hash) == contract_hash
+    assert registry.lookup(stored.read_bytes()) == contract_hash
+    # The node doesn't have this one.
+    registry.register(str(other), deploy_hash=deploy_hash)
+
+    client.contract_registry = registry
+    keys = dict(
+        public_key=ACCOUNTS_DIR / "account-public-1.pem",
+        private_key=ACCOUNTS_DIR / "account-private-1.pem",
+    )
+    _, h = client.deploy(session=str(stored), **keys)
+    body = casper_servicer.deploys[h].body
+    assert body.session.hash == body.payment.hash == contract_hash
+
+    _, h = client.deploy(session=str(other), payment=str(stored), **keys)
+    body = casper_servicer.deploys[h].body
+    assert body.session.wasm == other.read_bytes()
+    assert body.payment.hash == contract_hash
+    assert registry.lookup(str(other)) is None
+    # Contracts are looked up on the node once.
+    assert len(_requests(casper_servicer, "GetBlockState")) == 2
+    registry.close()
+
+    with ContractRegistry(path) as registry:
+        assert registry.contracts() == {
+            registry.wasm_hash(str(stored)).hex(): contract_hash.hex()
+        }
+
+
+BATCH = """
+# Comments and blank lines are skipped.
+
+propose
+show-block 'unterminated
+show-blocks --depth 1 --output ndjson
+no-such-command
+"""
+
+
+def test_batch(mock_node, monkeypatch, capsys):
+    port, internal_port = mock_node
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "casperlabs_client",
+            "--port",
+            str(port),
+            "--internal-port",
+            str(internal_port),
+        ]
+        + ["batch"],
+    )
+    monkeypatch.setattr(sys, "stdin", io.StringIO(BATCH))
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 1
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == f"Success! Block hash: {mock_server.HASH}"
+    assert out[1:3] == ["--- 4 0", "--- 5 2"]
+    assert json.loads(out[3])["summary"]["block_hash"]
+    assert out[4:] == ["--- 6 0", "--- 7 2"]
+
+
+def test_show_blocks_parallel(client, casper_servicer, monkeypatch):
+    def ranks(blocks):
+        return [b.summary.header.rank for b in blocks]
+
+    # The client has 2 channels, fetches with more windows in flight open more.
+    pools = []
+    resized = ChannelPool.resized
+    monkeypatch.setattr(
+        ChannelPool, "resized", lambda *args: pools.append(resized(*args)) or pools[-1]
+    )
+    assert ranks(client.showBlocks(depth=5, parallelism=2)) == [20, 19, 18, 17, 16]
+    assert pools == []
+    assert len(list(client.showBlocks(depth=5, parallelism=3))) == 5
+    assert [len(p.channels) for p in pools] == [3]
+    with pytest.raises(ValueError):
+        # Channels of the pool have been closed.
+        pools[0].channels[0].unary_unary("/x")(b"")
+
+    # Deeper than the DAG, windows of a few ranks down to the genesis.
+    expected = list(client.showBlocks(depth=30))
+    assert ranks(expected) == list(range(mock_server.TIP_RANK, -1, -1))
+    for window in (None, 1, 4, 100):
+        blocks = list(client.showBlocks(depth=30, parallelism=3, window=window))
+        assert blocks == expected
+
+    # Windows failing after some blocks are resumed from the lowest rank received.
+    del casper_servicer.requests[:]
+    casper_servicer.stream_breaks = [2, None, 1]
+    blocks = list(client.showBlocks(depth=12, max_rank=20, parallelism=2, window=4))
+    assert ranks(blocks) == list(range(20, 8, -1))
+    requests = _requests(casper_servicer, "StreamBlockInfos")
+    assert len(requests) == 5
+    assert {r.max_rank for r in requests} - {20, 16, 12}
+
+    casper_servicer.stream_breaks = [1] * 10
+    with pytest.raises(grpc.RpcError):
+        list(client.showBlocks(depth=4, max_rank=20, parallelism=2, window=4))
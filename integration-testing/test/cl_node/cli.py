@@ -1,10 +1,13 @@
 import os
 import logging
+import shlex
 import subprocess
 from operator import add
 from functools import reduce
 from test.cl_node.client_parser import parse_show_blocks, parse_show_deploys, parse
 
+BATCH_DELIMITER = "---batch---"
+
 
 class CLIErrorExit(Exception):
     def __init__(self, cp, output):
@@ -93,6 +96,47 @@ class CLI:
 
         return self.parse_output(args[0], binary_output)
 
+    def batch(self, *commands):
+        """
+        Run many commands in one process over one connection, with the batch command.
+
+        :param commands:  Tuples with args of each command, like those of __call__.
+        :return:          List of parsed outputs of the commands.
+        """
+        lines = []
+        for args in commands:
+            string_args = [str(a) for a in args]
+            if args[0] == "deploy":
+                string_args += self.default_deploy_args
+            lines.append(" ".join(shlex.quote(a) for a in string_args))
+        command_line = (
+            [str(self.cli_cmd)]
+            + self.expand_args(["batch", f"--delimiter={BATCH_DELIMITER}"])
+            + ["--stop-on-error"]
+        )
+        logging.info(f"EXECUTING: {' '.join(command_line)} <<< {lines}")
+        cp = subprocess.run(
+            command_line,
+            input="\n".join(lines).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        outputs = [[]]
+        for line in cp.stdout.decode("utf-8").splitlines(keepends=True):
+            if line.startswith(BATCH_DELIMITER + " "):
+                _, rc = line.split()[1:]
+                if rc != "0":
+                    raise CLIErrorExit(cp, "".join(outputs[-1]))
+                outputs.append([])
+            else:
+                outputs[-1].append(line)
+        if cp.returncode != 0:
+            raise CLIErrorExit(cp, cp.stdout.decode("utf-8"))
+        return [
+            self.parse_output(args[0], "".join(output).encode("utf-8"))
+            for args, output in zip(commands, outputs)
+        ]
+
     def public_key_path(self, account):
         return account.public_key_path
 
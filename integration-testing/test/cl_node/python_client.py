@@ -1,10 +1,9 @@
 from typing import Optional
 import os
 import logging
-import time
 
 from test.cl_node import LoggingMixin
-from casperlabs_client import CasperLabsClient, ABI, InternalError, extract_common_name
+from casperlabs_client import CasperLabsClient, ABI, extract_common_name
 
 
 class PythonClient(CasperLabsClient, LoggingMixin):
@@ -105,15 +104,10 @@ class PythonClient(CasperLabsClient, LoggingMixin):
         return self.client.showDeploy(deploy_hash)
 
     def propose_with_retry(self, max_attempts: int, retry_seconds: int) -> str:
-        attempt = 0
-        while True:
-            try:
-                return self.propose()
-            except InternalError as ex:
-                if attempt < max_attempts:
-                    self.logger.debug("Could not propose; retrying later.")
-                    attempt += 1
-                    time.sleep(retry_seconds)
-                else:
-                    self.logger.debug("Could not propose; no more retries!")
-                    raise ex
+        logging.info(f"PY_CLIENT.propose_with_retry() for {self.client.host}")
+        return self.client.propose_with_retry(
+            attempts=max_attempts + 1,
+            backoff=retry_seconds,
+            max_backoff=retry_seconds,
+            jitter=0,
+        )